@@ -4,80 +4,2104 @@ import json
 import wave
 import whisper
 import subprocess
-from pydub import AudioSegment
-from fastapi import FastAPI, UploadFile, File
-from fastapi.responses import JSONResponse
+import numpy as np
+import aiofiles
+import tqdm
+import importlib
+import functools
+from fastapi import FastAPI, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from multipart.multipart import MultipartParser, parse_options_header
 from pathlib import Path
-import shutil
+from urllib.parse import quote
 from datetime import datetime
 import time
 import threading
+import uuid
+import math
+import asyncio
+import hashlib
+import socket
+import re
+import sqlite3
+import bisect
+import struct
+import zipfile
+import shutil
+import fcntl
+import io
+import cProfile
+import pstats
+import tracemalloc
+import multiprocessing
+from collections import deque, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import asynccontextmanager, contextmanager
+
+# Configuração
+# Use /tmp/uploads em ambiente de teste, /app/uploads em produção
+if "pytest" in sys.modules or os.getenv("TESTING") == "1":
+    UPLOAD_DIR = "/tmp/uploads"
+else:
+    UPLOAD_DIR = "/app/uploads"
+    
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+# Modo de execução da decodificação:
+# - thread: um único modelo no processo da API, chamadas serializadas
+# - process: WORKER_PROCESSES processos, cada um com seu próprio modelo e
+#   TORCH_THREADS_PER_WORKER threads do torch (padrão: o orçamento de CPU dividido
+#   entre os processos)
+# - queue: a API apenas enfileira os jobs no banco de jobs (JOB_STORE=sqlite) e
+#   processos worker.py, possivelmente em outros containers, fazem a transcrição
+EXECUTION_MODE = os.getenv("EXECUTION_MODE", "thread")
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", str(os.cpu_count() or 1)))
+TORCH_THREADS_PER_WORKER = int(os.getenv("TORCH_THREADS_PER_WORKER", "0"))
+
+# Orçamento de CPU: CPU_BUDGET núcleos (padrão: todos os permitidos ao processo) divididos
+# entre as tarefas de CPU ativas (decodificação FFmpeg e chamadas do Whisper), com a divisão
+# refeita quando tarefas começam ou terminam. CPU_AFFINITY=1 prende cada tarefa aos seus núcleos
+CPU_BUDGET = int(os.getenv("CPU_BUDGET", "0"))
+CPU_AFFINITY = os.getenv("CPU_AFFINITY", "0") == "1"
+# No modo process, API_CPU_RESERVE núcleos do orçamento ficam com o processo da API (FFmpeg)
+# e o restante é dividido entre os processos worker (Whisper)
+API_CPU_RESERVE = int(os.getenv("API_CPU_RESERVE", "1"))
+
+# Registro de jobs: um registro por upload, para permitir transcrições simultâneas
+# Jobs finalizados (completed/error) são removidos após JOB_TTL_SECONDS.
+# Lotes (/transcribe/batch): um job por arquivo, agrupados sob um ID de lote.
+# JOB_STORE=memory mantém tudo no processo; JOB_STORE=sqlite usa um banco em modo WAL
+# compartilhado por todos os processos (uvicorn --workers N) e que sobrevive a reinícios:
+# jobs interrompidos são reenfileirados quando o lease do processo dono vence
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "3600"))
+FINISHED_STATUSES = {'completed', 'error'}
+JOB_STORE = os.getenv("JOB_STORE", "sqlite" if EXECUTION_MODE == 'queue' else "memory")
+if EXECUTION_MODE == 'queue' and JOB_STORE != 'sqlite':
+    raise Exception("EXECUTION_MODE=queue requer JOB_STORE=sqlite (a fila fica no banco de jobs)")
+JOB_DB_PATH = os.getenv("JOB_DB", os.path.join(UPLOAD_DIR, "jobs.db"))
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "60"))
+INSTANCE_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Fila de processamento: número fixo de workers consumindo uma fila FIFO limitada
+# (no modo queue, TRANSCRIBE_WORKERS é o número de jobs simultâneos de cada worker.py)
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "2"))
+TRANSCRIBE_QUEUE_SIZE = int(os.getenv("TRANSCRIBE_QUEUE_SIZE", "20"))
+DEFAULT_RETRY_AFTER_SECONDS = 30
+QUEUE_POLL_SECONDS = float(os.getenv("QUEUE_POLL_SECONDS", "1"))
+
+# Stream de eventos (SSE) por job: intervalo de verificação de mudanças e keepalive
+SSE_CHECK_INTERVAL_SECONDS = 0.25
+SSE_KEEPALIVE_SECONDS = 15
+
+# Modelos Whisper: carregados sob demanda e mantidos em um LRU limitado por
+# MODEL_MEMORY_BUDGET_MB (no modo process, o orçamento vale para cada worker)
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "base")
+AVAILABLE_MODELS = [name.strip() for name in os.getenv("WHISPER_MODELS", "tiny,base,small").split(",") if name.strip()]
+if WHISPER_MODEL_NAME not in AVAILABLE_MODELS:
+    AVAILABLE_MODELS.append(WHISPER_MODEL_NAME)
+MODEL_MEMORY_BUDGET_MB = int(os.getenv("MODEL_MEMORY_BUDGET_MB", "2048"))
+MODEL_PRELOAD = os.getenv("MODEL_PRELOAD", "1") == "1"
+
+# Precisão das camadas lineares na CPU: fp32 ou int8 (quantização dinâmica,
+# pesos em int8 e ativações quantizadas a cada chamada)
+COMPUTE_TYPES = ('fp32', 'int8')
+WHISPER_COMPUTE = os.getenv("WHISPER_COMPUTE", "fp32")
+
+# Formato de entrada do Whisper: PCM float32, 16 kHz, mono
+SAMPLE_RATE = 16000
+FFMPEG_TIMEOUT_SECONDS = 600
+
+# Transcrição em blocos: áudios longos são divididos em silêncios, em blocos de
+# até CHUNK_MAX_SECONDS, decodificados em paralelo no pool de processos e unidos.
+# Nos outros modos os blocos seriam decodificados em sequência no mesmo modelo
+# (só o custo dos cortes, sem ganho de latência): por padrão, ligado apenas no modo process
+CHUNKED_TRANSCRIPTION = os.getenv(
+    "CHUNKED_TRANSCRIPTION", "1" if EXECUTION_MODE == 'process' else "0"
+) == "1"
+CHUNK_MIN_AUDIO_SECONDS = float(os.getenv("CHUNK_MIN_AUDIO_SECONDS", "600"))
+CHUNK_MAX_SECONDS = float(os.getenv("CHUNK_MAX_SECONDS", "300"))
+CHUNK_OVERLAP_SECONDS = 1.0
+SILENCE_DB = -40.0
+
+# Opções de decodificação (fazem parte da chave do cache de transcrições)
+DECODE_OPTIONS = {'language': 'pt', 'fp16': False}
+
+# Pré-filtro de atividade de voz (VAD por energia): trechos sem fala mais longos
+# que VAD_MIN_SILENCE_SECONDS são removidos antes do Whisper. O limiar acompanha o
+# piso de ruído da gravação (+VAD_MARGIN_DB), entre SILENCE_DB e VAD_MAX_THRESHOLD_DB
+VAD_ENABLED = os.getenv("VAD_ENABLED", "0") == "1"
+VAD_FRAME_SECONDS = 0.03
+VAD_MIN_SILENCE_SECONDS = float(os.getenv("VAD_MIN_SILENCE_SECONDS", "1.5"))
+VAD_PADDING_SECONDS = 0.3
+VAD_MARGIN_DB = 10.0
+VAD_MAX_THRESHOLD_DB = -30.0
+
+# Cache de transcrições endereçado por conteúdo (SHA-256 do upload + modelo + opções)
+CACHE_DIR = os.path.join(UPLOAD_DIR, "cache")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# Transcrições (texto, segmentos e metadados) em SQLite com índice FTS5 para /search
+TRANSCRIPT_DB_PATH = os.getenv("TRANSCRIPT_DB", os.path.join(UPLOAD_DIR, "transcricoes.db"))
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+SEARCH_SEGMENTS_PER_HIT = 3
+
+# Recebimento de uploads: streaming direto para o disco, com limite de tamanho
+# (igual ao client_max_body_size do nginx)
+ALLOWED_EXTENSIONS = {'.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma', '.aac'}
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+MAX_FORM_FIELD_BYTES = 64 * 1024
+
+# Uploads retomáveis (/uploads): o arquivo chega em blocos de UPLOAD_CHUNK_BYTES, em
+# qualquer ordem e em paralelo, gravados direto na posição final do arquivo em disco
+UPLOAD_SESSION_DIR = os.path.join(UPLOAD_DIR, "sessions")
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+UPLOAD_WRITE_BYTES = 1024 * 1024  # dados acumulados por os.pwrite
+
+# Perfis de jobs (?profile=true ou cabeçalho X-Profile): cProfile + tracemalloc
+PROFILE_DIR = os.path.join(UPLOAD_DIR, "profiles")
+PROFILE_TOP_ENTRIES = 15
+FLAG_TRUE_VALUES = {'1', 'true', 'yes'}
+
+# Transcrição em lote: clipes de até 30s (uma janela do Whisper) são
+# decodificados juntos, BATCH_DECODE_SIZE por vez; os demais seguem o caminho normal
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "200"))
+BATCH_DECODE_SIZE = int(os.getenv("BATCH_DECODE_SIZE", "16"))
+BATCH_CLIP_MAX_SECONDS = whisper.audio.CHUNK_LENGTH
+ZIP_READ_CHUNK_BYTES = 1024 * 1024
+
+# Transcrição em tempo real (/ws/stream): PCM s16le mono 16 kHz; a janela em
+# decodificação tem no máximo STREAM_WINDOW_SECONDS e é decodificada de novo a
+# cada STREAM_STEP_SECONDS de áudio recebido
+STREAM_WINDOW_SECONDS = whisper.audio.CHUNK_LENGTH
+STREAM_STEP_SECONDS = float(os.getenv("STREAM_STEP_SECONDS", "3"))
+STREAM_MAX_SESSIONS = int(os.getenv("STREAM_MAX_SESSIONS", "2"))
+
+# Mesmos critérios do transcribe do Whisper para refazer uma decodificação
+# (com fallback de temperatura) ou considerar a janela sem fala
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+@asynccontextmanager
+async def lifespan(app):
+    """Inicia os workers (modo process) ou carrega o modelo padrão em segundo plano
+    
+    Com JOB_STORE=sqlite, inicia também a renovação dos leases dos jobs, que
+    reenfileira os jobs interrompidos por um reinício. No modo queue a API não
+    transcreve: os jobs são processados (e retomados) pelos processos worker.py.
+    A migração dos arquivos de transcrição antigos para o banco roda aqui, uma vez
+    (com API_WORKERS > 1, os demais processos esperam a trava e não encontram arquivos)
+    """
+    await run_in_threadpool(transcript_store.import_legacy_files, UPLOAD_DIR)
+    lease_stop = threading.Event()
+    if JOB_STORE == 'sqlite' and EXECUTION_MODE != 'queue':
+        threading.Thread(
+            target=_job_lease_loop, args=(lease_stop,), name="job-leases", daemon=True
+        ).start()
+    if EXECUTION_MODE == 'process':
+        get_process_pool()
+    elif MODEL_PRELOAD and EXECUTION_MODE != 'queue':
+        # Não bloqueia o startup: /health informa quando o modelo estiver pronto
+        threading.Thread(
+            target=model_registry.preload, args=(WHISPER_MODEL_NAME,),
+            name="model-preload", daemon=True
+        ).start()
+    yield
+    lease_stop.set()
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+
+# Criar app FastAPI
+app = FastAPI(title="Audio Transcription API", lifespan=lifespan)
+
+# CORS middleware para aceitar requisições do frontend
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+def load_whisper_model(name):
+    """Carrega um modelo Whisper do disco (levanta exceção em caso de falha)"""
+    print(f"Carregando modelo Whisper '{name}' (offline)...")
+    started = time.time()
+    model = whisper.load_model(name)
+    print(f"✓ Whisper pronto para usar! (modelo: {name}, {time.time() - started:.1f}s)")
+    return model
+
+def quantize_model_int8(model):
+    """Aplica quantização dinâmica int8 às camadas lineares do modelo (in-place)"""
+    import torch
+    for module in model.modules():
+        # whisper.model.Linear apenas converte o dtype dos pesos no forward; o
+        # quantize_dynamic só reconhece o tipo exato nn.Linear
+        if isinstance(module, torch.nn.Linear) and type(module) is not torch.nn.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+def _model_key(name, compute=None, instance=None):
+    """Chave de um modelo no registro (modelo + precisão, e a cópia quando não é a principal)"""
+    compute = compute or WHISPER_COMPUTE
+    key = name if compute == 'fp32' else f"{name}:{compute}"
+    return f"{key}@{instance}" if instance else key
+
+def _model_nbytes(model):
+    """Memória ocupada pelos pesos e buffers de um modelo"""
+    try:
+        tensors = list(model.parameters()) + list(model.buffers())
+        nbytes = sum(t.numel() * t.element_size() for t in tensors)
+        # Pesos int8 das camadas quantizadas não aparecem em parameters()
+        for module in model.modules():
+            packed = getattr(module, '_packed_params', None)
+            if packed is not None and hasattr(packed, '_weight_bias'):
+                weight, bias = packed._weight_bias()
+                nbytes += weight.numel() * weight.element_size()
+                nbytes += bias.numel() * bias.element_size() if bias is not None else 0
+        return nbytes
+    except Exception:
+        return 0
+
+class ModelRegistry:
+    """Modelos Whisper carregados sob demanda, em um LRU limitado por memória
+    
+    Cada modelo tem sua própria trava: o Whisper instala hooks de kv-cache nos
+    módulos a cada chamada, então duas transcrições simultâneas no mesmo objeto
+    interferem entre si. Modelos diferentes podem decodificar em paralelo.
+    Modelos em uso nunca são descarregados; o orçamento pode ser excedido
+    temporariamente até que sejam liberados. A versão int8 de um modelo é uma
+    entrada própria, quantizada uma única vez ao ser carregada.
+    
+    Com instance, o modelo é uma cópia separada (trava própria) dentro do mesmo
+    orçamento: o /ws/stream usa a cópia 'stream' para não esperar atrás da
+    decodificação de um arquivo inteiro na cópia principal.
+    """
+    
+    def __init__(self, available, budget_bytes, loader=None):
+        self.available = list(available)
+        self.budget_bytes = budget_bytes
+        self._loader = loader or load_whisper_model
+        self._lock = threading.Lock()
+        self._models = OrderedDict()    # nome -> {model, lock, bytes, in_use}
+        self._loading = {}              # nome -> {event, error}
+        self._errors = {}               # nome -> última falha de carregamento
+    
+    @contextmanager
+    def use(self, name, compute=None, instance=None):
+        """Empresta o modelo (carregando-o se preciso) com acesso exclusivo"""
+        entry = self._acquire(name, compute or WHISPER_COMPUTE, instance)
+        try:
+            with entry['lock']:
+                yield entry['model']
+        finally:
+            with self._lock:
+                entry['in_use'] -= 1
+                self._evict_locked()
+    
+    def preload(self, name, compute=None):
+        """Carrega um modelo antecipadamente (falhas apenas registradas)"""
+        try:
+            with self.use(name, compute):
+                pass
+        except Exception as e:
+            print(f"⚠ Aviso ao carregar Whisper: {e}")
+    
+    def _acquire(self, name, compute, instance=None):
+        if name not in self.available:
+            raise Exception(f"Modelo desconhecido: {name}. Use: {', '.join(self.available)}")
+        if compute not in COMPUTE_TYPES:
+            raise Exception(f"Precisão desconhecida: {compute}. Use: {', '.join(COMPUTE_TYPES)}")
+        key = _model_key(name, compute, instance)
+        while True:
+            with self._lock:
+                entry = self._models.get(key)
+                if entry is not None:
+                    self._models.move_to_end(key)
+                    entry['in_use'] += 1
+                    return entry
+                loading = self._loading.get(key)
+                owner = loading is None
+                if owner:
+                    loading = self._loading[key] = {'event': threading.Event(), 'error': None}
+            
+            if not owner:
+                # Outra thread já está carregando este modelo
+                loading['event'].wait()
+                if loading['error']:
+                    raise Exception(loading['error'])
+                continue
+            
+            try:
+                model = self._loader(name)
+                if compute == 'int8':
+                    model = quantize_model_int8(model)
+                    print(f"✓ Modelo '{name}' quantizado para int8")
+            except Exception as e:
+                loading['error'] = f"Falha ao carregar o modelo Whisper '{key}': {e}"
+                with self._lock:
+                    self._errors[key] = str(e)
+                    del self._loading[key]
+                loading['event'].set()
+                raise Exception(loading['error'])
+            
+            entry = {'model': model, 'lock': threading.Lock(), 'bytes': _model_nbytes(model), 'in_use': 1}
+            with self._lock:
+                self._models[key] = entry
+                self._errors.pop(key, None)
+                del self._loading[key]
+                self._evict_locked()
+            loading['event'].set()
+            return entry
+    
+    def _evict_locked(self):
+        """Descarrega os modelos ociosos menos usados até caber no orçamento"""
+        total = sum(entry['bytes'] for entry in self._models.values())
+        newest = next(reversed(self._models), None)
+        for name in list(self._models):
+            if total <= self.budget_bytes:
+                break
+            entry = self._models[name]
+            if entry['in_use'] or name == newest:
+                continue
+            del self._models[name]
+            total -= entry['bytes']
+            print(f"✓ Modelo '{name}' descarregado ({entry['bytes']/1024/1024:.0f} MB)")
+    
+    def state(self, name, compute=None):
+        """Estado de um modelo: ready, loading, error ou unloaded"""
+        key = _model_key(name, compute)
+        with self._lock:
+            if key in self._models:
+                return 'ready'
+            if key in self._loading:
+                return 'loading'
+            if key in self._errors:
+                return 'error'
+            return 'unloaded'
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "available": list(self.available),
+                "budget_mb": round(self.budget_bytes / 1024 / 1024),
+                "loaded": [
+                    {"name": name, "size_mb": round(entry['bytes'] / 1024 / 1024), "in_use": entry['in_use']}
+                    for name, entry in self._models.items()
+                ],
+                "loading": list(self._loading),
+                "errors": dict(self._errors)
+            }
+
+model_registry = ModelRegistry(AVAILABLE_MODELS, MODEL_MEMORY_BUDGET_MB * 1024 * 1024)
+
+class CpuBudget:
+    """Divide um conjunto de núcleos entre as tarefas de CPU ativas no processo
+    
+    Cada tarefa (lease) recebe uma parcela ao começar e a divisão é refeita
+    sempre que uma tarefa começa ou termina; a tarefa a aplica (refresh) no início
+    e a cada janela de 30s do Whisper. O FFmpeg recebe a parcela em -threads.
+    Para o Whisper, torch.set_num_threads é na prática global ao processo (o último
+    a chamar define o valor para todos): com várias tarefas simultâneas no mesmo
+    processo o número de threads é só aproximado, e o valor anterior é restaurado
+    quando a tarefa termina. Com manage_threads=False (ex.: benchmarks que fixam
+    as threads), o número de threads do torch não é alterado. Com affinity, as
+    parcelas são conjuntos disjuntos de núcleos (enquanto houver núcleos para
+    todas) aplicados com os.sched_setaffinity na thread da tarefa, herdados pelo
+    FFmpeg e pelas threads do torch que ela criar: é o que separa de fato as tarefas.
+    """
+    
+    def __init__(self, cpus, affinity=False, manage_threads=True):
+        self.cpus = list(cpus)
+        self.affinity = affinity and hasattr(os, 'sched_setaffinity')
+        self.manage_threads = manage_threads
+        self._lock = threading.Lock()
+        self._leases = OrderedDict()    # id -> {name, kind, threads, cpus, started_at}
+        self._local = threading.local()
+    
+    @contextmanager
+    def lease(self, kind, name=None):
+        """Reserva uma parcela do orçamento para a thread atual (reentrante)"""
+        current = getattr(self._local, 'lease', None)
+        if current is not None:
+            yield current
+            return
+        
+        lease_id = uuid.uuid4().hex
+        lease = {
+            'name': name or threading.current_thread().name, 'kind': kind,
+            'threads': 1, 'cpus': [], 'started_at': time.time()
+        }
+        with self._lock:
+            self._leases[lease_id] = lease
+            self._rebalance_locked()
+        self._local.lease = lease
+        self._local.applied = None
+        self._local.previous_threads = None
+        try:
+            self.refresh()
+            yield lease
+        finally:
+            self._local.lease = None
+            with self._lock:
+                del self._leases[lease_id]
+                self._rebalance_locked()
+            if self._local.previous_threads is not None:
+                import torch
+                torch.set_num_threads(self._local.previous_threads)
+            if self.affinity and self._local.applied:
+                self._set_affinity(self.cpus)
+    
+    def _rebalance_locked(self):
+        """Parcelas contíguas de núcleos, da tarefa mais antiga para a mais nova"""
+        if not self._leases:
+            return
+        share, extra = divmod(len(self.cpus), len(self._leases))
+        start = 0
+        for index, lease in enumerate(self._leases.values()):
+            count = max(1, share + (1 if index < extra else 0))
+            lease['threads'] = count
+            lease['cpus'] = [self.cpus[(start + i) % len(self.cpus)] for i in range(count)]
+            start += count
+    
+    def refresh(self):
+        """Aplica na thread atual a parcela vigente da sua tarefa (threads do torch e afinidade)"""
+        lease = getattr(self._local, 'lease', None)
+        if lease is None:
+            return
+        with self._lock:
+            allocation = (lease['threads'], tuple(lease['cpus']))
+        if self._local.applied == allocation:
+            return
+        self._local.applied = allocation
+        if lease['kind'] == 'whisper' and self.manage_threads:
+            import torch
+            if self._local.previous_threads is None:
+                self._local.previous_threads = torch.get_num_threads()
+            torch.set_num_threads(allocation[0])
+        if self.affinity:
+            self._set_affinity(allocation[1])
+    
+    def _set_affinity(self, cpus):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            print(f"⚠ Não foi possível definir a afinidade de CPU: {e}")
+    
+    def stats(self):
+        with self._lock:
+            return {
+                "cpus": len(self.cpus),
+                "affinity": self.affinity,
+                "tasks": [
+                    {
+                        "name": lease['name'],
+                        "kind": lease['kind'],
+                        "threads": lease['threads'],
+                        "cpus": lease['cpus'] if self.affinity else None,
+                        "running_seconds": round(time.time() - lease['started_at'], 1)
+                    }
+                    for lease in self._leases.values()
+                ]
+            }
+
+def budget_cpus():
+    """Núcleos do orçamento: os primeiros CPU_BUDGET núcleos permitidos ao processo"""
+    try:
+        cpus = sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = list(range(os.cpu_count() or 1))
+    return cpus[:CPU_BUDGET] if CPU_BUDGET > 0 else cpus
+
+def split_process_budget(cpus):
+    """Modo process: (núcleos do processo da API, núcleos dos processos worker)
+    
+    Sem núcleos para separar os dois, ambos usam o orçamento inteiro
+    """
+    if API_CPU_RESERVE <= 0 or len(cpus) <= API_CPU_RESERVE:
+        return cpus, cpus
+    return cpus[:API_CPU_RESERVE], cpus[API_CPU_RESERVE:]
+
+if EXECUTION_MODE == 'process':
+    _api_cpus, WORKER_CPUS = split_process_budget(budget_cpus())
+else:
+    _api_cpus = WORKER_CPUS = budget_cpus()
+cpu_budget = CpuBudget(_api_cpus, CPU_AFFINITY)
+
+# Pool de processos de decodificação (apenas EXECUTION_MODE=process)
+_process_pool = None
+_process_pool_lock = threading.Lock()
+
+# Progresso real da decodificação: o laço de janelas do Whisper avança uma barra
+# tqdm a cada janela de 30s; a barra abaixo repassa esse avanço (em segundos de
+# áudio) ao callback registrado na thread atual. Os segmentos novos vêm da saída
+# verbose do Whisper (uma linha por segmento, ver _whisper_print)
+_progress_local = threading.local()
+_progress_queue = None          # processos worker -> processo da API
+_progress_callbacks = {}        # id da tarefa no pool -> (progresso, segmentos) (processo da API)
+_progress_callbacks_lock = threading.Lock()
+_worker_progress_queue = None   # dentro de cada processo worker
+
+class _DecodeProgressBar(tqdm.tqdm):
+    """Barra de progresso do Whisper que reporta os segundos decodificados"""
+    
+    def update(self, n=1):
+        # Entre janelas: adotar a parcela de CPU atual (tarefas podem ter começado ou terminado)
+        cpu_budget.refresh()
+        callback = getattr(_progress_local, 'callback', None)
+        if callback is not None and n:
+            callback(n / whisper.audio.FRAMES_PER_SECOND)
+        return super().update(n)
+
+# Linha da saída verbose do Whisper: "[MM:SS.mmm --> MM:SS.mmm] texto" (horas quando houver)
+_VERBOSE_SEGMENT = re.compile(r'\[((?:\d+:)?\d+:\d+\.\d+) --> ((?:\d+:)?\d+:\d+\.\d+)\] (.*)', re.DOTALL)
+
+def _parse_timestamp(value):
+    seconds = 0.0
+    for part in value.split(':'):
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+def _whisper_print(*args, **kwargs):
+    """print do módulo whisper.transcribe: com verbose=True, cada segmento decodificado
+    é impresso ao fim da sua janela; na thread com on_segments, a linha vira um segmento publicado
+    """
+    on_segments = getattr(_progress_local, 'on_segments', None)
+    match = _VERBOSE_SEGMENT.fullmatch(' '.join(str(arg) for arg in args)) if on_segments else None
+    if match is None:
+        return print(*args, **kwargs)
+    start, end = _parse_timestamp(match.group(1)), _parse_timestamp(match.group(2))
+    text = match.group(3)
+    # Mesma regra do transcribe: segmentos instantâneos ou sem texto ficam vazios no resultado
+    if start == end or not text.strip():
+        text = ''
+    on_segments([{'start': start, 'end': end, 'text': text}])
+
+# whisper/__init__ exporta a função transcribe com o mesmo nome do módulo
+_whisper_transcribe_module = importlib.import_module('whisper.transcribe')
+_whisper_transcribe_module.tqdm = type('tqdm', (), {'tqdm': _DecodeProgressBar})
+_whisper_transcribe_module.print = _whisper_print
+
+def _run_whisper(model, audio, on_progress=None, on_segments=None):
+    """Executa a transcrição com as opções padrão da aplicação
+    
+    on_segments recebe os segmentos de cada janela de 30s assim que ela é decodificada
+    (a partir da saída verbose do Whisper, que nesse caso não vai para o stdout)
+    """
+    _progress_local.callback = on_progress
+    _progress_local.on_segments = on_segments
+    try:
+        with cpu_budget.lease('whisper'):
+            return model.transcribe(audio, verbose=on_segments is not None, **DECODE_OPTIONS)
+    finally:
+        _progress_local.callback = None
+        _progress_local.on_segments = None
+
+def decode_clip_batch(model, audios):
+    """Decodifica clipes de até 30s em lote (encoder e decoder sobre o batch inteiro)
+    
+    A decodificação em lote é gulosa, sem fallback de temperatura: clipes que
+    falham nos critérios do transcribe do Whisper são refeitos individualmente.
+    """
+    import torch
+    texts = []
+    retried = 0
+    with cpu_budget.lease('whisper'):
+        mel = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), n_mels=model.dims.n_mels)
+            for audio in audios
+        ]).to(model.device)
+        options = whisper.DecodingOptions(
+            language=DECODE_OPTIONS['language'], fp16=DECODE_OPTIONS['fp16'], without_timestamps=True
+        )
+        results = whisper.decode(model, mel, options)
+        
+        for audio, result in zip(audios, results):
+            if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                texts.append('')
+            elif result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD:
+                retried += 1
+                texts.append(_run_whisper(model, audio).get('text', '').strip())
+            else:
+                texts.append(result.text.strip())
+    print(f"✓ Lote de {len(audios)} clipe(s) decodificado ({retried} refeito(s) individualmente)")
+    return texts
+
+def _worker_cpu_slice(cpus, index, num_threads):
+    """Núcleos do processo worker `index`: parcelas contíguas de num_threads núcleos"""
+    start = (index % WORKER_PROCESSES) * num_threads
+    return [cpus[(start + i) % len(cpus)] for i in range(num_threads)]
+
+def _init_worker_process(model_name, num_threads, progress_queue=None, compute=None, cpus=None, worker_counter=None):
+    """Inicializador de cada processo worker: limita threads e carrega o modelo padrão
+    
+    O orçamento de CPU do processo worker é a sua parcela de WORKER_CPUS (os núcleos
+    do orçamento que não ficaram reservados ao FFmpeg do processo da API)
+    """
+    global WHISPER_MODEL_NAME, WHISPER_COMPUTE, _worker_progress_queue, cpu_budget
+    _worker_progress_queue = progress_queue
+    if cpus and worker_counter is not None:
+        with worker_counter.get_lock():
+            index = worker_counter.value
+            worker_counter.value += 1
+        cpu_budget = CpuBudget(_worker_cpu_slice(cpus, index, num_threads), CPU_AFFINITY)
+        if cpu_budget.affinity:
+            # Antes de o torch criar suas threads, que herdam a afinidade
+            cpu_budget._set_affinity(cpu_budget.cpus)
+    import torch
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+    WHISPER_MODEL_NAME = model_name
+    WHISPER_COMPUTE = compute or WHISPER_COMPUTE
+    model_registry.preload(model_name)
+    print(f"✓ Worker {os.getpid()} pronto ({num_threads} thread(s) torch)")
+
+def _transcribe_in_worker(audio, task_id=None, model_name=None, compute=None):
+    """Executada dentro de um processo worker do pool (registro de modelos próprio)"""
+    on_progress = None
+    on_segments = None
+    if task_id and _worker_progress_queue is not None:
+        on_progress = lambda seconds: _worker_progress_queue.put((task_id, seconds, None))
+        on_segments = lambda segments: _worker_progress_queue.put((task_id, None, segments))
+    with model_registry.use(model_name or WHISPER_MODEL_NAME, compute) as model:
+        return _run_whisper(model, audio, on_progress, on_segments)
+
+def _decode_batch_in_worker(audios, model_name=None, compute=None):
+    """Decodificação em lote executada dentro de um processo worker"""
+    with model_registry.use(model_name or WHISPER_MODEL_NAME, compute) as model:
+        return decode_clip_batch(model, audios)
+
+def _drain_progress_queue(progress_queue):
+    """Repassa o progresso e os segmentos enviados pelos workers aos callbacks dos jobs"""
+    while True:
+        task_id, seconds, segments = progress_queue.get()
+        with _progress_callbacks_lock:
+            on_progress, on_segments = _progress_callbacks.get(task_id, (None, None))
+        if seconds is not None and on_progress is not None:
+            on_progress(seconds)
+        if segments is not None and on_segments is not None:
+            on_segments(segments)
+
+def get_process_pool():
+    """Retorna o pool de processos, criando-o na primeira chamada"""
+    global _process_pool, _progress_queue
+    with _process_pool_lock:
+        if _process_pool is None:
+            print(f"Iniciando pool de {WORKER_PROCESSES} processo(s) worker...")
+            context = multiprocessing.get_context('spawn')
+            if _progress_queue is None:
+                _progress_queue = context.Queue()
+                threading.Thread(
+                    target=_drain_progress_queue, args=(_progress_queue,),
+                    name="progress-drain", daemon=True
+                ).start()
+            # Sem TORCH_THREADS_PER_WORKER, os núcleos dos workers são divididos entre os processos
+            num_threads = TORCH_THREADS_PER_WORKER or max(1, len(WORKER_CPUS) // WORKER_PROCESSES)
+            _process_pool = ProcessPoolExecutor(
+                max_workers=WORKER_PROCESSES,
+                mp_context=context,
+                initializer=_init_worker_process,
+                initargs=(
+                    WHISPER_MODEL_NAME, num_threads, _progress_queue, WHISPER_COMPUTE,
+                    WORKER_CPUS, context.Value('i', 0)
+                )
+            )
+        return _process_pool
+
+def _map_in_process_pool(audios, on_progress=None, model_name=None, compute=None, publisher=None):
+    """Transcreve vários áudios em paralelo no pool; recria o pool se um worker morrer
+    
+    Com publisher (SegmentPublisher), os segmentos do áudio i são publicados como bloco i
+    """
+    global _process_pool
+    task_ids = [uuid.uuid4().hex for _ in audios]
+    if on_progress is not None or publisher is not None:
+        with _progress_callbacks_lock:
+            for index, task_id in enumerate(task_ids):
+                on_segments = functools.partial(publisher.add, index) if publisher else None
+                _progress_callbacks[task_id] = (on_progress, on_segments)
+    try:
+        pool = get_process_pool()
+        futures = [
+            pool.submit(_transcribe_in_worker, audio, task_id, model_name, compute)
+            for audio, task_id in zip(audios, task_ids)
+        ]
+        results = []
+        for index, future in enumerate(futures):
+            results.append(future.result())
+            if publisher:
+                publisher.complete(index, results[-1])
+        return results
+    except BrokenProcessPool:
+        with _process_pool_lock:
+            _process_pool = None
+        raise Exception("Processo worker encerrado inesperadamente (pool será recriado)")
+    finally:
+        with _progress_callbacks_lock:
+            for task_id in task_ids:
+                _progress_callbacks.pop(task_id, None)
+
+def _submit_to_process_pool(func, *args):
+    """Executa uma função no pool de processos; recria o pool se um worker morrer"""
+    global _process_pool
+    try:
+        return get_process_pool().submit(func, *args).result()
+    except BrokenProcessPool:
+        with _process_pool_lock:
+            _process_pool = None
+        raise Exception("Processo worker encerrado inesperadamente (pool será recriado)")
+
+def _transcribe_in_process_pool(audio, on_progress=None, model_name=None, compute=None, publisher=None):
+    """Envia a transcrição de um áudio ao pool de processos"""
+    return _map_in_process_pool([audio], on_progress, model_name, compute, publisher)[0]
+
+# Métricas no formato de texto do Prometheus, expostas em /metrics
+_metrics = []
+
+def _format_labels(pairs):
+    """{nome="valor",...} com escape de barras, aspas e quebras de linha"""
+    if not pairs:
+        return ''
+    parts = []
+    for name, value in pairs:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        parts.append(f'{name}="{value}"')
+    return '{' + ','.join(parts) + '}'
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """Contador monotônico, opcionalmente com labels"""
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+    
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(list(zip(self.labels, key)))} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Histograma com buckets cumulativos, opcionalmente com labels"""
+    
+    def __init__(self, name, help_text, buckets, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self.labels = tuple(labels)
+        self._series = {}   # labels -> [contagem por bucket, soma, total]
+        self._lock = threading.Lock()
+        _metrics.append(self)
+    
+    def observe(self, value, **labels):
+        key = tuple(labels[name] for name in self.labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * len(self.buckets), 0.0, 0])
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][index] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+    
+    def mean(self):
+        """Média de todas as observações (todas as séries), ou None sem observações"""
+        with self._lock:
+            count = sum(series[2] for series in self._series.values())
+            return sum(series[1] for series in self._series.values()) / count if count else None
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                pairs = list(zip(self.labels, key))
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    bucket_labels = _format_labels(pairs + [('le', _format_value(bound))])
+                    lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(pairs)} {_format_value(total)}")
+                lines.append(f"{self.name}_count{_format_labels(pairs)} {count}")
+        return lines
+
+class CallbackMetric:
+    """Valor lido no momento da coleta (estado da fila, do cache etc.)"""
+    
+    def __init__(self, name, help_text, metric_type, func):
+        self.name = name
+        self.help_text = help_text
+        self.metric_type = metric_type
+        self.func = func
+        _metrics.append(self)
+    
+    def render(self):
+        return [
+            f"# HELP {self.name} {self.help_text}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(self.func())}"
+        ]
+
+def render_metrics():
+    """Todas as métricas no formato de exposição em texto do Prometheus"""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    return '\n'.join(lines) + '\n'
+
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600)
+
+stage_duration = Histogram(
+    "transcriber_stage_duration_seconds",
+    "Duração de cada etapa (upload, validation, metadata, conversion, vad, decode, save, stream)",
+    STAGE_BUCKETS, labels=('stage',)
+)
+real_time_factor = Histogram(
+    "transcriber_real_time_factor",
+    "Tempo de decodificação do Whisper dividido pela duração do áudio",
+    (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 3, 5, 10)
+)
+audio_seconds_processed = Counter(
+    "transcriber_audio_seconds_total", "Segundos de áudio transcritos"
+)
+jobs_finished = Counter(
+    "transcriber_jobs_total", "Jobs finalizados por status", labels=('status',)
+)
+uploads_received = Counter(
+    "transcriber_uploads_total", "Uploads recebidos em /transcribe por resultado", labels=('result',)
+)
+
+@contextmanager
+def observe_stage(stage, timings=None):
+    """Mede a duração de uma etapa no histograma (e em timings, se informado)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_duration.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[stage] = round(elapsed, 4)
+
+# tracemalloc é global ao processo: fica ligado enquanto houver job com perfil
+_tracemalloc_users = 0
+_tracemalloc_lock = threading.Lock()
+_active_profilers = set()
+
+class JobProfiler:
+    """Perfil de CPU (cProfile, thread do job) e de memória (tracemalloc) de um job
+    
+    O cProfile cobre apenas a thread que executa o job; no modo process, o tempo
+    do Whisper aparece como espera pelo pool. O pico de memória é o crescimento
+    máximo acima da memória rastreada no início do job (inclui alocações de
+    outros jobs simultâneos e não vê a memória interna do torch); as maiores
+    alocações são a diferença entre os snapshots do início e do fim do job.
+    """
+    
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.profiler = cProfile.Profile()
+        self.report = None
+        self.running = False
+        self.peak = 0
+    
+    def start(self):
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            if _tracemalloc_users == 0:
+                tracemalloc.start()
+            else:
+                # O pico do tracemalloc é global: antes de zerá-lo para este job,
+                # guardar o pico atual nos jobs com perfil em andamento
+                _fold_tracemalloc_peak()
+                tracemalloc.reset_peak()
+            _tracemalloc_users += 1
+            self.baseline, _ = tracemalloc.get_traced_memory()
+            self.start_snapshot = tracemalloc.take_snapshot()
+            _active_profilers.add(self)
+        try:
+            self.profiler.enable()
+        except BaseException:
+            self._release_tracemalloc()
+            raise
+        self.started = time.perf_counter()
+        self.running = True
+    
+    def _release_tracemalloc(self):
+        global _tracemalloc_users
+        with _tracemalloc_lock:
+            _fold_tracemalloc_peak()
+            _active_profilers.discard(self)
+            snapshot = tracemalloc.take_snapshot()
+            _tracemalloc_users -= 1
+            if _tracemalloc_users == 0:
+                tracemalloc.stop()
+        return snapshot
+    
+    def stop(self, timings):
+        """Encerra a coleta, grava os arquivos em PROFILE_DIR e retorna o resumo (None se não iniciada)"""
+        if self.report is not None or not self.running:
+            return self.report
+        self.running = False
+        self.profiler.disable()
+        wall_seconds = time.perf_counter() - self.started
+        snapshot = self._release_tracemalloc()
+        peak = max(self.peak - self.baseline, 0)
+        
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profile_name = f"{self.job_id}.prof"
+        report_name = f"{self.job_id}_perfil.txt"
+        self.profiler.dump_stats(os.path.join(PROFILE_DIR, profile_name))
+        
+        stats = pstats.Stats(self.profiler)
+        top_functions = [
+            {
+                "function": f"{os.path.basename(filename)}:{line}({name})",
+                "calls": calls,
+                "own_seconds": round(own, 4),
+                "cumulative_seconds": round(cumulative, 4)
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in sorted(
+                stats.stats.items(), key=lambda item: item[1][3], reverse=True
+            )[:PROFILE_TOP_ENTRIES]
+        ]
+        exclude = [tracemalloc.Filter(False, tracemalloc.__file__)]
+        allocations = [
+            stat for stat in snapshot.filter_traces(exclude).compare_to(
+                self.start_snapshot.filter_traces(exclude), 'lineno'
+            )
+            if stat.size_diff > 0
+        ][:PROFILE_TOP_ENTRIES]
+        top_allocations = [
+            {
+                "location": str(stat.traceback),
+                "size_mb": round(stat.size_diff / 1024 / 1024, 3),
+                "count": stat.count_diff
+            }
+            for stat in allocations
+        ]
+        
+        # Relatório legível: etapas, funções por tempo acumulado e maiores alocações
+        text = io.StringIO()
+        text.write(f"Job {self.job_id}: {wall_seconds:.2f}s, pico de memória Python {peak/1024/1024:.1f} MB\n\n")
+        text.write("Etapas:\n")
+        for stage, seconds in timings.items():
+            text.write(f"  {stage:<12}{seconds:>10.3f}s\n")
+        text.write("\nCPU (cProfile, ordenado por tempo acumulado):\n")
+        pstats.Stats(self.profiler, stream=text).sort_stats('cumulative').print_stats(40)
+        text.write("Memória (tracemalloc, maiores alocações criadas durante o job e vivas ao final):\n")
+        for stat in allocations:
+            text.write(f"  {stat}\n")
+        with open(os.path.join(PROFILE_DIR, report_name), 'w', encoding='utf-8') as f:
+            f.write(text.getvalue())
+        
+        self.report = {
+            "stages": dict(timings),
+            "wall_seconds": round(wall_seconds, 4),
+            "memory_peak_mb": round(peak / 1024 / 1024, 3),
+            "top_functions": top_functions,
+            "top_allocations": top_allocations,
+            "cpu_profile": profile_name,
+            "report": report_name
+        }
+        print(f"[{self.job_id}] ✓ Perfil salvo: {profile_name}, {report_name}")
+        return self.report
+
+def _fold_tracemalloc_peak():
+    """Registra o pico global atual do tracemalloc em cada job com perfil ativo (com _tracemalloc_lock)"""
+    _, peak = tracemalloc.get_traced_memory()
+    for profiler in _active_profilers:
+        profiler.peak = max(profiler.peak, peak)
+
+class MemoryJobStore:
+    """Jobs e lotes em memória: visíveis apenas no processo da API que os criou"""
+    
+    def __init__(self):
+        self.jobs = {}
+        self.batches = {}
+        self.latest_job_id = None  # Usado apenas pelo endpoint legado /progress
+        self._lock = threading.Lock()
+    
+    def _evict_expired_locked(self, now):
+        """Remove jobs finalizados há mais de JOB_TTL_SECONDS (chamar com o lock)"""
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job['finished_at'] is not None and now - job['finished_at'] > JOB_TTL_SECONDS
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+        if expired:
+            print(f"✓ {len(expired)} job(s) expirado(s) removido(s) da memória")
+            # Lotes cujos jobs já expiraram todos
+            for batch_id in [
+                b for b, batch in self.batches.items() if not any(j in self.jobs for j in batch['job_ids'])
+            ]:
+                del self.batches[batch_id]
+    
+    def create(self, job):
+        with self._lock:
+            self._evict_expired_locked(job['created_at'])
+            self.jobs[job['id']] = job
+            self.latest_job_id = job['id']
+    
+    def update(self, job_id, fields):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job['version'] += 1
+            job['updated_at'] = time.time()
+            if job['status'] in FINISHED_STATUSES and job['finished_at'] is None:
+                job['finished_at'] = job['updated_at']
+    
+    def get(self, job_id):
+        with self._lock:
+            self._evict_expired_locked(time.time())
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+    
+    def version(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return job['version'] if job else None
+    
+    def discard(self, job_id):
+        with self._lock:
+            self.jobs.pop(job_id, None)
+            if self.latest_job_id == job_id:
+                self.latest_job_id = None
+    
+    def append_segments(self, job_id, segments):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job['segments'].extend(segments)
+            job['version'] += 1
+            job['updated_at'] = time.time()
+    
+    def get_segments(self, job_id, since=0):
+        with self._lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            return [dict(segment) for segment in job['segments'][since:]], len(job['segments']), job['status']
+    
+    def create_batch(self, batch_id, job_ids):
+        with self._lock:
+            self.batches[batch_id] = {'id': batch_id, 'job_ids': list(job_ids), 'created_at': time.time()}
+    
+    def get_batch(self, batch_id):
+        with self._lock:
+            self._evict_expired_locked(time.time())
+            batch = self.batches.get(batch_id)
+            if batch is None:
+                return None
+            return {**batch, 'jobs': [dict(self.jobs[j]) for j in batch['job_ids'] if j in self.jobs]}
+    
+    def discard_batch(self, batch_id):
+        with self._lock:
+            batch = self.batches.pop(batch_id, None)
+        return batch['job_ids'] if batch else []
+    
+    def latest(self):
+        return self.latest_job_id
+    
+    def reset_latest(self):
+        with self._lock:
+            self.latest_job_id = None
+    
+    def renew_leases(self):
+        """Jobs em memória não sobrevivem ao processo: nada a renovar"""
+    
+    def claim_interrupted(self):
+        return []
+    
+    def release(self, job_id):
+        pass
+
+class SQLiteJobStore:
+    """Jobs e lotes em SQLite (modo WAL), compartilhados por todos os processos da API
+    
+    Cada job pertence ao processo que o criou (owner) enquanto esse processo
+    renovar o lease (renew_leases). Jobs não finalizados com lease vencido
+    (processo reiniciado ou encerrado) são reassumidos por claim_interrupted.
+    Os segmentos ficam em uma tabela própria para que a publicação incremental
+    não reescreva o job inteiro.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            version INTEGER NOT NULL DEFAULT 0,
+            created_at REAL NOT NULL,
+            finished_at REAL,
+            owner TEXT,
+            lease_expires REAL
+        );
+        CREATE INDEX IF NOT EXISTS jobs_unfinished ON jobs (finished_at, lease_expires);
+        CREATE TABLE IF NOT EXISTS job_segments (
+            job_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (job_id, position)
+        );
+        CREATE TABLE IF NOT EXISTS batches (
+            id TEXT PRIMARY KEY,
+            job_ids TEXT NOT NULL,
+            created_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+    """
+    
+    def __init__(self, db_path, owner, lease_seconds):
+        self.db_path = db_path
+        self.owner = owner
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(self.SCHEMA)
+    
+    @contextmanager
+    def _transaction(self):
+        """Transação de escrita (BEGIN IMMEDIATE: outros processos esperam o busy timeout)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _load(self, row, segments=None):
+        job = json.loads(row[0])
+        job['version'] = row[1]
+        job['finished_at'] = row[2]
+        job['segments'] = segments if segments is not None else []
+        return job
+    
+    def _segments_locked(self, job_id, since=0):
+        return [
+            json.loads(data) for (data,) in self._conn.execute(
+                "SELECT data FROM job_segments WHERE job_id = ? AND position >= ? ORDER BY position",
+                (job_id, since)
+            )
+        ]
+    
+    def _evict_expired(self, now):
+        with self._transaction() as conn:
+            expired = [job_id for (job_id,) in conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (now - JOB_TTL_SECONDS,)
+            )]
+            for job_id in expired:
+                conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+                conn.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+            # Lotes antigos cujos jobs já expiraram todos
+            for batch_id, job_ids in conn.execute(
+                "SELECT id, job_ids FROM batches WHERE created_at < ?", (now - JOB_TTL_SECONDS,)
+            ).fetchall():
+                ids = json.loads(job_ids)
+                placeholders = ','.join('?' * len(ids))
+                if not ids or not conn.execute(f"SELECT 1 FROM jobs WHERE id IN ({placeholders})", ids).fetchone():
+                    conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+        if expired:
+            print(f"✓ {len(expired)} job(s) expirado(s) removido(s) do banco de jobs")
+    
+    def create(self, job):
+        self._evict_expired(job['created_at'])
+        data = {k: v for k, v in job.items() if k not in ('segments', 'version', 'finished_at')}
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, data, version, created_at, owner, lease_expires) VALUES (?, ?, 0, ?, ?, ?)",
+                (job['id'], json.dumps(data, default=str), job['created_at'], self.owner,
+                 job['created_at'] + self.lease_seconds)
+            )
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('latest_job_id', ?)", (job['id'],))
+    
+    def update(self, job_id, fields):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT data, version, finished_at FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return
+            job = json.loads(row[0])
+            segments = fields.pop('segments', None)
+            job.update(fields)
+            job['updated_at'] = time.time()
+            finished_at = row[2]
+            if job['status'] in FINISHED_STATUSES and finished_at is None:
+                finished_at = job['updated_at']
+            job.pop('finished_at', None)
+            conn.execute(
+                "UPDATE jobs SET data = ?, version = version + 1, finished_at = ? WHERE id = ?",
+                (json.dumps(job, default=str), finished_at, job_id)
+            )
+            if segments is not None:
+                conn.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+                conn.executemany(
+                    "INSERT INTO job_segments (job_id, position, data) VALUES (?, ?, ?)",
+                    [(job_id, position, json.dumps(segment)) for position, segment in enumerate(segments)]
+                )
+    
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, version, finished_at FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[2] is not None and time.time() - row[2] > JOB_TTL_SECONDS:
+                return None
+            return self._load(row, self._segments_locked(job_id))
+    
+    def version(self, job_id):
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+    
+    def discard(self, job_id):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            conn.execute("DELETE FROM job_segments WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM meta WHERE key = 'latest_job_id' AND value = ?", (job_id,))
+    
+    def append_segments(self, job_id, segments):
+        with self._transaction() as conn:
+            count = conn.execute("SELECT count(*) FROM job_segments WHERE job_id = ?", (job_id,)).fetchone()[0]
+            conn.executemany(
+                "INSERT INTO job_segments (job_id, position, data) VALUES (?, ?, ?)",
+                [(job_id, count + offset, json.dumps(segment)) for offset, segment in enumerate(segments)]
+            )
+            conn.execute("UPDATE jobs SET version = version + 1 WHERE id = ?", (job_id,))
+    
+    def get_segments(self, job_id, since=0):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            total = self._conn.execute(
+                "SELECT count(*) FROM job_segments WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            return self._segments_locked(job_id, since), total, json.loads(row[0])['status']
+    
+    def create_batch(self, batch_id, job_ids):
+        with self._transaction() as conn:
+            conn.execute(
+                "INSERT INTO batches (id, job_ids, created_at) VALUES (?, ?, ?)",
+                (batch_id, json.dumps(list(job_ids)), time.time())
+            )
+    
+    def get_batch(self, batch_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_ids, created_at FROM batches WHERE id = ?", (batch_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        jobs_in_batch = [job for job in (self.get(job_id) for job_id in json.loads(row[0])) if job]
+        return {'id': batch_id, 'job_ids': json.loads(row[0]), 'created_at': row[1], 'jobs': jobs_in_batch}
+    
+    def discard_batch(self, batch_id):
+        with self._transaction() as conn:
+            row = conn.execute("SELECT job_ids FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            conn.execute("DELETE FROM batches WHERE id = ?", (batch_id,))
+        return json.loads(row[0]) if row else []
+    
+    def latest(self):
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'latest_job_id'").fetchone()
+        return row[0] if row else None
+    
+    def reset_latest(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM meta WHERE key = 'latest_job_id'")
+    
+    def renew_leases(self):
+        """Estende o lease dos jobs não finalizados deste processo"""
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE owner = ? AND finished_at IS NULL",
+                (time.time() + self.lease_seconds, self.owner)
+            )
+    
+    def claim_interrupted(self):
+        """Assume os jobs não finalizados cujo lease venceu; retorna esses jobs"""
+        now = time.time()
+        with self._transaction() as conn:
+            claimed = [job_id for (job_id,) in conn.execute(
+                "SELECT id FROM jobs WHERE finished_at IS NULL AND lease_expires < ?", (now,)
+            ).fetchall()]
+            for job_id in claimed:
+                conn.execute(
+                    "UPDATE jobs SET owner = ?, lease_expires = ? WHERE id = ?",
+                    (self.owner, now + self.lease_seconds, job_id)
+                )
+        return [job for job in (self.get(job_id) for job_id in claimed) if job]
+    
+    def release(self, job_id):
+        """Devolve um job assumido (lease vencido), para ser reassumido depois"""
+        with self._transaction() as conn:
+            conn.execute("UPDATE jobs SET owner = NULL, lease_expires = 0 WHERE id = ?", (job_id,))
+    
+    # Fila do modo queue: jobs não finalizados sem dono aguardam um worker
+    
+    QUEUED_COUNT = "SELECT count(*) FROM jobs WHERE owner IS NULL AND finished_at IS NULL"
+    
+    def queue_length(self):
+        with self._lock:
+            return self._conn.execute(self.QUEUED_COUNT).fetchone()[0]
+    
+    @staticmethod
+    def _holder(job_id):
+        """Dono dos jobs de um lote enquanto o job que o representa aguarda na fila"""
+        return f"lote:{job_id}"
+    
+    def enqueue(self, job_ids, max_queued, held_ids=()):
+        """Libera jobs para os workers; retorna a posição do primeiro, ou None com a fila cheia
+        
+        Com held_ids (lote), os demais jobs ficam presos ao primeiro de job_ids, sem lease:
+        não são assumidos sozinhos e passam ao worker que assumir o primeiro
+        """
+        with self._transaction() as conn:
+            queued = conn.execute(self.QUEUED_COUNT).fetchone()[0]
+            if queued >= max_queued:
+                return None
+            conn.executemany(
+                "UPDATE jobs SET owner = NULL, lease_expires = NULL WHERE id = ?", [(job_id,) for job_id in job_ids]
+            )
+            conn.executemany(
+                "UPDATE jobs SET owner = ?, lease_expires = NULL WHERE id = ?",
+                [(self._holder(job_ids[0]), job_id) for job_id in held_ids]
+            )
+        return queued + 1
+    
+    def queue_position(self, job_id):
+        """Posição (1 = próximo) de um job aguardando um worker, ou None"""
+        with self._lock:
+            position = self._conn.execute(
+                """
+                SELECT count(*) FROM jobs
+                WHERE owner IS NULL AND finished_at IS NULL AND created_at <= (
+                    SELECT created_at FROM jobs WHERE id = ? AND owner IS NULL AND finished_at IS NULL
+                )
+                """,
+                (job_id,)
+            ).fetchone()[0]
+        return position or None
+    
+    def register_worker(self, concurrency, real_time_factor=None):
+        """Heartbeat de um worker.py (chamado a cada renovação de leases), com o fator de tempo real medido"""
+        now = time.time()
+        with self._transaction() as conn:
+            for key, value in conn.execute("SELECT key, value FROM meta WHERE key LIKE 'worker:%'").fetchall():
+                if json.loads(value)['seen'] < now - self.lease_seconds:
+                    conn.execute("DELETE FROM meta WHERE key = ?", (key,))
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                (f"worker:{self.owner}", json.dumps({
+                    'concurrency': concurrency, 'seen': now, 'real_time_factor': real_time_factor
+                }))
+            )
+    
+    def unregister_worker(self):
+        with self._transaction() as conn:
+            conn.execute("DELETE FROM meta WHERE key = ?", (f"worker:{self.owner}",))
+    
+    def queue_stats(self):
+        """Workers vivos (heartbeat dentro do lease), jobs em execução por eles e jobs na fila
+        
+        queued_audio_seconds inclui os jobs presos a um lote na fila; real_time_factor é
+        a média dos fatores medidos pelos workers vivos (None antes da primeira transcrição)
+        """
+        now = time.time()
+        with self._lock:
+            workers = {}
+            for key, value in self._conn.execute("SELECT key, value FROM meta WHERE key LIKE 'worker:%'"):
+                info = json.loads(value)
+                if info['seen'] >= now - self.lease_seconds:
+                    workers[key[len('worker:'):]] = info
+            running = 0
+            if workers:
+                placeholders = ','.join('?' * len(workers))
+                running = self._conn.execute(
+                    f"SELECT count(*) FROM jobs WHERE finished_at IS NULL AND lease_expires >= ? AND owner IN ({placeholders})",
+                    (now, *workers)
+                ).fetchone()[0]
+            queued = self._conn.execute(self.QUEUED_COUNT).fetchone()[0]
+            queued_audio = sum(
+                json.loads(data).get('duration_seconds') or 0 for (data,) in self._conn.execute(
+                    "SELECT data FROM jobs WHERE finished_at IS NULL AND (owner IS NULL OR owner LIKE 'lote:%')"
+                )
+            )
+        factors = [info['real_time_factor'] for info in workers.values() if info.get('real_time_factor')]
+        return {
+            "workers": sum(info['concurrency'] for info in workers.values()),
+            "running": running,
+            "queued": queued,
+            "queued_audio_seconds": round(queued_audio, 1),
+            "real_time_factor": sum(factors) / len(factors) if factors else None
+        }
+    
+    def claim_next(self):
+        """Assume o job mais antigo sem dono (ou com lease vencido); None se não houver
+        
+        Os jobs presos a ele (lote) passam a este worker junto, com o mesmo lease
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                """
+                SELECT id FROM jobs
+                WHERE finished_at IS NULL AND (owner IS NULL OR lease_expires < ?)
+                ORDER BY created_at LIMIT 1
+                """,
+                (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET owner = ?, lease_expires = ? WHERE id = ? OR (owner = ? AND finished_at IS NULL)",
+                (self.owner, now + self.lease_seconds, row[0], self._holder(row[0]))
+            )
+        return self.get(row[0])
+
+if JOB_STORE == 'sqlite':
+    job_store = SQLiteJobStore(JOB_DB_PATH, INSTANCE_ID, JOB_LEASE_SECONDS)
+else:
+    job_store = MemoryJobStore()
+
+def create_job(filename, model_name=None, compute=None):
+    """Cria um novo job no registro e retorna seu ID"""
+    job_id = uuid.uuid4().hex
+    now = time.time()
+    job_store.create({
+        'id': job_id,
+        'filename': filename,
+        'model': model_name or WHISPER_MODEL_NAME,
+        'compute': compute or WHISPER_COMPUTE,
+        'duration_seconds': None,
+        'status': 'queued',
+        'percent': 0,
+        'decoded_seconds': None,
+        'real_time_factor': None,
+        'eta_seconds': None,
+        'result': None,
+        'error': None,
+        'created_at': now,
+        'updated_at': now,
+        'finished_at': None,
+        'profile': None,
+        'vad_skipped_fraction': None,
+        'segments': [],
+        'task': None,  # argumentos do pipeline, para reenfileirar um job interrompido
+        'version': 0
+    })
+    return job_id
+
+def update_job(job_id, **fields):
+    """Atualiza campos de um job (ignora jobs já removidos)"""
+    job_store.update(job_id, fields)
+
+def get_job(job_id):
+    """Retorna uma cópia do job, ou None se não existir ou tiver expirado"""
+    return job_store.get(job_id)
+
+def append_job_segments(job_id, segments):
+    """Acrescenta segmentos já decodificados ao job (publicação incremental)"""
+    job_store.append_segments(job_id, segments)
+
+def get_job_segments(job_id, since=0):
+    """Segmentos do job a partir do índice `since`: (segmentos, total, status), ou None"""
+    return job_store.get_segments(job_id, since)
+
+def get_job_version(job_id):
+    """Contador de alterações do job (None se não existir), sem copiar o registro"""
+    return job_store.version(job_id)
+
+def discard_job(job_id):
+    """Remove um job do registro (ex.: recusado pela fila)"""
+    job_store.discard(job_id)
+
+def create_batch(job_ids):
+    """Registra um lote com os jobs de seus arquivos e retorna seu ID"""
+    batch_id = uuid.uuid4().hex
+    job_store.create_batch(batch_id, job_ids)
+    return batch_id
+
+def get_batch(batch_id):
+    """Retorna o lote com cópias dos seus jobs, ou None se não existir"""
+    return job_store.get_batch(batch_id)
+
+def discard_batch(batch_id):
+    """Remove um lote e seus jobs (ex.: recusado pela fila)"""
+    for job_id in job_store.discard_batch(batch_id):
+        discard_job(job_id)
+
+class QueueFullError(Exception):
+    """Fila de processamento cheia"""
+
+class JobScheduler:
+    """Pool fixo de workers consumindo uma fila FIFO limitada de jobs"""
+    
+    def __init__(self, num_workers, max_queue):
+        self.num_workers = max(1, num_workers)
+        self.max_queue = max_queue
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._avg_job_seconds = None
+        self._avg_real_time_factor = None
+    
+    def submit(self, job_id, func, *args, audio_seconds=None):
+        """Enfileira um job; retorna sua posição na fila ou levanta QueueFullError"""
+        with self._cond:
+            if len(self._pending) >= self.max_queue:
+                raise QueueFullError(f"Fila de processamento cheia ({self.max_queue} jobs aguardando)")
+            self._pending.append((job_id, func, args, audio_seconds))
+            self._start_workers_locked()
+            self._cond.notify()
+            return len(self._pending)
+    
+    def position(self, job_id):
+        """Posição (1 = próximo) de um job na fila, ou None se não estiver aguardando"""
+        with self._cond:
+            for index, (pending_id, _, _, _) in enumerate(self._pending):
+                if pending_id == job_id:
+                    return index + 1
+        return None
+    
+    def retry_after(self):
+        """Estimativa em segundos até haver espaço na fila"""
+        with self._cond:
+            # Com a duração dos áudios na fila (via probe_audio_file) e o fator de
+            # tempo real medido, a estimativa acompanha o tamanho real dos jobs
+            queued_audio = sum(seconds for _, _, _, seconds in self._pending if seconds)
+            if self._avg_real_time_factor and queued_audio:
+                return max(1, math.ceil(self._avg_real_time_factor * queued_audio / self.num_workers))
+            if not self._avg_job_seconds:
+                return DEFAULT_RETRY_AFTER_SECONDS
+            waves = len(self._pending) / self.num_workers
+            return max(1, math.ceil(self._avg_job_seconds * max(waves, 1)))
+    
+    def stats(self):
+        """Estado atual da fila e dos workers"""
+        with self._cond:
+            return {
+                "workers": self.num_workers,
+                "running": self._running,
+                "queued": len(self._pending),
+                "max_queue": self.max_queue
+            }
+    
+    def _start_workers_locked(self):
+        """Inicia os workers sob demanda (chamar com o lock da fila)"""
+        while len(self._threads) < self.num_workers:
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"transcribe-worker-{len(self._threads) + 1}",
+                daemon=True
+            )
+            self._threads.append(thread)
+            thread.start()
+    
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job_id, func, args, audio_seconds = self._pending.popleft()
+                self._running += 1
+            
+            started = time.time()
+            try:
+                func(job_id, *args)
+            except Exception as e:
+                print(f"[{job_id}] ✗ Erro não tratado no worker: {e}")
+            finally:
+                elapsed = time.time() - started
+                with self._cond:
+                    self._running -= 1
+                    # Média móvel exponencial da duração dos jobs (para o Retry-After)
+                    if self._avg_job_seconds is None:
+                        self._avg_job_seconds = elapsed
+                    else:
+                        self._avg_job_seconds = 0.8 * self._avg_job_seconds + 0.2 * elapsed
+                    if audio_seconds:
+                        rtf = elapsed / audio_seconds
+                        if self._avg_real_time_factor is None:
+                            self._avg_real_time_factor = rtf
+                        else:
+                            self._avg_real_time_factor = 0.8 * self._avg_real_time_factor + 0.2 * rtf
+
+CallbackMetric("transcriber_jobs_in_flight", "Jobs sendo processados", "gauge", lambda: queue_stats()['running'])
+CallbackMetric("transcriber_jobs_queued", "Jobs aguardando na fila", "gauge", lambda: queue_stats()['queued'])
+CallbackMetric("transcriber_workers", "Workers de transcrição", "gauge", lambda: queue_stats()['workers'])
+CallbackMetric("transcriber_cpu_budget_cores", "Núcleos no orçamento de CPU do processo", "gauge",
+               lambda: cpu_budget.stats()['cpus'])
+CallbackMetric("transcriber_cpu_tasks", "Tarefas de CPU ativas (FFmpeg e Whisper)", "gauge",
+               lambda: len(cpu_budget.stats()['tasks']))
+
+# No modo process há um worker da fila para cada processo de decodificação
+scheduler = JobScheduler(
+    WORKER_PROCESSES if EXECUTION_MODE == 'process' else TRANSCRIBE_WORKERS,
+    TRANSCRIBE_QUEUE_SIZE
+)
+
+def probe_audio_file(file_path):
+    """Inspeciona o arquivo lendo apenas os cabeçalhos do container (sem decodificar o áudio)
+    
+    Retorna duração, codec, taxa de amostragem, canais e tags. WAV PCM é lido
+    direto pelo módulo wave; os demais formatos usam ffprobe.
+    """
+    if file_path.lower().endswith('.wav'):
+        try:
+            with wave.open(file_path, 'rb') as wf:
+                frames = wf.getnframes()
+                sample_rate = wf.getframerate()
+                return {
+                    "duration": frames / sample_rate if sample_rate else 0.0,
+                    "frames": frames,
+                    "codec": f"pcm_s{wf.getsampwidth() * 8}le",
+                    "sample_rate": sample_rate,
+                    "channels": wf.getnchannels(),
+                    "format_name": "wav",
+                    "tags": {}
+                }
+        except wave.Error:
+            pass  # WAV não-PCM (ex.: float, ADPCM): deixar o ffprobe inspecionar
+    
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-print_format', 'json',
+        '-show_format',
+        '-show_streams',
+        '-select_streams', 'a:0',
+        file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+    if result.returncode != 0:
+        error_msg = result.stderr[-500:] if result.stderr else "Erro desconhecido"
+        raise Exception(f"FFprobe falhou: {error_msg}")
+    
+    data = json.loads(result.stdout or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise Exception("Nenhuma faixa de áudio encontrada no arquivo")
+    
+    stream = streams[0]
+    container = data.get('format', {})
+    tags = {**container.get('tags', {}), **stream.get('tags', {})}
+    return {
+        "duration": float(stream.get('duration') or container.get('duration') or 0),
+        "codec": stream.get('codec_name', 'N/A'),
+        "sample_rate": int(stream.get('sample_rate') or 0),
+        "channels": int(stream.get('channels') or 0),
+        "format_name": container.get('format_name', 'N/A'),
+        "tags": {key.lower(): value for key, value in tags.items()}
+    }
+
+class TranscriptionCache:
+    """Cache em disco de resultados, com despejo LRU limitado por bytes
+    
+    O índice LRU (tamanho e ordem de uso de cada entrada) fica em SQLite no
+    próprio diretório do cache, compartilhado por todos os processos que o usam
+    (processos da API e worker.py): uma entrada gravada por um processo é
+    encontrada pelos outros, e o limite de bytes vale para o diretório inteiro.
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            used INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS entries_lru ON entries (used);
+    """
+    # Ordem de uso: um contador crescente (relógios de processos diferentes podem empatar)
+    NEXT_USE = "(SELECT coalesce(max(used), 0) + 1 FROM entries)"
+    
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._conn = sqlite3.connect(
+            os.path.join(cache_dir, "index.db"), check_same_thread=False, timeout=30, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+        
+        # Indexar arquivos gravados antes do índice, na ordem do mtime
+        files = []
+        for name in os.listdir(cache_dir):
+            if name.endswith('.json'):
+                stat = os.stat(os.path.join(cache_dir, name))
+                files.append((stat.st_mtime, name[:-5], stat.st_size))
+        with self._transaction() as conn:
+            for _, key, size in sorted(files):
+                conn.execute(
+                    f"INSERT OR IGNORE INTO entries (key, size, used) VALUES (?, ?, {self.NEXT_USE})", (key, size)
+                )
+    
+    @contextmanager
+    def _transaction(self):
+        """Transação de escrita (BEGIN IMMEDIATE: outros processos esperam o busy timeout)"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+    
+    def get(self, key):
+        """Retorna o resultado armazenado para a chave, ou None"""
+        with self._lock:
+            found = self._conn.execute("SELECT 1 FROM entries WHERE key = ?", (key,)).fetchone()
+        result = None
+        if found:
+            try:
+                with open(self._path(key), encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                result = None
+        with self._transaction() as conn:
+            if result is None:
+                if found:
+                    # Arquivo despejado ou corrompido por outro processo
+                    conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute(f"UPDATE entries SET used = {self.NEXT_USE} WHERE key = ?", (key,))
+            self.hits += 1
+            return result
+    
+    def put(self, key, result):
+        """Armazena um resultado e despeja os menos usados acima do limite"""
+        if self.max_bytes <= 0:
+            return
+        data = json.dumps(result, ensure_ascii=False).encode('utf-8')
+        if len(data) > self.max_bytes:
+            return
+        tmp_path = f"{self._path(key)}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        
+        with self._transaction() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO entries (key, size, used) VALUES (?, ?, {self.NEXT_USE})", (key, len(data))
+            )
+            total = conn.execute("SELECT coalesce(sum(size), 0) FROM entries").fetchone()[0]
+            evicted = []
+            if total > self.max_bytes:
+                for old_key, size in conn.execute("SELECT key, size FROM entries ORDER BY used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(old_key)
+                    total -= size
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(old_key,) for old_key in evicted])
+            # Remover os arquivos ainda dentro da transação: nenhum outro processo
+            # regrava a entrada no índice entre a remoção da linha e a do arquivo
+            for old_key in evicted:
+                try:
+                    os.remove(self._path(old_key))
+                except OSError:
+                    pass
+                print(f"✓ Cache: entrada {old_key[:12]}... despejada (LRU)")
+    
+    def stats(self):
+        """Contadores de acerto/falha deste processo e ocupação do diretório"""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM entries").fetchone()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes
+            }
 
-# Configuração
-# Use /tmp/uploads em ambiente de teste, /app/uploads em produção
-if "pytest" in sys.modules or os.getenv("TESTING") == "1":
-    UPLOAD_DIR = "/tmp/uploads"
-else:
-    UPLOAD_DIR = "/app/uploads"
+transcription_cache = TranscriptionCache(CACHE_DIR, CACHE_MAX_BYTES)
+
+class TranscriptStore:
+    """Transcrições, segmentos e metadados em SQLite, com busca textual (FTS5)
     
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+    transcripts_fts indexa nome do arquivo, título, artista e texto (conteúdo na
+    tabela transcripts); segments_fts guarda e indexa os segmentos com seus tempos,
+    para que cada resultado da busca aponte os trechos do áudio. O tokenizador
+    ignora acentos: "sessao" encontra "sessão".
+    """
+    
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transcripts (
+            id INTEGER PRIMARY KEY,
+            download_file TEXT UNIQUE,
+            filename TEXT NOT NULL,
+            job_id TEXT,
+            model TEXT,
+            created_at REAL NOT NULL,
+            title TEXT,
+            artist TEXT,
+            duration TEXT,
+            format TEXT,
+            transcription TEXT NOT NULL
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS transcripts_fts USING fts5(
+            filename, title, artist, transcription,
+            content='transcripts', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+        );
+        CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+            text, transcript_id UNINDEXED, position UNINDEXED, start UNINDEXED, end UNINDEXED,
+            tokenize='unicode61 remove_diacritics 2'
+        );
+    """
+    
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(self.SCHEMA)
+    
+    def save(self, transcription_text, audio_filename, metadata=None, segments=None, job_id=None, model_name=None,
+             created_at=None, download_file=None):
+        """Armazena uma transcrição e retorna seu nome para /download (<nome>_<id>_transcricao.txt)"""
+        metadata = metadata or {}
+        values = {
+            "filename": audio_filename,
+            "title": str(metadata.get("title", "")),
+            "artist": str(metadata.get("artist", "")),
+            "transcription": transcription_text
+        }
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO transcripts (filename, job_id, model, created_at, title, artist, duration, format, "
+                "transcription) VALUES (:filename, :job_id, :model, :created_at, :title, :artist, :duration, "
+                ":format, :transcription)",
+                {
+                    **values,
+                    "job_id": job_id,
+                    "model": model_name,
+                    "created_at": created_at or time.time(),
+                    "duration": str(metadata.get("duration", "")),
+                    "format": str(metadata.get("format", ""))
+                }
+            )
+            transcript_id = cursor.lastrowid
+            download_file = download_file or f"{Path(audio_filename).stem}_{transcript_id}_transcricao.txt"
+            self._conn.execute(
+                "UPDATE transcripts SET download_file = ? WHERE id = ?", (download_file, transcript_id)
+            )
+            self._conn.execute(
+                "INSERT INTO transcripts_fts (rowid, filename, title, artist, transcription) "
+                "VALUES (:rowid, :filename, :title, :artist, :transcription)",
+                {**values, "rowid": transcript_id}
+            )
+            self._conn.executemany(
+                "INSERT INTO segments_fts (text, transcript_id, position, start, end) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (segment['text'], transcript_id, position, segment['start'], segment['end'])
+                    for position, segment in enumerate(segments or [])
+                ]
+            )
+        return download_file
+    
+    def get_document(self, download_file):
+        """Texto do arquivo de transcrição, ou None se não existir"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT filename, created_at, transcription FROM transcripts WHERE download_file = ?",
+                (download_file,)
+            ).fetchone()
+        if row is None:
+            return None
+        return format_transcription_document(row['transcription'], row['filename'], row['created_at'])
+    
+    @staticmethod
+    def build_query(text):
+        """Converte a busca do usuário em uma consulta FTS5 segura
+        
+        Palavras viram termos entre aspas (todas obrigatórias), "frases entre aspas"
+        são mantidas e palavra* busca por prefixo; operadores do FTS5 não são aceitos.
+        """
+        terms = []
+        for phrase, word in re.findall(r'"([^"]*)"|(\S+)', text):
+            if phrase:
+                words = re.findall(r'\w+', phrase)
+                if words:
+                    terms.append('"' + ' '.join(words) + '"')
+            else:
+                prefix = word.endswith('*')
+                for token in re.findall(r'\w+', word):
+                    terms.append(f'"{token}"')
+                if prefix and terms:
+                    terms[-1] += '*'
+        return ' '.join(terms)
+    
+    def search(self, text, limit=SEARCH_PAGE_SIZE, offset=0):
+        """Busca ordenada por relevância (bm25); retorna (total, resultados)"""
+        query = self.build_query(text)
+        if not query:
+            return 0, []
+        with self._lock:
+            total = self._conn.execute(
+                "SELECT count(*) FROM transcripts_fts WHERE transcripts_fts MATCH ?", (query,)
+            ).fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT t.id, t.download_file, t.filename, t.job_id, t.model, t.created_at, t.title, t.artist, "
+                "t.duration, t.format, bm25(transcripts_fts, 2.0, 1.0, 1.0, 1.0) AS rank, "
+                "snippet(transcripts_fts, 3, '[', ']', '…', 16) AS snippet "
+                "FROM transcripts_fts JOIN transcripts t ON t.id = transcripts_fts.rowid "
+                "WHERE transcripts_fts MATCH ? ORDER BY rank LIMIT ? OFFSET ?",
+                (query, limit, offset)
+            ).fetchall()
+            hits = []
+            for row in rows:
+                segments = self._conn.execute(
+                    "SELECT start, end, snippet(segments_fts, 0, '[', ']', '…', 16) AS text FROM segments_fts "
+                    "WHERE segments_fts MATCH ? AND transcript_id = ? ORDER BY position LIMIT ?",
+                    (query, row['id'], SEARCH_SEGMENTS_PER_HIT)
+                ).fetchall()
+                hit = {key: row[key] for key in row.keys() if key not in ('id', 'rank')}
+                hit['created_at'] = datetime.fromtimestamp(row['created_at']).isoformat()
+                hit['score'] = round(-row['rank'], 6)
+                hit['segments'] = [dict(segment) for segment in segments]
+                hits.append(hit)
+        return total, hits
+    
+    def import_legacy_files(self, directory):
+        """Importa (e remove) os arquivos *_transcricao.txt gravados antes do banco
+        
+        Uma trava de arquivo no diretório impede que dois processos importem o mesmo arquivo
+        """
+        with open(os.path.join(directory, ".transcricoes_import.lock"), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            return self._import_legacy_files(directory)
+    
+    def _import_legacy_files(self, directory):
+        imported = 0
+        for path in sorted(Path(directory).glob("*_transcricao.txt")):
+            try:
+                content = path.read_text(encoding='utf-8')
+                header, _, body = content.partition("TRANSCRIÇÃO:\n\n")
+                match = re.search(r'^Arquivo: (.*)$', header, re.MULTILINE)
+                transcription = body.rsplit(f"\n\n{'='*50}", 1)[0]
+                with self._lock:
+                    exists = self._conn.execute(
+                        "SELECT 1 FROM transcripts WHERE download_file = ?", (path.name,)
+                    ).fetchone()
+                if not exists:
+                    self.save(
+                        transcription, match.group(1) if match else path.name,
+                        created_at=path.stat().st_mtime, download_file=path.name
+                    )
+                path.unlink()
+                imported += 1
+            except Exception as e:
+                print(f"⚠ Erro ao importar {path.name}: {e}")
+        if imported:
+            print(f"✓ {imported} transcrição(ões) antiga(s) importada(s) para {self.db_path}")
+        return imported
+    
+    def stats(self):
+        with self._lock:
+            return {"transcripts": self._conn.execute("SELECT count(*) FROM transcripts").fetchone()[0]}
 
-# Rastreador de progresso
-progress_tracker = {
-    'current_percent': 0,
-    'status': 'waiting',
-    'result': None,
-    'error': None,
-    'lock': threading.Lock()
-}
+transcript_store = TranscriptStore(TRANSCRIPT_DB_PATH)
 
-# Criar app FastAPI
-app = FastAPI(title="Audio Transcription API")
+CallbackMetric("transcriber_transcripts_stored", "Transcrições no banco de busca", "gauge",
+               lambda: transcript_store.stats()['transcripts'])
 
-# CORS middleware para aceitar requisições do frontend
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+CallbackMetric("transcriber_cache_hits_total", "Uploads respondidos do cache", "counter",
+               lambda: transcription_cache.stats()['hits'])
+CallbackMetric("transcriber_cache_misses_total", "Uploads não encontrados no cache", "counter",
+               lambda: transcription_cache.stats()['misses'])
+CallbackMetric("transcriber_cache_bytes", "Bytes ocupados pelo cache de transcrições", "gauge",
+               lambda: transcription_cache.stats()['bytes'])
+
+# cache_key de um job cujo SHA-256 do arquivo ainda não foi calculado (upload retomável):
+# o próprio job calcula a chave e consulta o cache antes de decodificar
+CONTENT_KEY_PENDING = "pending"
 
-# Inicializar Whisper
-print("Carregando modelo Whisper (offline)...")
-try:
-    # Usar modelo 'base' que suporta português e é mais rápido que 'small'
-    whisper_model = whisper.load_model("base")
-    print("✓ Whisper pronto para usar! (modelo: base)")
-except Exception as e:
-    print(f"⚠ Aviso ao carregar Whisper: {e}")
-    whisper_model = None
-
-def validate_audio_file(file_path):
-    """Valida se o arquivo de áudio é válido"""
+def file_sha256(file_path):
+    """SHA-256 de um arquivo em disco, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(UPLOAD_WRITE_BYTES)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+def make_cache_key(content_sha256, model_name=None, compute=None, vad=None):
+    """Chave do cache: conteúdo do upload + modelo + opções de decodificação"""
+    options = {
+        "model": model_name or WHISPER_MODEL_NAME,
+        "compute": compute or WHISPER_COMPUTE,
+        "vad": VAD_ENABLED if vad is None else vad,
+        "decode": DECODE_OPTIONS,
+        "chunked": CHUNKED_TRANSCRIPTION,
+        "chunk_max_seconds": CHUNK_MAX_SECONDS
+    }
+    payload = f"{content_sha256}:{json.dumps(options, sort_keys=True)}"
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def validate_audio_file(file_path, info=None):
+    """Valida se o arquivo de áudio é válido (a partir dos cabeçalhos)"""
     try:
-        if file_path.endswith('.wav'):
-            with wave.open(file_path, 'rb') as wf:
-                frames = wf.getnframes()
-                print(f"Validação WAV - Frames: {frames}, Channels: {wf.getnchannels()}, Frame rate: {wf.getframerate()}")
-                if frames == 0:
-                    raise Exception(f"Arquivo WAV vazio (0 frames)")
-                return True
-        else:
-            audio = AudioSegment.from_file(file_path)
-            duration_ms = len(audio)
-            print(f"Validação {Path(file_path).suffix} - Duração: {duration_ms}ms, Channels: {audio.channels}, Frame rate: {audio.frame_rate}")
-            if duration_ms == 0:
-                raise Exception(f"Arquivo vazio (0 ms)")
-            return True
+        if info is None:
+            info = probe_audio_file(file_path)
+        print(f"Validação {Path(file_path).suffix} - Duração: {info['duration']:.1f}s, Codec: {info['codec']}, Channels: {info['channels']}, Frame rate: {info['sample_rate']}")
+        if info.get('frames') == 0:
+            raise Exception(f"Arquivo WAV vazio (0 frames)")
+        if info['duration'] <= 0:
+            raise Exception(f"Arquivo vazio (0 ms)")
+        return True
     except Exception as e:
         print(f"✗ Erro ao validar arquivo: {e}")
         raise
 
 def convert_audio_to_wav(file_path):
     """Converte áudio para WAV usando FFmpeg (mais confiável que pydub)"""
-    if file_path.endswith('.wav'):
+    is_wav = file_path.lower().endswith('.wav')
+    if is_wav and wav_matches_whisper_input(read_wav_header(file_path)):
         validate_audio_file(file_path)
         return file_path
     
@@ -86,7 +2110,9 @@ def convert_audio_to_wav(file_path):
         original_size = os.path.getsize(file_path) / 1024 / 1024
         print(f"Arquivo original: {original_size:.2f} MB")
         
-        wav_path = file_path.replace(Path(file_path).suffix, '.wav')
+        # WAV em outro formato (ex.: 48 kHz estéreo): gravar a conversão ao lado
+        path = Path(file_path)
+        wav_path = str(path.with_name(f"{path.stem}_16k.wav") if is_wav else path.with_suffix('.wav'))
         
         # Use FFmpeg command to convert to WAV with specific parameters
         # -acodec pcm_s16le = PCM 16-bit little-endian (padrão do Whisper)
@@ -128,270 +2154,1820 @@ def convert_audio_to_wav(file_path):
         except Exception as e:
             print(f"⚠ Aviso ao remover arquivo original: {e}")
         
-        return wav_path
+        return wav_path
+        
+    except subprocess.TimeoutExpired:
+        raise Exception("Timeout na conversão FFmpeg (arquivo muito grande)")
+    except Exception as e:
+        print(f"✗ Erro ao converter áudio com FFmpeg: {e}")
+        import traceback
+        traceback.print_exc()
+        raise Exception(f"Falha na conversão de áudio: {str(e)}")
+
+# WAV PCM lido sem FFmpeg: (formato, bits) -> (dtype das amostras, deslocamento, escala para [-1, 1])
+WAV_FORMAT_PCM = 1
+WAV_FORMAT_FLOAT = 3
+WAV_FORMAT_EXTENSIBLE = 0xFFFE
+WAV_PCM_FORMATS = {
+    (WAV_FORMAT_PCM, 8): ('u1', 128, 128.0),
+    (WAV_FORMAT_PCM, 16): ('<i2', 0, 32768.0),
+    (WAV_FORMAT_PCM, 32): ('<i4', 0, 2147483648.0),
+    (WAV_FORMAT_FLOAT, 32): ('<f4', 0, 1.0)
+}
+
+def read_wav_header(file_path):
+    """Lê o cabeçalho RIFF/WAVE: formato, canais, taxa, bits e posição do bloco de dados
+    
+    Retorna None se o arquivo não for um WAV legível (o FFmpeg decide o que fazer)
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            riff = f.read(12)
+            if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+                return None
+            header = {}
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    return None
+                chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+                if chunk_id == b'fmt ':
+                    fmt = f.read(size + size % 2)
+                    if len(fmt) < 16:
+                        return None
+                    audio_format, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+                    if audio_format == WAV_FORMAT_EXTENSIBLE and len(fmt) >= 26:
+                        # WAVE_FORMAT_EXTENSIBLE: o formato real está no início do GUID SubFormat
+                        audio_format = struct.unpack('<H', fmt[24:26])[0]
+                    header.update(
+                        format=audio_format, channels=channels, sample_rate=sample_rate,
+                        block_align=block_align, bits=bits
+                    )
+                elif chunk_id == b'data':
+                    if not header:
+                        return None
+                    header['data_offset'] = f.tell()
+                    # WAVs gravados em stream às vezes declaram tamanho 0 ou 0xFFFFFFFF
+                    available = os.fstat(f.fileno()).st_size - header['data_offset']
+                    header['data_size'] = min(size, available) if size else available
+                    return header
+                else:
+                    f.seek(size + size % 2, 1)
+    except (OSError, struct.error):
+        return None
+
+def wav_matches_whisper_input(header):
+    """Se o WAV já está no formato de entrada do Whisper: PCM 16-bit, mono, 16 kHz"""
+    return (
+        header is not None and header['format'] == WAV_FORMAT_PCM and header['bits'] == 16
+        and header['channels'] == 1 and header['sample_rate'] == SAMPLE_RATE
+    )
+
+def read_pcm_wav(file_path):
+    """Decodifica um WAV PCM sem subprocesso; retorna o array float32 16 kHz mono ou None
+    
+    As amostras são mapeadas em memória (np.memmap): 16 kHz mono 16-bit é apenas
+    convertido para float32; outros WAV PCM são mixados para mono e reamostrados
+    com scipy.signal.resample_poly. Formatos não suportados retornam None (FFmpeg)
+    """
+    header = read_wav_header(file_path)
+    if header is None:
+        return None
+    layout = WAV_PCM_FORMATS.get((header['format'], header['bits']))
+    channels = header['channels']
+    if layout is None or channels < 1 or header['sample_rate'] <= 0 or header['block_align'] != channels * header['bits'] // 8:
+        return None
+    frames = header['data_size'] // header['block_align']
+    if frames == 0:
+        raise Exception("Arquivo de áudio vazio (0 amostras decodificadas)")
+    
+    started = time.time()
+    dtype, shift, scale = layout
+    samples = np.memmap(file_path, dtype=dtype, mode='r', offset=header['data_offset'], shape=(frames, channels))
+    # Uma única cópia em float32: o canal (mono) ou a média dos canais
+    if channels == 1:
+        audio = samples[:, 0].astype(np.float32)
+    else:
+        audio = samples.mean(axis=1, dtype=np.float32)
+    del samples
+    if shift:
+        audio -= shift
+    if scale != 1.0:
+        audio /= scale
+    
+    if header['sample_rate'] != SAMPLE_RATE:
+        from scipy.signal import resample_poly
+        factor = math.gcd(header['sample_rate'], SAMPLE_RATE)
+        audio = resample_poly(audio, SAMPLE_RATE // factor, header['sample_rate'] // factor).astype(np.float32, copy=False)
+    
+    print(
+        f"✓ WAV PCM lido sem FFmpeg ({header['sample_rate']} Hz, {channels} canal(is), {header['bits']} bits): "
+        f"{audio.size / SAMPLE_RATE:.1f}s em {time.time() - started:.2f}s"
+    )
+    return audio
+
+def decode_audio_to_array(file_path):
+    """Decodifica o áudio com FFmpeg direto para um array float32 16 kHz mono (sem WAV intermediário)
+    
+    WAV PCM não passa pelo FFmpeg (read_pcm_wav)
+    """
+    if file_path.lower().endswith('.wav'):
+        audio = read_pcm_wav(file_path)
+        if audio is not None:
+            return audio
+    
+    print(f"Decodificando {file_path} em memória com FFmpeg...")
+    started = time.time()
+    with cpu_budget.lease('ffmpeg') as lease:
+        # -f f32le = PCM float32 bruto no stdout, já no formato que o Whisper consome
+        cmd = [
+            'ffmpeg',
+            '-nostdin',
+            '-loglevel', 'error',
+            '-threads', str(lease['threads']),
+            '-i', file_path,
+            '-f', 'f32le',
+            '-acodec', 'pcm_f32le',
+            '-ar', str(SAMPLE_RATE),
+            '-ac', '1',
+            '-'
+        ]
+        process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        timer = threading.Timer(FFMPEG_TIMEOUT_SECONDS, process.kill)
+        timer.start()
+        try:
+            # Ler o stdout em blocos para um único buffer (o array é uma view sobre ele)
+            buffer = bytearray()
+            while True:
+                chunk = process.stdout.read(1024 * 1024)
+                if not chunk:
+                    break
+                buffer.extend(chunk)
+            stderr = process.stderr.read()
+            returncode = process.wait()
+        finally:
+            timer.cancel()
+    
+    if returncode != 0:
+        if returncode < 0:
+            raise Exception("Timeout na decodificação FFmpeg (arquivo muito grande)")
+        error_msg = stderr.decode(errors='replace')[-500:] if stderr else "Erro desconhecido"
+        raise Exception(f"FFmpeg falhou: {error_msg}")
+    
+    # Descartar um eventual byte parcial no final do stream
+    usable = len(buffer) - len(buffer) % 4
+    audio = np.frombuffer(buffer, dtype=np.float32, count=usable // 4)
+    if audio.size == 0:
+        raise Exception("Arquivo de áudio vazio (0 amostras decodificadas)")
+    
+    print(f"✓ Áudio decodificado: {audio.size / SAMPLE_RATE:.1f}s em {time.time() - started:.2f}s ({audio.nbytes/1024/1024:.2f} MB)")
+    return audio
+
+def _frame_energy_db(audio, frame_samples):
+    """Energia (dB) de cada quadro de frame_samples amostras, vetorizada"""
+    num_frames = len(audio) // frame_samples
+    frames = audio[:num_frames * frame_samples].reshape(num_frames, frame_samples)
+    return 10 * np.log10(np.mean(frames.astype(np.float64) ** 2, axis=1) + 1e-10)
+
+def split_audio_at_silence(audio, max_seconds=None, overlap_seconds=CHUNK_OVERLAP_SECONDS):
+    """Divide o áudio em blocos de até max_seconds, cortando no trecho mais silencioso
+    
+    Retorna uma lista de (início, fim) em amostras. Quando não há silêncio na janela
+    de corte, o corte é seco e o bloco seguinte repete overlap_seconds do anterior.
+    """
+    max_samples = int((max_seconds or CHUNK_MAX_SECONDS) * SAMPLE_RATE)
+    if len(audio) <= max_samples:
+        return [(0, len(audio))]
+    
+    # Quadros de 100 ms, suavizados em ~0,5 s para não cortar em pausas entre sílabas
+    frame_samples = SAMPLE_RATE // 10
+    energy = _frame_energy_db(audio, frame_samples)
+    energy = np.convolve(energy, np.ones(5) / 5, mode='same')
+    overlap_samples = int(overlap_seconds * SAMPLE_RATE)
+    
+    chunks = []
+    start = 0
+    while len(audio) - start > max_samples:
+        # Procurar o ponto de corte na segunda metade do bloco
+        search_from = (start + max_samples // 2) // frame_samples
+        search_to = min((start + max_samples) // frame_samples, len(energy))
+        quietest = search_from + int(np.argmin(energy[search_from:search_to]))
+        if energy[quietest] <= SILENCE_DB:
+            cut = quietest * frame_samples + frame_samples // 2
+            next_start = cut
+        else:
+            cut = start + max_samples
+            next_start = cut - overlap_samples
+        chunks.append((start, cut))
+        start = next_start
+    chunks.append((start, len(audio)))
+    return chunks
+
+def _normalize_text(text):
+    return ' '.join(text.lower().split())
+
+class SegmentMerger:
+    """Une, em ordem, os segmentos de blocos consecutivos com timestamps absolutos
+    
+    Segmentos vazios, que caem na sobreposição com o bloco anterior ou que
+    repetem o último texto são descartados.
+    """
+    
+    def __init__(self):
+        self.segments = []
+        self.last_end = 0.0
+    
+    def add(self, segments, offset):
+        """Acrescenta segmentos de um bloco que começa em `offset`; retorna os aceitos"""
+        accepted = []
+        for segment in segments:
+            start = segment['start'] + offset
+            end = segment['end'] + offset
+            text = segment.get('text', '')
+            if not text.strip():
+                continue
+            if (start + end) / 2 < self.last_end:
+                continue
+            if self.segments and _normalize_text(text) == _normalize_text(self.segments[-1]['text']):
+                continue
+            merged = {**segment, 'id': len(self.segments), 'start': start, 'end': end}
+            self.segments.append(merged)
+            accepted.append(merged)
+            self.last_end = end
+        return accepted
+
+def merge_chunk_results(chunk_results, chunk_offsets):
+    """Une os resultados dos blocos em uma única transcrição com timestamps absolutos"""
+    merger = SegmentMerger()
+    for result, offset in zip(chunk_results, chunk_offsets):
+        merger.add(result.get('segments', []), offset)
+    
+    return {
+        'text': ''.join(segment['text'] for segment in merger.segments),
+        'segments': merger.segments
+    }
+
+def detect_speech_spans(audio, min_silence_seconds=None):
+    """Trechos com fala, em amostras: [(início, fim), ...]
+    
+    Quadros de 30 ms acima do limiar são fala; cada trecho ganha VAD_PADDING_SECONDS
+    de margem e pausas menores que min_silence_seconds são mantidas.
+    """
+    frame_samples = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    energy = _frame_energy_db(audio, frame_samples)
+    if energy.size == 0:
+        return [(0, len(audio))] if len(audio) else []
+    
+    noise_floor = np.percentile(energy, 10)
+    threshold = min(max(SILENCE_DB, noise_floor + VAD_MARGIN_DB), VAD_MAX_THRESHOLD_DB)
+    speech = energy > threshold
+    
+    # Margem em volta da fala (dilatação da máscara)
+    padding = int(round(VAD_PADDING_SECONDS / VAD_FRAME_SECONDS))
+    if padding:
+        speech = np.convolve(speech.astype(np.int32), np.ones(2 * padding + 1, dtype=np.int32), mode='same') > 0
+    
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if starts.size == 0:
+        return []
+    
+    # Unir trechos separados por pausas curtas
+    min_gap = int(round((min_silence_seconds or VAD_MIN_SILENCE_SECONDS) / VAD_FRAME_SECONDS))
+    keep = np.concatenate(([True], starts[1:] - ends[:-1] >= min_gap))
+    starts = starts[keep]
+    ends = np.concatenate((ends[np.flatnonzero(keep[1:])], ends[-1:]))
+    
+    spans = [(int(start) * frame_samples, int(end) * frame_samples) for start, end in zip(starts, ends)]
+    # A sobra final (menor que um quadro) acompanha o último quadro
+    if ends[-1] == energy.size:
+        spans[-1] = (spans[-1][0], len(audio))
+    return spans
+
+def remove_silence(audio, min_silence_seconds=None):
+    """Remove os trechos sem fala; retorna (áudio só com fala, mapa de tempos, fração removida)
+    
+    O mapa é uma lista de (início no áudio filtrado, início no original, duração),
+    em segundos, usada por map_vad_time para voltar à linha do tempo original.
+    """
+    spans = detect_speech_spans(audio, min_silence_seconds)
+    time_map = []
+    kept = 0
+    for start, end in spans:
+        time_map.append((kept / SAMPLE_RATE, start / SAMPLE_RATE, (end - start) / SAMPLE_RATE))
+        kept += end - start
+    speech_audio = np.concatenate([audio[start:end] for start, end in spans]) if spans else audio[:0]
+    skipped_fraction = 1 - kept / len(audio) if len(audio) else 0.0
+    return speech_audio, time_map, skipped_fraction
+
+def map_vad_time(seconds, time_map):
+    """Converte um instante do áudio filtrado para a linha do tempo original"""
+    if not time_map:
+        return seconds
+    index = bisect.bisect_right([kept for kept, _, _ in time_map], seconds) - 1
+    kept, original, duration = time_map[max(index, 0)]
+    return original + min(max(seconds - kept, 0.0), duration)
+
+def remap_segments(result, time_map):
+    """Ajusta os tempos dos segmentos (e palavras) do Whisper para o áudio original"""
+    for segment in result.get('segments', []):
+        segment['start'] = map_vad_time(segment['start'], time_map)
+        segment['end'] = map_vad_time(segment['end'], time_map)
+        for word in segment.get('words', []) or []:
+            word['start'] = map_vad_time(word['start'], time_map)
+            word['end'] = map_vad_time(word['end'], time_map)
+    return result
+
+def extract_audio_metadata(file_path, info=None):
+    """Extrai metadados do arquivo de áudio (a partir da inspeção de cabeçalhos)"""
+    metadata = {
+        "title": "N/A",
+        "artist": "N/A",
+        "duration": "N/A",
+        "format": Path(file_path).suffix[1:].upper() if file_path else "N/A"
+    }
+    
+    try:
+        if info is None:
+            info = probe_audio_file(file_path)
+        tags = info.get('tags', {})
+        metadata["title"] = tags.get('title', 'N/A')
+        metadata["artist"] = tags.get('artist', 'N/A')
+        metadata["duration"] = str(int(info['duration'])) + " segundos"
+        metadata["codec"] = info.get('codec', 'N/A')
+        metadata["sample_rate"] = info.get('sample_rate', 0)
+        metadata["channels"] = info.get('channels', 0)
+    except Exception as e:
+        print(f"Erro ao extrair metadados: {e}")
+    
+    return metadata
+
+@app.get("/")
+async def root():
+    return {"message": "Audio Transcription API - Sistema de Transcrição de Áudio"}
+
+def build_result(transcription_text, filename, metadata, download_file, model_name, compute, vad_report=None,
+                 segments=None):
+    """Resultado público de um job concluído"""
+    result = {
+        "status": "success",
+        "transcription": transcription_text,
+        "segments": segments or [],
+        "metadata": {
+            "filename": filename,
+            "title": metadata.get("title", "N/A"),
+            "artist": metadata.get("artist", "N/A"),
+            "duration": metadata.get("duration", "N/A"),
+            "format": metadata.get("format", "N/A")
+        },
+        "timestamp": datetime.now().isoformat(),
+        "model": "Whisper (Offline)",
+        "model_size": model_name,
+        "compute": compute,
+        "language": "Portuguese (Brazil)",
+        "download_file": download_file
+    }
+    if vad_report is not None:
+        result["vad"] = vad_report
+    return result
+
+def process_audio_background(job_id, file_path, filename, info=None, cache_key=None, model_name=None, compute=None,
+                             profile_timings=None, vad=None):
+    """Processa um upload: decodificação, transcrição e armazenamento do resultado no job
+    
+    Com profile_timings (dict com as etapas já medidas na admissão), o job roda
+    sob JobProfiler e o resumo do perfil vai para result['profile'].
+    Com vad (padrão: VAD_ENABLED), os silêncios longos são removidos antes do Whisper.
+    Com cache_key=CONTENT_KEY_PENDING, o SHA-256 do arquivo é calculado aqui e um
+    resultado em cache conclui o job sem decodificar
+    """
+    file_path_to_cleanup = file_path
+    timings = profile_timings
+    profiler = JobProfiler(job_id) if timings is not None else None
+    
+    try:
+        if profiler:
+            profiler.start()
+        if cache_key == CONTENT_KEY_PENDING:
+            with observe_stage('hash', timings):
+                cache_key = make_cache_key(file_sha256(file_path), model_name, compute, vad)
+            cached = transcription_cache.get(cache_key) if timings is None else None
+            if cached:
+                _finish_job_from_cache(job_id, cached, filename, model_name)
+                jobs_finished.inc(status='completed')
+                return
+        # Inspecionar cabeçalhos uma única vez (se ainda não feito na admissão)
+        if info is None:
+            with observe_stage('validation', timings):
+                info = probe_audio_file(file_path)
+                validate_audio_file(file_path, info)
+        with observe_stage('metadata', timings):
+            metadata = extract_audio_metadata(file_path, info)
+        print(f"[{job_id}] Metadados extraídos: {metadata}")
+        
+        update_job(job_id, status='converting', percent=5)
+        
+        # Decodificar uma única vez, direto para memória
+        print(f"Arquivo original: {file_path} ({os.path.getsize(file_path)/1024/1024:.2f} MB)")
+        with observe_stage('conversion', timings):
+            audio = decode_audio_to_array(file_path)
+        
+        # Pré-filtro de voz: só os trechos com fala vão para o Whisper
+        time_map = None
+        vad_report = None
+        if VAD_ENABLED if vad is None else vad:
+            with observe_stage('vad', timings):
+                original_seconds = audio.size / SAMPLE_RATE
+                audio, time_map, skipped_fraction = remove_silence(audio)
+            vad_report = {
+                "skipped_seconds": round(original_seconds - audio.size / SAMPLE_RATE, 2),
+                "skipped_fraction": round(skipped_fraction, 4)
+            }
+            update_job(job_id, vad_skipped_fraction=vad_report['skipped_fraction'])
+            print(f"[{job_id}] VAD: {skipped_fraction:.0%} do áudio sem fala removido")
+        
+        update_job(job_id, status='processing', percent=10)
+        
+        # Transcrever áudio localmente com Whisper
+        print(f"[{job_id}] Iniciando transcrição com Whisper (offline)...")
+        model_name = model_name or WHISPER_MODEL_NAME
+        compute = compute or WHISPER_COMPUTE
+        decode_started = time.perf_counter()
+        with observe_stage('decode', timings):
+            if time_map is not None and audio.size == 0:
+                transcription_text = "[Áudio não contém fala reconhecível]"
+            else:
+                transcription_text = transcribe_audio_with_whisper(audio, job_id, model_name, compute, time_map)
+        audio_seconds = audio.size / SAMPLE_RATE
+        audio_seconds_processed.inc(audio_seconds)
+        if audio_seconds > 0:
+            real_time_factor.observe((time.perf_counter() - decode_started) / audio_seconds)
+        print(f"[{job_id}] Transcrição completa!")
+        
+        # Salvar no banco de transcrições (texto, segmentos e metadados, com índice de busca)
+        found = get_job_segments(job_id)
+        if found is None:
+            # Job removido durante a decodificação (TTL ou descarte): o texto ainda é salvo
+            print(f"[{job_id}] ⚠ Job não encontrado após a transcrição; salvando sem segmentos")
+            segments = []
+        else:
+            segments = found[0]
+        with observe_stage('save', timings):
+            download_file = save_transcription_file(
+                transcription_text, filename, metadata, segments, job_id, model_name
+            )
+        
+        result = build_result(
+            transcription_text, filename, metadata, download_file, model_name, compute, vad_report, segments
+        )
+        
+        if profiler:
+            result['profile'] = profiler.stop(timings)
+        
+        # Armazenar resultado e marcar como completo
+        update_job(job_id, result=result, status='completed', percent=100, error=None, profile=result.get('profile'))
+        jobs_finished.inc(status='completed')
+        
+        if cache_key:
+            transcription_cache.put(cache_key, {k: v for k, v in result.items() if k != 'profile'})
+        
+        print(f"[{job_id}] ✓ Resultado pronto para envio")
+        
+    except Exception as e:
+        print(f"[{job_id}] ✗ Erro no processamento background: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        
+        # Jobs com erro também guardam o perfil (útil para entender a falha)
+        profile = profiler.stop(timings) if profiler else None
+        update_job(job_id, status='error', error=str(e), percent=0, result=None, profile=profile)
+        jobs_finished.inc(status='error')
+    
+    finally:
+        if profiler and profiler.report is None:
+            profiler.stop(timings)
+        
+        # Sempre limpar arquivos de áudio, mesmo em caso de erro
+        cleanup_count = 0
+        
+        # Remover arquivo original
+        if file_path_to_cleanup and os.path.exists(file_path_to_cleanup):
+            try:
+                os.remove(file_path_to_cleanup)
+                print(f"✓ Arquivo removido: {file_path_to_cleanup}")
+                cleanup_count += 1
+            except Exception as e:
+                print(f"⚠ Erro ao remover {file_path_to_cleanup}: {e}")
+        
+        print(f"✓ Limpeza concluída: {cleanup_count} arquivo(s) removido(s)")
+
+def _job_task(file_path, filename, info, cache_key, model_name, compute, vad):
+    """Argumentos do pipeline guardados no job, para reenfileirá-lo se o processo cair"""
+    return {
+        'file_path': file_path, 'filename': filename, 'info': info, 'cache_key': cache_key,
+        'model': model_name, 'compute': compute, 'vad': vad
+    }
+
+def submit_transcription(job_id, task, profile_timings=None):
+    """Envia um job para transcrição; retorna a posição na fila ou levanta QueueFullError
+    
+    No modo queue o job é apenas liberado no banco de jobs para os processos worker.py;
+    o perfil pedido (com as etapas já medidas na admissão) vai junto nos argumentos do job
+    """
+    if EXECUTION_MODE == 'queue':
+        if profile_timings is not None:
+            update_job(job_id, task={**task, 'profile_timings': profile_timings})
+        return enqueue_for_workers([job_id])
+    return scheduler.submit(
+        job_id, process_audio_background, task['file_path'], task['filename'], task['info'], task['cache_key'],
+        task['model'], task['compute'], profile_timings, task['vad'], audio_seconds=task['info']['duration']
+    )
+
+def enqueue_for_workers(job_ids, held_ids=()):
+    """Modo queue: libera jobs para os workers (um lote conta como uma entrada na fila)"""
+    position = job_store.enqueue(job_ids, TRANSCRIBE_QUEUE_SIZE, held_ids)
+    if position is None:
+        raise QueueFullError(f"Fila de processamento cheia ({TRANSCRIBE_QUEUE_SIZE} jobs aguardando)")
+    return position
+
+def get_queue_position(job_id):
+    """Posição do job (ou lote) na fila de processamento, ou None"""
+    if EXECUTION_MODE == 'queue':
+        return job_store.queue_position(job_id)
+    return scheduler.position(job_id)
+
+def queue_stats():
+    """Estado da fila e dos workers; no modo queue, lido do banco de jobs (vale para todos os processos)"""
+    if EXECUTION_MODE == 'queue':
+        return {**job_store.queue_stats(), "max_queue": TRANSCRIBE_QUEUE_SIZE}
+    return scheduler.stats()
+
+def retry_after():
+    """Estimativa em segundos até haver espaço na fila (Retry-After das respostas 429)
+    
+    No modo queue: segundos de áudio na fila × fator de tempo real medido pelos
+    workers ÷ número de workers, tudo lido do banco de jobs
+    """
+    if EXECUTION_MODE != 'queue':
+        return scheduler.retry_after()
+    stats = job_store.queue_stats()
+    if not (stats['real_time_factor'] and stats['queued_audio_seconds'] and stats['workers']):
+        return DEFAULT_RETRY_AFTER_SECONDS
+    return max(1, math.ceil(stats['real_time_factor'] * stats['queued_audio_seconds'] / stats['workers']))
+
+def get_batch_queue_position(batch):
+    """Posição de um lote na fila; no modo queue, a do job que representa o lote"""
+    if EXECUTION_MODE != 'queue':
+        return scheduler.position(batch['id'])
+    for job_id in batch['job_ids']:
+        position = job_store.queue_position(job_id)
+        if position is not None:
+            return position
+    return None
+
+def run_claimed_job(job):
+    """Executa no worker.py (modo queue) um job retirado da fila
+    
+    Um job que outro worker começou e não terminou é refeito do início.
+    O job que representa um lote executa o lote inteiro (process_batch_background)
+    """
+    task = job.get('task')
+    if task and task.get('batch'):
+        _run_claimed_batch(job)
+        return
+    if not task or not os.path.exists(task['file_path']):
+        _fail_job(job['id'], "Processamento interrompido e o arquivo enviado não está mais disponível")
+        return
+    if job['status'] != 'queued':
+        update_job(job['id'], status='queued', percent=0, segments=[], decoded_seconds=None, eta_seconds=None)
+    print(f"[{job['id']}] Job retirado da fila por {INSTANCE_ID}")
+    profile_timings = task.get('profile_timings')
+    process_audio_background(
+        job['id'], task['file_path'], task['filename'], task['info'], task['cache_key'],
+        task['model'], task['compute'], dict(profile_timings) if profile_timings is not None else None, task['vad']
+    )
+
+def _run_claimed_batch(job):
+    """Executa no worker.py um lote assumido com o job que o representa
+    
+    Os argumentos do lote saem do job antes de começar: se este worker cair,
+    os jobs ainda abertos voltam à fila como jobs individuais
+    """
+    batch = job['task']['batch']
+    update_job(job['id'], task={k: v for k, v in job['task'].items() if k != 'batch'})
+    print(f"[lote {batch['id']}] Lote retirado da fila por {INSTANCE_ID}")
+    items = []
+    for item in batch['items']:
+        member = get_job(item['job_id'])
+        if member is None or member['status'] in FINISHED_STATUSES:
+            continue
+        if not os.path.exists(item['path']):
+            _fail_job(item['job_id'], "Processamento interrompido e o arquivo enviado não está mais disponível")
+            continue
+        items.append(item)
+    if items:
+        process_batch_background(batch['id'], items, job['task']['model'], job['task']['compute'], job['task']['vad'])
+
+def run_queue_worker(concurrency=None, stop_event=None):
+    """Laço do worker.py: consome a fila do banco de jobs até stop_event ser sinalizado"""
+    concurrency = concurrency or TRANSCRIBE_WORKERS
+    stop_event = stop_event or threading.Event()
+    
+    def consume():
+        while not stop_event.is_set():
+            try:
+                job = job_store.claim_next()
+            except Exception as e:
+                print(f"⚠ Erro ao consultar a fila de jobs: {e}")
+                job = None
+            if job is None:
+                stop_event.wait(QUEUE_POLL_SECONDS)
+                continue
+            try:
+                run_claimed_job(job)
+            except Exception as e:
+                print(f"[{job['id']}] ✗ Erro não tratado no worker: {e}")
+    
+    def renew():
+        while True:
+            try:
+                job_store.renew_leases()
+                job_store.register_worker(concurrency, real_time_factor.mean())
+            except Exception as e:
+                print(f"⚠ Erro ao renovar leases dos jobs: {e}")
+            if stop_event.wait(JOB_LEASE_SECONDS / 3):
+                return
+    
+    threads = [threading.Thread(target=renew, name="job-leases", daemon=True)] + [
+        threading.Thread(target=consume, name=f"queue-worker-{i + 1}", daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"✓ Worker {INSTANCE_ID} consumindo a fila de jobs ({concurrency} job(s) simultâneo(s))")
+    for thread in threads:
+        thread.join()
+    job_store.unregister_worker()
+
+def recover_interrupted_jobs():
+    """Reenfileira os jobs cujo processo dono parou de renovar o lease (JOB_STORE=sqlite)
+    
+    Jobs de lote voltam como jobs individuais. Sem o arquivo enviado (ou sem os
+    argumentos do pipeline), o job é finalizado com erro
+    """
+    recovered = 0
+    for job in job_store.claim_interrupted():
+        task = job.get('task')
+        if not task or not os.path.exists(task['file_path']):
+            _fail_job(job['id'], "Processamento interrompido e o arquivo enviado não está mais disponível")
+            continue
+        update_job(job['id'], status='queued', percent=0, segments=[], decoded_seconds=None, eta_seconds=None)
+        try:
+            submit_transcription(job['id'], task)
+            recovered += 1
+        except QueueFullError:
+            # Fila cheia: liberar o job para a próxima verificação (deste ou de outro processo)
+            job_store.release(job['id'])
+    if recovered:
+        print(f"✓ {recovered} job(s) interrompido(s) reenfileirado(s)")
+    return recovered
+
+def _job_lease_loop(stop_event):
+    """Renova os leases dos jobs deste processo e reassume jobs de processos que caíram"""
+    while True:
+        try:
+            job_store.renew_leases()
+            recover_interrupted_jobs()
+        except Exception as e:
+            print(f"⚠ Erro ao renovar leases dos jobs: {e}")
+        if stop_event.wait(JOB_LEASE_SECONDS / 3):
+            return
+
+def _fail_job(job_id, error):
+    print(f"[{job_id}] ✗ Erro no processamento background: {error}")
+    update_job(job_id, status='error', error=str(error), percent=0, result=None)
+    jobs_finished.inc(status='error')
+
+def process_batch_background(batch_id, items, model_name=None, compute=None, vad=None):
+    """Processa um lote enviado a /transcribe/batch
+    
+    Clipes de até BATCH_CLIP_MAX_SECONDS são decodificados juntos em grupos de
+    BATCH_DECODE_SIZE (sem VAD: a janela do Whisper já é de tamanho fixo);
+    arquivos mais longos passam por process_audio_background.
+    Cada item: job_id, path, filename, info e cache_key.
+    """
+    model_name = model_name or WHISPER_MODEL_NAME
+    compute = compute or WHISPER_COMPUTE
+    clips = []
+    long_items = []
+    print(f"[lote {batch_id}] {len(items)} arquivo(s) para transcrever")
+    
+    for item in items:
+        if item['info']['duration'] > BATCH_CLIP_MAX_SECONDS:
+            long_items.append(item)
+            continue
+        job_id = item['job_id']
+        try:
+            with observe_stage('metadata'):
+                metadata = extract_audio_metadata(item['path'], item['info'])
+            update_job(job_id, status='converting', percent=5)
+            with observe_stage('conversion'):
+                audio = decode_audio_to_array(item['path'])
+            if audio.size == 0:
+                raise Exception("Áudio vazio (0 amostras)")
+            update_job(job_id, status='processing', percent=10)
+            clips.append((item, metadata, audio))
+        except Exception as e:
+            _fail_job(job_id, e)
+        finally:
+            if os.path.exists(item['path']):
+                os.remove(item['path'])
+    
+    for start in range(0, len(clips), BATCH_DECODE_SIZE):
+        group = clips[start:start + BATCH_DECODE_SIZE]
+        audios = [audio for _, _, audio in group]
+        decode_started = time.perf_counter()
+        try:
+            with observe_stage('decode'):
+                if EXECUTION_MODE == 'process':
+                    texts = _submit_to_process_pool(_decode_batch_in_worker, audios, model_name, compute)
+                else:
+                    with model_registry.use(model_name, compute) as model:
+                        texts = decode_clip_batch(model, audios)
+        except Exception as e:
+            for item, _, _ in group:
+                _fail_job(item['job_id'], f"Erro ao transcrever áudio: {e}")
+            continue
+        
+        audio_seconds = sum(audio.size for audio in audios) / SAMPLE_RATE
+        audio_seconds_processed.inc(audio_seconds)
+        if audio_seconds > 0:
+            real_time_factor.observe((time.perf_counter() - decode_started) / audio_seconds)
+        
+        for (item, metadata, audio), text in zip(group, texts):
+            try:
+                # Decodificação em lote sem timestamps: o clipe inteiro é um segmento
+                segments = [{"id": 0, "start": 0.0, "end": round(audio.size / SAMPLE_RATE, 2), "text": text}] if text else []
+                text = text or "[Áudio não contém fala reconhecível]"
+                with observe_stage('save'):
+                    download_file = save_transcription_file(
+                        text, item['filename'], metadata, segments, item['job_id'], model_name
+                    )
+                result = build_result(text, item['filename'], metadata, download_file, model_name, compute,
+                                      segments=segments)
+                update_job(item['job_id'], result=result, segments=segments, status='completed', percent=100, error=None)
+                jobs_finished.inc(status='completed')
+                if item['cache_key']:
+                    transcription_cache.put(item['cache_key'], result)
+            except Exception as e:
+                _fail_job(item['job_id'], e)
+    
+    # Arquivos longos: caminho normal (blocos, progresso por janela etc.)
+    for item in long_items:
+        process_audio_background(
+            item['job_id'], item['path'], item['filename'], item['info'], item['cache_key'], model_name, compute,
+            None, vad
+        )
+    
+    print(f"[lote {batch_id}] ✓ Lote concluído")
+
+class UploadError(Exception):
+    """Erro no recebimento de um upload, com o status HTTP correspondente"""
+    
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+class StreamingUploadReceiver:
+    """Recebe um corpo multipart/form-data direto do stream da requisição
+    
+    Cada arquivo é gravado em UPLOAD_DIR com um nome único (sem usar o nome
+    enviado pelo cliente), enquanto o SHA-256 e o tamanho são calculados. A
+    gravação é assíncrona, então o event loop continua atendendo outras requisições.
+    """
+    
+    def __init__(self, allowed_extensions, max_files=1):
+        self.allowed_extensions = allowed_extensions
+        self.max_files = max_files
+        self.files = []
+        self.fields = {}
+        self._pending = []
+        self._open_parts = []
+        self._part = None
+        self._part_headers = {}
+        self._header_field = b''
+        self._header_value = b''
+    
+    # Callbacks síncronos do parser: apenas registram eventos, que são
+    # processados (gravados em disco) de forma assíncrona em _flush
+    def _on_part_begin(self):
+        self._part_headers = {}
+    
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+    
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+    
+    def _on_header_end(self):
+        self._part_headers[self._header_field.lower()] = self._header_value
+        self._header_field = b''
+        self._header_value = b''
+    
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._part_headers.get(b'content-disposition', b''))
+        name = options.get(b'name', b'').decode('utf-8', 'replace')
+        filename = options.get(b'filename', b'').decode('utf-8', 'replace')
+        if filename:
+            self._part = {'kind': 'file', 'name': name, 'filename': os.path.basename(filename)}
+        else:
+            self._part = {'kind': 'field', 'name': name, 'data': bytearray()}
+        self._pending.append(('begin', self._part, None))
+    
+    def _on_part_data(self, data, start, end):
+        self._pending.append(('data', self._part, data[start:end]))
+    
+    def _on_part_end(self):
+        self._pending.append(('end', self._part, None))
+    
+    async def receive(self, request):
+        """Lê o corpo inteiro da requisição; levanta UploadError em caso de problema"""
+        content_type, params = parse_options_header(request.headers.get('content-type', ''))
+        if content_type != b'multipart/form-data' or b'boundary' not in params:
+            raise UploadError(400, "Envie o arquivo como multipart/form-data no campo 'file'")
+        
+        # Recusar antes de ler o corpo quando o tamanho declarado já excede o limite
+        declared = request.headers.get('content-length', '')
+        if declared.isdigit() and int(declared) > MAX_UPLOAD_BYTES * self.max_files + MAX_FORM_FIELD_BYTES:
+            raise UploadError(413, f"Arquivo muito grande (máximo {MAX_UPLOAD_BYTES // 1024 // 1024} MB)")
+        
+        parser = MultipartParser(params[b'boundary'], callbacks={
+            'on_part_begin': self._on_part_begin,
+            'on_part_data': self._on_part_data,
+            'on_part_end': self._on_part_end,
+            'on_header_field': self._on_header_field,
+            'on_header_value': self._on_header_value,
+            'on_header_end': self._on_header_end,
+            'on_headers_finished': self._on_headers_finished
+        })
+        try:
+            async for chunk in request.stream():
+                parser.write(chunk)
+                await self._flush()
+            parser.finalize()
+            await self._flush()
+        except Exception as e:
+            await self.discard()
+            if isinstance(e, UploadError):
+                raise
+            raise UploadError(400, f"Upload inválido: {str(e)}")
+        
+        if not self.files:
+            raise UploadError(400, "Nenhum arquivo enviado (campo 'file')")
+        return self
+    
+    async def _flush(self):
+        pending, self._pending = self._pending, []
+        for event, part, data in pending:
+            if part['kind'] == 'field':
+                if event == 'data':
+                    part['data'] += data
+                    if len(part['data']) > MAX_FORM_FIELD_BYTES:
+                        raise UploadError(413, f"Campo '{part['name']}' muito grande")
+                elif event == 'end':
+                    self.fields[part['name']] = part['data'].decode('utf-8', 'replace')
+            elif event == 'begin':
+                if len(self.files) + len(self._open_parts) >= self.max_files:
+                    raise UploadError(400, f"Máximo de {self.max_files} arquivo(s) por requisição")
+                extension = Path(part['filename']).suffix.lower()
+                if extension not in self.allowed_extensions:
+                    raise UploadError(400, f"Formato não suportado. Use: {', '.join(sorted(self.allowed_extensions))}")
+                part['path'] = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{extension}")
+                part['sha256'] = hashlib.sha256()
+                part['size'] = 0
+                part['handle'] = await aiofiles.open(part['path'], 'wb')
+                self._open_parts.append(part)
+            elif event == 'data':
+                part['size'] += len(data)
+                if part['size'] > MAX_UPLOAD_BYTES:
+                    raise UploadError(413, f"Arquivo muito grande (máximo {MAX_UPLOAD_BYTES // 1024 // 1024} MB)")
+                # hashlib libera o GIL em blocos grandes: calcular fora do event loop
+                await run_in_threadpool(part['sha256'].update, data)
+                await part['handle'].write(data)
+            elif event == 'end':
+                await part['handle'].close()
+                self._open_parts.remove(part)
+                self.files.append({
+                    'field': part['name'],
+                    'filename': part['filename'],
+                    'path': part['path'],
+                    'sha256': part['sha256'].hexdigest(),
+                    'size': part['size']
+                })
+    
+    async def discard(self):
+        """Remove todos os arquivos gravados por este upload"""
+        for part in self._open_parts:
+            await part['handle'].close()
+        paths = [part['path'] for part in self._open_parts] + [f['path'] for f in self.files]
+        self._open_parts = []
+        self.files = []
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+class UploadSessionStore:
+    """Sessões de upload retomável em disco, compartilhadas por todos os processos da API
+    
+    Cada sessão é um diretório com session.json, o arquivo de destino (criado
+    esparso com o tamanho final) e um marcador por bloco recebido com o SHA-256
+    do bloco. Os blocos são gravados com os.pwrite na posição final, então
+    finalizar a sessão é apenas renomear o arquivo, sem reler os dados: o SHA-256
+    do arquivo (a mesma chave de conteúdo de /transcribe) é calculado pelo job,
+    antes de consultar o cache. A sessão só é removida depois que o job é
+    aceito: se a fila estiver cheia, restore devolve o arquivo à sessão.
+    """
+    
+    def __init__(self, root, chunk_size):
+        self.root = root
+        self.chunk_size = chunk_size
+        os.makedirs(root, exist_ok=True)
+    
+    def _dir(self, upload_id):
+        return os.path.join(self.root, upload_id)
+    
+    def data_path(self, session):
+        return os.path.join(self._dir(session['id']), 'data' + Path(session['filename']).suffix.lower())
+    
+    def create(self, filename, size, options):
+        """Cria uma sessão para um arquivo de `size` bytes; retorna a sessão"""
+        self.evict_expired()
+        session = {
+            'id': uuid.uuid4().hex,
+            'filename': filename,
+            'size': size,
+            'chunk_size': self.chunk_size,
+            'options': options,
+            'created_at': time.time()
+        }
+        os.makedirs(os.path.join(self._dir(session['id']), 'chunks'))
+        with open(self.data_path(session), 'wb') as f:
+            f.truncate(size)
+        with open(os.path.join(self._dir(session['id']), 'session.json'), 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        return session
+    
+    def get(self, upload_id):
+        """Retorna a sessão, ou None se não existir (ID inválido, finalizada ou expirada)"""
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+            return None
+        try:
+            with open(os.path.join(self._dir(upload_id), 'session.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def chunk_count(self, session):
+        return math.ceil(session['size'] / session['chunk_size'])
+    
+    def chunk_length(self, session, index):
+        return min(session['chunk_size'], session['size'] - index * session['chunk_size'])
+    
+    def write_at(self, fd, digest, data, position):
+        """Grava `data` em `position` (sem mover o cursor do arquivo) e atualiza o SHA-256"""
+        digest.update(data)
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(fd, view, position)
+            view = view[written:]
+            position += written
+    
+    def mark_chunk(self, session, index, sha256):
+        """Registra um bloco recebido por completo (escrita atômica do marcador)"""
+        marker = os.path.join(self._dir(session['id']), 'chunks', str(index))
+        with open(f"{marker}.{uuid.uuid4().hex}", 'w') as f:
+            f.write(sha256)
+        os.replace(f.name, marker)
+    
+    def received(self, session):
+        """Blocos recebidos: {índice: SHA-256}"""
+        chunks_dir = os.path.join(self._dir(session['id']), 'chunks')
+        chunks = {}
+        for name in os.listdir(chunks_dir) if os.path.isdir(chunks_dir) else []:
+            if name.isdigit():
+                with open(os.path.join(chunks_dir, name)) as f:
+                    chunks[int(name)] = f.read()
+        return chunks
+    
+    def received_ranges(self, session):
+        """Intervalos de bytes já recebidos, [início, fim), unindo blocos contíguos"""
+        ranges = []
+        for index in sorted(self.received(session)):
+            start = index * session['chunk_size']
+            end = start + self.chunk_length(session, index)
+            if ranges and ranges[-1][1] == start:
+                ranges[-1][1] = end
+            else:
+                ranges.append([start, end])
+        return ranges
+    
+    def finalize(self, session):
+        """Move o arquivo completo para UPLOAD_DIR; retorna o upload no formato de StreamingUploadReceiver
+        
+        Enquanto o arquivo está fora da sessão, novos blocos e outra finalização
+        recebem 409; a sessão continua existindo até discard (job aceito) ou restore.
+        sha256 é None: o job calcula a chave de conteúdo (CONTENT_KEY_PENDING)
+        """
+        chunks = self.received(session)
+        missing = [index for index in range(self.chunk_count(session)) if index not in chunks]
+        if missing:
+            raise UploadError(409, f"Upload incompleto: faltam {len(missing)} bloco(s)")
         
-    except subprocess.TimeoutExpired:
-        raise Exception("Timeout na conversão FFmpeg (arquivo muito grande)")
-    except Exception as e:
-        print(f"✗ Erro ao converter áudio com FFmpeg: {e}")
-        import traceback
-        traceback.print_exc()
-        raise Exception(f"Falha na conversão de áudio: {str(e)}")
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{Path(session['filename']).suffix.lower()}")
+        try:
+            os.rename(self.data_path(session), path)
+        except FileNotFoundError:
+            raise UploadError(409, "Upload já finalizado")
+        return {'filename': session['filename'], 'path': path, 'sha256': None, 'size': session['size']}
+    
+    def restore(self, session, received):
+        """Devolve à sessão o arquivo de um job recusado, para repetir a finalização"""
+        if os.path.exists(received['path']):
+            os.rename(received['path'], self.data_path(session))
+    
+    def discard(self, upload_id):
+        shutil.rmtree(self._dir(upload_id), ignore_errors=True)
+    
+    def evict_expired(self):
+        """Remove sessões abandonadas há mais de UPLOAD_SESSION_TTL_SECONDS"""
+        now = time.time()
+        for upload_id in os.listdir(self.root):
+            session = self.get(upload_id)
+            if session is not None and now - session['created_at'] > UPLOAD_SESSION_TTL_SECONDS:
+                self.discard(upload_id)
+                print(f"✓ Sessão de upload expirada removida: {upload_id}")
 
-def extract_audio_metadata(file_path):
-    """Extrai metadados do arquivo de áudio"""
-    try:
-        from mutagen.wave import WAVE
-        from mutagen.mp3 import MP3
-        from mutagen.flac import FLAC
-        
-        metadata = {
-            "title": "N/A",
-            "artist": "N/A",
-            "duration": "N/A",
-            "format": Path(file_path).suffix[1:].upper()
+upload_sessions = UploadSessionStore(UPLOAD_SESSION_DIR, UPLOAD_CHUNK_BYTES)
+
+# Documentação do corpo multipart (lido manualmente do stream em /transcribe)
+UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "file": {"type": "string", "format": "binary"},
+                        "model": {"type": "string", "enum": AVAILABLE_MODELS, "default": WHISPER_MODEL_NAME},
+                        "compute": {"type": "string", "enum": list(COMPUTE_TYPES), "default": WHISPER_COMPUTE}
+                    },
+                    "required": ["file"]
+                }
+            }
         }
+    }
+}
+
+def _complete_from_cache(cached, filename, model_name=None, compute=None):
+    """Cria um job já concluído a partir de um resultado em cache; retorna (job_id, result)"""
+    job_id = create_job(filename, model_name, compute)
+    return job_id, _finish_job_from_cache(job_id, cached, filename, model_name)
+
+def _finish_job_from_cache(job_id, cached, filename, model_name=None):
+    """Conclui um job com um resultado em cache (salvo como nova transcrição); retorna o resultado"""
+    metadata = {**cached.get('metadata', {}), "filename": filename}
+    download_file = save_transcription_file(
+        cached['transcription'], filename, metadata, cached.get('segments'), job_id, model_name
+    )
+    result = {
+        **cached,
+        "metadata": metadata,
+        "timestamp": datetime.now().isoformat(),
+        "download_file": download_file,
+        "cached": True
+    }
+    
+    update_job(job_id, result=result, segments=list(result.get('segments', [])), status='completed', percent=100)
+    print(f"[{job_id}] ✓ Resultado servido do cache: {filename}")
+    return result
+
+def _respond_from_cache(cached, filename, model_name=None, compute=None):
+    """Resposta de /transcribe para um upload encontrado no cache"""
+    job_id, result = _complete_from_cache(cached, filename, model_name, compute)
+    return JSONResponse(
+        status_code=200,
+        content={"status": "completed", "job_id": job_id, "result": result}
+    )
+
+def _transcription_options(fields, request):
+    """Modelo, precisão e VAD: campos do formulário ou ?model=/?compute=/?vad= (padrões do ambiente)"""
+    model_name = fields.get('model') or request.query_params.get('model') or WHISPER_MODEL_NAME
+    if model_name not in AVAILABLE_MODELS:
+        raise UploadError(400, f"Modelo não suportado. Use: {', '.join(AVAILABLE_MODELS)}")
+    compute = fields.get('compute') or request.query_params.get('compute') or WHISPER_COMPUTE
+    if compute not in COMPUTE_TYPES:
+        raise UploadError(400, f"Precisão não suportada. Use: {', '.join(COMPUTE_TYPES)}")
+    vad = fields.get('vad') or request.query_params.get('vad')
+    vad = vad.lower() in FLAG_TRUE_VALUES if vad else VAD_ENABLED
+    return model_name, compute, vad
+
+@app.post("/transcribe", openapi_extra=UPLOAD_OPENAPI)
+async def transcribe(request: Request):
+    """
+    Endpoint para transcrição de áudio
+    
+    Aceita arquivos de áudio em formatos: MP3, WAV, FLAC, M4A, OGG
+    Parâmetros opcionais: "model" (tiny, base, small) escolhe o modelo Whisper
+    e "compute" (fp32, int8) a precisão das camadas lineares; "vad" (true/false)
+    liga ou desliga a remoção de silêncios antes do Whisper (padrão: VAD_ENABLED)
+    ?profile=true ou o cabeçalho X-Profile: 1 executam o job com cProfile e tracemalloc
+    Retorna: ID do job; o progresso fica em /jobs/{job_id} e o resultado em /jobs/{job_id}/result
+    """
+    try:
+        # Perfil opcional: as etapas medidas aqui entram no relatório do job
+        profile_requested = (
+            request.query_params.get('profile', '').lower() in FLAG_TRUE_VALUES
+            or request.headers.get('x-profile', '').lower() in FLAG_TRUE_VALUES
+        )
+        timings = {} if profile_requested else None
         
+        # Receber o upload em streaming (gravação assíncrona, SHA-256 e tamanho calculados na chegada)
         try:
-            # Tentar MP3
-            if file_path.endswith('.mp3'):
-                audio = MP3(file_path)
-                if audio.tags:
-                    metadata["title"] = str(audio.tags.get('TIT2', 'N/A'))
-                    metadata["artist"] = str(audio.tags.get('TPE1', 'N/A'))
-                metadata["duration"] = str(int(audio.info.length)) + " segundos"
-        except:
-            pass
+            with observe_stage('upload', timings):
+                upload = await StreamingUploadReceiver(ALLOWED_EXTENSIONS).receive(request)
+        except UploadError as e:
+            uploads_received.inc(result='rejected')
+            print(f"⚠ Upload recusado: {e}")
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
         
         try:
-            # Tentar WAV
-            if file_path.endswith('.wav'):
-                audio = WAVE(file_path)
-                info = audio.info
-                metadata["duration"] = str(int(info.length)) + " segundos"
-        except:
-            pass
+            model_name, compute, vad = _transcription_options(upload.fields, request)
+        except UploadError as e:
+            uploads_received.inc(result='rejected')
+            await upload.discard()
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+        
+        return await _start_transcription(upload.files[0], model_name, compute, vad, timings)
         
-        return metadata
     except Exception as e:
-        print(f"Erro ao extrair metadados: {e}")
-        return {
-            "title": "N/A",
-            "artist": "N/A",
-            "duration": "N/A",
-            "format": Path(file_path).suffix[1:].upper() if file_path else "N/A"
+        print(f"Erro ao receber arquivo: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Erro ao processar arquivo: {str(e)}"}
+        )
+
+async def _start_transcription(received, model_name, compute, vad, timings=None, keep_rejected=False):
+    """Cache, validação e enfileiramento de um arquivo já recebido (/transcribe e /uploads)
+    
+    received: {'filename', 'path', 'sha256', 'size'}; com timings (perfil pedido) o cache é ignorado.
+    Sem sha256 (upload retomável), a chave e a consulta ao cache ficam para o job.
+    Com keep_rejected, o arquivo não é removido quando o job é recusado (400 ou 429)
+    """
+    file_path = received['path']
+    filename = received['filename']
+    print(f"Arquivo recebido: {filename} ({received['size']/1024/1024:.2f} MB) -> {file_path}")
+    
+    # Upload idêntico já transcrito com o mesmo modelo e opções: responder do cache
+    if received['sha256'] is None:
+        cache_key = CONTENT_KEY_PENDING
+        cached = None
+    else:
+        cache_key = make_cache_key(received['sha256'], model_name, compute, vad)
+        cached = transcription_cache.get(cache_key) if timings is None else None
+    if cached:
+        uploads_received.inc(result='cached')
+        os.remove(file_path)
+        return _respond_from_cache(cached, filename, model_name, compute)
+    
+    # Inspecionar e validar antes de enfileirar (apenas cabeçalhos, fora do event loop)
+    try:
+        with observe_stage('validation', timings):
+            info = await run_in_threadpool(probe_audio_file, file_path)
+            validate_audio_file(file_path, info)
+    except Exception as e:
+        uploads_received.inc(result='invalid')
+        if not keep_rejected:
+            os.remove(file_path)
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Arquivo de áudio inválido: {str(e)}"}
+        )
+    
+    job_id = create_job(filename, model_name, compute)
+    task = _job_task(file_path, filename, info, cache_key, model_name, compute, vad)
+    update_job(job_id, duration_seconds=info['duration'], task=task)
+    print(f"[{job_id}] Job criado para {filename} ({info['duration']:.1f}s de áudio)")
+    
+    # Enfileirar para os workers de transcrição
+    try:
+        queue_position = submit_transcription(job_id, task, timings)
+    except QueueFullError as e:
+        uploads_received.inc(result='queue_full')
+        discard_job(job_id)
+        if os.path.exists(file_path) and not keep_rejected:
+            os.remove(file_path)
+        print(f"⚠ Upload recusado: {e}")
+        return JSONResponse(
+            status_code=429,
+            content={"error": f"{e}. Tente novamente mais tarde."},
+            headers={"Retry-After": str(retry_after())}
+        )
+    
+    uploads_received.inc(result='accepted')
+    
+    # Retornar imediatamente com status processing
+    return JSONResponse(
+        status_code=202,
+        content={
+            "status": "processing",
+            "job_id": job_id,
+            "queue_position": queue_position,
+            "message": f"Arquivo enviado e processamento iniciado. Verifique /jobs/{job_id} para atualizações."
         }
+    )
 
-@app.get("/")
-async def root():
-    return {"message": "Audio Transcription API - Sistema de Transcrição de Áudio"}
+def _upload_session_response(session):
+    """Estado público de uma sessão de upload retomável"""
+    ranges = upload_sessions.received_ranges(session)
+    received_bytes = sum(end - start for start, end in ranges)
+    return {
+        "upload_id": session['id'],
+        "filename": session['filename'],
+        "size": session['size'],
+        "chunk_size": session['chunk_size'],
+        "chunks": upload_sessions.chunk_count(session),
+        "received": ranges,
+        "received_bytes": received_bytes,
+        "complete": received_bytes == session['size']
+    }
 
-@app.post("/transcribe")
-async def transcribe(file: UploadFile = File(...)):
+@app.post("/uploads")
+async def create_upload_session(request: Request):
     """
-    Endpoint para transcrição de áudio
+    Cria uma sessão de upload retomável
     
-    Aceita arquivos de áudio em formatos: MP3, WAV, FLAC, M4A, OGG
-    Retorna: Transcrição em texto, metadados do áudio, timestamp
+    Corpo JSON: {"filename", "size"} e, opcionalmente, "model", "compute" e "vad"
+    (como em /transcribe). Os blocos de chunk_size bytes são enviados com
+    PUT /uploads/{upload_id}?offset=N, em qualquer ordem e em paralelo;
+    GET /uploads/{upload_id} informa os intervalos recebidos e
+    POST /uploads/{upload_id}/finalize cria o job de transcrição
     """
     try:
-        # Validar tipo de arquivo
-        allowed_extensions = {'.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma', '.aac'}
-        file_extension = Path(file.filename).suffix.lower()
-        
-        if file_extension not in allowed_extensions:
-            return JSONResponse(
-                status_code=400,
-                content={"error": f"Formato não suportado. Use: {', '.join(allowed_extensions)}"}
+        body = await request.json()
+        if not isinstance(body, dict):
+            raise ValueError
+    except ValueError:
+        return JSONResponse(status_code=400, content={"error": "Envie um JSON com 'filename' e 'size'"})
+    
+    filename = os.path.basename(str(body.get('filename') or ''))
+    size = body.get('size')
+    if Path(filename).suffix.lower() not in ALLOWED_EXTENSIONS:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Formato não suportado. Use: {', '.join(sorted(ALLOWED_EXTENSIONS))}"}
+        )
+    if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+        return JSONResponse(status_code=400, content={"error": "'size' deve ser o tamanho do arquivo em bytes"})
+    if size > MAX_UPLOAD_BYTES:
+        return JSONResponse(
+            status_code=413,
+            content={"error": f"Arquivo muito grande (máximo {MAX_UPLOAD_BYTES // 1024 // 1024} MB)"}
+        )
+    
+    fields = {key: str(body[key]) for key in ('model', 'compute', 'vad') if body.get(key) is not None}
+    try:
+        model_name, compute, vad = _transcription_options(fields, request)
+    except UploadError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    
+    session = await run_in_threadpool(
+        upload_sessions.create, filename, size, {'model': model_name, 'compute': compute, 'vad': vad}
+    )
+    print(f"Sessão de upload {session['id']} criada: {filename} ({size/1024/1024:.2f} MB)")
+    return JSONResponse(status_code=201, content=_upload_session_response(session))
+
+@app.get("/uploads/{upload_id}")
+async def get_upload_session(upload_id: str):
+    """Intervalos já recebidos de uma sessão (para retomar o upload após uma queda)"""
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Sessão de upload não encontrada"})
+    return await run_in_threadpool(_upload_session_response, session)
+
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request, offset: int = 0):
+    """Recebe um bloco no corpo da requisição e o grava na posição `offset` do arquivo
+    
+    offset deve ser múltiplo de chunk_size e o corpo deve ter o tamanho exato do
+    bloco (o último pode ser menor). Reenviar um bloco apenas o sobrescreve.
+    """
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Sessão de upload não encontrada"})
+    if offset % session['chunk_size'] or not 0 <= offset < session['size']:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"offset deve ser múltiplo de {session['chunk_size']} e menor que {session['size']}"}
+        )
+    index = offset // session['chunk_size']
+    expected = upload_sessions.chunk_length(session, index)
+    declared = request.headers.get('content-length', '')
+    if declared.isdigit() and int(declared) != expected:
+        return JSONResponse(status_code=400, content={"error": f"O bloco em {offset} deve ter {expected} bytes"})
+    
+    try:
+        fd = os.open(upload_sessions.data_path(session), os.O_WRONLY)
+    except FileNotFoundError:
+        return JSONResponse(status_code=409, content={"error": "Upload já finalizado"})
+    digest = hashlib.sha256()
+    written = 0
+    buffer = bytearray()
+    try:
+        async for piece in request.stream():
+            if written + len(buffer) + len(piece) > expected:
+                return JSONResponse(status_code=400, content={"error": f"O bloco em {offset} deve ter {expected} bytes"})
+            buffer += piece
+            if len(buffer) >= UPLOAD_WRITE_BYTES:
+                await run_in_threadpool(upload_sessions.write_at, fd, digest, bytes(buffer), offset + written)
+                written += len(buffer)
+                buffer = bytearray()
+        if buffer:
+            await run_in_threadpool(upload_sessions.write_at, fd, digest, bytes(buffer), offset + written)
+            written += len(buffer)
+    finally:
+        os.close(fd)
+    
+    if written != expected:
+        return JSONResponse(
+            status_code=400,
+            content={"error": f"Bloco incompleto: {written} de {expected} bytes recebidos"}
+        )
+    upload_sessions.mark_chunk(session, index, digest.hexdigest())
+    return await run_in_threadpool(_upload_session_response, session)
+
+@app.post("/uploads/{upload_id}/finalize")
+async def finalize_upload_session(upload_id: str):
+    """Conclui uma sessão com todos os blocos recebidos e inicia a transcrição (resposta igual a /transcribe)
+    
+    A sessão só é removida quando o job é aceito (ou respondido do cache): com a fila
+    cheia (429) ou o áudio recusado (400), a finalização pode ser repetida sem reenviar blocos
+    """
+    session = upload_sessions.get(upload_id)
+    if session is None:
+        return JSONResponse(status_code=404, content={"error": "Sessão de upload não encontrada"})
+    try:
+        received = await run_in_threadpool(upload_sessions.finalize, session)
+        options = session['options']
+        try:
+            response = await _start_transcription(
+                received, options['model'], options['compute'], options['vad'], keep_rejected=True
             )
+        except BaseException:
+            upload_sessions.restore(session, received)
+            raise
+        if response.status_code in (200, 202):
+            await run_in_threadpool(upload_sessions.discard, upload_id)
+        else:
+            upload_sessions.restore(session, received)
+        return response
+    except UploadError as e:
+        return JSONResponse(status_code=e.status_code, content={"error": str(e)})
+    except Exception as e:
+        print(f"Erro ao finalizar upload: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Erro ao processar arquivo: {str(e)}"}
+        )
+
+@app.delete("/uploads/{upload_id}")
+async def cancel_upload_session(upload_id: str):
+    """Cancela uma sessão de upload e remove os blocos já recebidos"""
+    if upload_sessions.get(upload_id) is None:
+        return JSONResponse(status_code=404, content={"error": "Sessão de upload não encontrada"})
+    await run_in_threadpool(upload_sessions.discard, upload_id)
+    return {"upload_id": upload_id, "status": "cancelled"}
+
+def _extract_zip_upload(zip_path):
+    """Extrai os áudios de um .zip enviado em lote (nomes únicos, SHA-256 calculado na cópia)"""
+    extracted = []
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            members = [
+                member for member in archive.infolist()
+                if not member.is_dir()
+                and Path(member.filename).suffix.lower() in ALLOWED_EXTENSIONS
+                and not os.path.basename(member.filename).startswith('.')
+            ]
+            if len(members) > BATCH_MAX_FILES:
+                raise UploadError(400, f"Máximo de {BATCH_MAX_FILES} arquivos por lote")
+            for member in members:
+                if member.file_size > MAX_UPLOAD_BYTES:
+                    raise UploadError(413, f"Arquivo muito grande no .zip: {member.filename}")
+                entry = {
+                    'field': 'file',
+                    'filename': os.path.basename(member.filename),
+                    'path': os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{Path(member.filename).suffix.lower()}"),
+                    'size': 0
+                }
+                extracted.append(entry)
+                digest = hashlib.sha256()
+                with archive.open(member) as source, open(entry['path'], 'wb') as target:
+                    while True:
+                        chunk = source.read(ZIP_READ_CHUNK_BYTES)
+                        if not chunk:
+                            break
+                        # O tamanho declarado no .zip pode ser falso: limitar também na cópia
+                        entry['size'] += len(chunk)
+                        if entry['size'] > MAX_UPLOAD_BYTES:
+                            raise UploadError(413, f"Arquivo muito grande no .zip: {member.filename}")
+                        digest.update(chunk)
+                        target.write(chunk)
+                entry['sha256'] = digest.hexdigest()
+        return extracted
+    except Exception as e:
+        for entry in extracted:
+            if os.path.exists(entry['path']):
+                os.remove(entry['path'])
+        if isinstance(e, UploadError):
+            raise
+        raise UploadError(400, f"Arquivo .zip inválido: {str(e)}")
+    finally:
+        if os.path.exists(zip_path):
+            os.remove(zip_path)
+
+# Documentação do corpo multipart de /transcribe/batch
+BATCH_UPLOAD_OPENAPI = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "file": {"type": "array", "items": {"type": "string", "format": "binary"}},
+                        "model": {"type": "string", "enum": AVAILABLE_MODELS, "default": WHISPER_MODEL_NAME},
+                        "compute": {"type": "string", "enum": list(COMPUTE_TYPES), "default": WHISPER_COMPUTE}
+                    },
+                    "required": ["file"]
+                }
+            }
+        }
+    }
+}
+
+@app.post("/transcribe/batch", openapi_extra=BATCH_UPLOAD_OPENAPI)
+async def transcribe_batch(request: Request):
+    """
+    Transcrição em lote: vários arquivos (campo "file" repetido) ou um .zip
+    
+    Cada arquivo vira um job; clipes curtos são decodificados juntos pelo Whisper.
+    Retorna: ID do lote; o estado de todos os arquivos fica em /batches/{batch_id}
+    """
+    try:
+        upload = StreamingUploadReceiver(ALLOWED_EXTENSIONS | {'.zip'}, max_files=BATCH_MAX_FILES)
+        try:
+            with observe_stage('upload'):
+                await upload.receive(request)
+            model_name, compute, vad = _transcription_options(upload.fields, request)
+        except UploadError as e:
+            uploads_received.inc(result='rejected')
+            await upload.discard()
+            print(f"⚠ Lote recusado: {e}")
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
         
-        # Salvar arquivo temporário
-        file_path = os.path.join(UPLOAD_DIR, file.filename)
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        print(f"Arquivo recebido: {file.filename}")
+        # Expandir arquivos .zip
+        files = []
+        try:
+            for received in list(upload.files):
+                if Path(received['filename']).suffix.lower() == '.zip':
+                    upload.files.remove(received)
+                    files.extend(await run_in_threadpool(_extract_zip_upload, received['path']))
+                else:
+                    files.append(received)
+            if not files:
+                raise UploadError(400, "Nenhum arquivo de áudio no lote")
+            if len(files) > BATCH_MAX_FILES:
+                raise UploadError(400, f"Máximo de {BATCH_MAX_FILES} arquivos por lote")
+        except UploadError as e:
+            uploads_received.inc(result='rejected')
+            for received in files + upload.files:
+                if os.path.exists(received['path']):
+                    os.remove(received['path'])
+            return JSONResponse(status_code=e.status_code, content={"error": str(e)})
         
-        # Iniciar thread background
-        def process_audio_background():
-            file_path_to_cleanup = file_path
-            wav_path_to_cleanup = None
+        job_ids = []
+        items = []
+        for received in files:
+            filename = received['filename']
+            file_path = received['path']
+            cache_key = make_cache_key(received['sha256'], model_name, compute, vad)
+            cached = transcription_cache.get(cache_key)
+            if cached:
+                uploads_received.inc(result='cached')
+                os.remove(file_path)
+                job_id, _ = _complete_from_cache(cached, filename, model_name, compute)
+                job_ids.append(job_id)
+                continue
             
+            job_id = create_job(filename, model_name, compute)
+            job_ids.append(job_id)
             try:
-                # Extrair metadados (antes de converter)
-                metadata = extract_audio_metadata(file_path)
-                print(f"Metadados extraídos: {metadata}")
-                
-                with progress_tracker['lock']:
-                    progress_tracker['status'] = 'converting'
-                    progress_tracker['current_percent'] = 5
-                
-                # Converter para WAV se necessário
-                print(f"Arquivo original: {file_path} ({os.path.getsize(file_path)/1024/1024:.2f} MB)")
-                wav_path = convert_audio_to_wav(file_path)
-                wav_path_to_cleanup = wav_path
-                print(f"Arquivo WAV convertido: {wav_path} ({os.path.getsize(wav_path)/1024/1024:.2f} MB)")
-                
-                with progress_tracker['lock']:
-                    progress_tracker['status'] = 'processing'
-                    progress_tracker['current_percent'] = 10
-                
-                # Transcrever áudio localmente com Whisper
-                print("Iniciando transcrição com Whisper (offline)...")
-                transcription_text = transcribe_audio_with_whisper(wav_path)
-                print("Transcrição completa!")
-                
-                # Salvar arquivo de transcrição
-                txt_file_path = save_transcription_file(transcription_text, file.filename)
-                txt_filename = os.path.basename(txt_file_path) if txt_file_path else None
-                
-                # Preparar resultado
-                result = {
-                    "status": "success",
-                    "transcription": transcription_text,
-                    "metadata": {
-                        "filename": file.filename,
-                        "title": metadata.get("title", "N/A"),
-                        "artist": metadata.get("artist", "N/A"),
-                        "duration": metadata.get("duration", "N/A"),
-                        "format": metadata.get("format", "N/A")
-                    },
-                    "timestamp": datetime.now().isoformat(),
-                    "model": "Whisper (Offline)",
-                    "language": "Portuguese (Brazil)",
-                    "download_file": txt_filename
-                }
-                
-                # Armazenar resultado e marcar como completo
-                with progress_tracker['lock']:
-                    progress_tracker['result'] = result
-                    progress_tracker['status'] = 'completed'
-                    progress_tracker['current_percent'] = 100
-                    progress_tracker['error'] = None
-                
-                print("✓ Resultado pronto para envio")
-                
+                with observe_stage('validation'):
+                    info = await run_in_threadpool(probe_audio_file, file_path)
+                    validate_audio_file(file_path, info)
             except Exception as e:
-                print(f"✗ Erro no processamento background: {str(e)}")
-                import traceback
-                traceback.print_exc()
-                
-                with progress_tracker['lock']:
-                    progress_tracker['status'] = 'error'
-                    progress_tracker['error'] = str(e)
-                    progress_tracker['current_percent'] = 0
-                    progress_tracker['result'] = None
-            
-            finally:
-                # Sempre limpar arquivos de áudio, mesmo em caso de erro
-                cleanup_count = 0
-                
-                # Remover arquivo original
-                if file_path_to_cleanup and os.path.exists(file_path_to_cleanup):
-                    try:
-                        os.remove(file_path_to_cleanup)
-                        print(f"✓ Arquivo removido: {file_path_to_cleanup}")
-                        cleanup_count += 1
-                    except Exception as e:
-                        print(f"⚠ Erro ao remover {file_path_to_cleanup}: {e}")
-                
-                # Remover arquivo WAV
-                if wav_path_to_cleanup and os.path.exists(wav_path_to_cleanup):
-                    try:
-                        os.remove(wav_path_to_cleanup)
-                        print(f"✓ Arquivo removido: {wav_path_to_cleanup}")
-                        cleanup_count += 1
-                    except Exception as e:
-                        print(f"⚠ Erro ao remover {wav_path_to_cleanup}: {e}")
-                
-                print(f"✓ Limpeza concluída: {cleanup_count} arquivo(s) removido(s)")
-        
-        # Iniciar thread background
-        thread = threading.Thread(target=process_audio_background, daemon=True)
-        thread.start()
+                uploads_received.inc(result='invalid')
+                os.remove(file_path)
+                _fail_job(job_id, f"Arquivo de áudio inválido: {str(e)}")
+                continue
+            update_job(job_id, duration_seconds=info['duration'], task=_job_task(
+                file_path, filename, info, cache_key, model_name, compute, vad
+            ))
+            items.append({
+                'job_id': job_id, 'path': file_path, 'filename': filename,
+                'info': info, 'cache_key': cache_key
+            })
+        
+        batch_id = create_batch(job_ids)
+        print(f"[lote {batch_id}] {len(files)} arquivo(s) recebido(s), {len(items)} para transcrever")
+        
+        queue_position = None
+        if items:
+            try:
+                if EXECUTION_MODE == 'queue':
+                    # O lote é uma única tarefa: o primeiro job leva os demais, e o worker
+                    # que o assumir decodifica os clipes curtos juntos
+                    lead_id = items[0]['job_id']
+                    update_job(lead_id, task={
+                        **get_job(lead_id)['task'], 'batch': {'id': batch_id, 'items': items}
+                    })
+                    queue_position = enqueue_for_workers(
+                        [lead_id], held_ids=[item['job_id'] for item in items[1:]]
+                    )
+                else:
+                    queue_position = scheduler.submit(
+                        batch_id, process_batch_background, items, model_name, compute, vad,
+                        audio_seconds=sum(item['info']['duration'] for item in items)
+                    )
+            except QueueFullError as e:
+                uploads_received.inc(result='queue_full')
+                discard_batch(batch_id)
+                for item in items:
+                    if os.path.exists(item['path']):
+                        os.remove(item['path'])
+                print(f"⚠ Lote recusado: {e}")
+                return JSONResponse(
+                    status_code=429,
+                    content={"error": f"{e}. Tente novamente mais tarde."},
+                    headers={"Retry-After": str(retry_after())}
+                )
+            uploads_received.inc(len(items), result='accepted')
         
-        # Retornar imediatamente com status processing
         return JSONResponse(
             status_code=202,
             content={
-                "status": "processing",
-                "message": "Arquivo enviado e processamento iniciado. Verifique /progress para atualizações."
+                "status": "processing" if items else "completed",
+                "batch_id": batch_id,
+                "queue_position": queue_position,
+                "jobs": [
+                    {"job_id": job['id'], "filename": job['filename'], "status": job['status']}
+                    for job in get_batch(batch_id)['jobs']
+                ],
+                "message": f"Lote recebido. Verifique /batches/{batch_id} para atualizações."
             }
         )
         
     except Exception as e:
-        print(f"Erro ao receber arquivo: {str(e)}")
+        print(f"Erro ao receber lote: {str(e)}")
         return JSONResponse(
             status_code=500,
-            content={"error": f"Erro ao processar arquivo: {str(e)}"}
+            content={"error": f"Erro ao processar lote: {str(e)}"}
         )
 
-    except Exception as e:
-        print(f"Erro durante transcrição: {str(e)}")
-        return JSONResponse(
-            status_code=500,
-            content={"error": f"Erro ao processar áudio: {str(e)}"}
-        )
+@app.get("/batches/{batch_id}")
+async def get_batch_status(batch_id: str):
+    """Estado de um lote e de cada um dos seus arquivos (com o resultado dos concluídos)"""
+    batch = get_batch(batch_id)
+    if batch is None:
+        return JSONResponse(status_code=404, content={"error": "Lote não encontrado"})
+    
+    items = [
+        {**_job_status_response(job), "result": job['result']}
+        for job in batch['jobs']
+    ]
+    finished = sum(1 for job in batch['jobs'] if job['status'] in FINISHED_STATUSES)
+    return {
+        "batch_id": batch_id,
+        "status": "completed" if finished == len(items) else "processing",
+        "total": len(items),
+        "completed": sum(1 for job in batch['jobs'] if job['status'] == 'completed'),
+        "failed": sum(1 for job in batch['jobs'] if job['status'] == 'error'),
+        "queue_position": get_batch_queue_position(batch),
+        "items": items
+    }
 
-def save_transcription_file(transcription_text, audio_filename):
-    """Salva a transcrição em um arquivo de texto"""
+def format_transcription_document(transcription_text, audio_filename, created_at=None):
+    """Texto do arquivo de transcrição oferecido em /download"""
+    created = datetime.fromtimestamp(created_at) if created_at else datetime.now()
+    return (
+        f"TRANSCRIÇÃO DE ÁUDIO\n"
+        f"{'='*50}\n\n"
+        f"Arquivo: {audio_filename}\n"
+        f"Data: {created.strftime('%d/%m/%Y %H:%M:%S')}\n"
+        f"Modelo: Whisper (Offline)\n"
+        f"Idioma: Português (Brasil)\n"
+        f"\n{'='*50}\n\n"
+        f"TRANSCRIÇÃO:\n\n"
+        f"{transcription_text}"
+        f"\n\n{'='*50}\n"
+    )
+
+def save_transcription_file(transcription_text, audio_filename, metadata=None, segments=None, job_id=None,
+                            model_name=None):
+    """Salva a transcrição no banco de transcrições; retorna o nome usado em /download"""
     try:
-        # Criar nome do arquivo baseado no áudio original
-        base_name = Path(audio_filename).stem
-        txt_filename = f"{base_name}_transcricao.txt"
-        txt_path = os.path.join(UPLOAD_DIR, txt_filename)
-        
-        with open(txt_path, 'w', encoding='utf-8') as f:
-            f.write(f"TRANSCRIÇÃO DE ÁUDIO\n")
-            f.write(f"{'='*50}\n\n")
-            f.write(f"Arquivo: {audio_filename}\n")
-            f.write(f"Data: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-            f.write(f"Modelo: Whisper (Offline)\n")
-            f.write(f"Idioma: Português (Brasil)\n")
-            f.write(f"\n{'='*50}\n\n")
-            f.write(f"TRANSCRIÇÃO:\n\n")
-            f.write(transcription_text)
-            f.write(f"\n\n{'='*50}\n")
-        
-        print(f"✓ Arquivo de transcrição salvo: {txt_path}")
-        return txt_path
+        download_file = transcript_store.save(
+            transcription_text, audio_filename, metadata, segments, job_id, model_name
+        )
+        print(f"✓ Transcrição salva: {download_file}")
+        return download_file
     except Exception as e:
-        print(f"⚠ Erro ao salvar arquivo de transcrição: {e}")
+        print(f"⚠ Erro ao salvar transcrição: {e}")
         return None
 
-def transcribe_audio_with_whisper(wav_path):
-    """Transcreve áudio usando Whisper (offline)"""
+# Faixa da barra de progresso ocupada pela decodificação
+DECODE_PERCENT_START = 10
+DECODE_PERCENT_END = 95
+
+class DecodeProgress:
+    """Progresso da decodificação de um job: segundos decodificados / duração, com ETA"""
+    
+    def __init__(self, job_id, total_seconds):
+        self.job_id = job_id
+        self.total_seconds = total_seconds
+        self.decoded_seconds = 0.0
+        self.started = time.time()
+        self._lock = threading.Lock()
+    
+    def advance(self, seconds):
+        """Registra mais `seconds` de áudio decodificados e atualiza o job"""
+        with self._lock:
+            total = max(self.total_seconds, 1e-6)
+            self.decoded_seconds = min(total, self.decoded_seconds + seconds)
+            elapsed = time.time() - self.started
+            real_time_factor = elapsed / self.decoded_seconds
+            eta_seconds = (total - self.decoded_seconds) * real_time_factor
+            percent = DECODE_PERCENT_START + (DECODE_PERCENT_END - DECODE_PERCENT_START) * self.decoded_seconds / total
+        
+        if self.job_id:
+            update_job(
+                self.job_id,
+                percent=round(percent, 1),
+                decoded_seconds=round(self.decoded_seconds, 1),
+                real_time_factor=round(real_time_factor, 3),
+                eta_seconds=round(eta_seconds, 1)
+            )
+
+class SegmentPublisher:
+    """Publica no job os segmentos assim que são decodificados, na ordem do áudio
+    
+    Os segmentos de um bloco só são publicados depois que todos os blocos
+    anteriores terminaram (no modo process eles são decodificados em paralelo).
+    A união dos blocos é a mesma de merge_chunk_results, e com time_map os tempos
+    voltam ao áudio original; assim a lista publicada é igual à do resultado final.
+    """
+    
+    def __init__(self, job_id, time_map=None):
+        self.job_id = job_id
+        self.time_map = time_map
+        self._merger = SegmentMerger()
+        self._lock = threading.Lock()
+        self.expect([0.0])
+    
+    def expect(self, offsets):
+        """Define os blocos a decodificar (início de cada um, em segundos)"""
+        with self._lock:
+            self._offsets = list(offsets)
+            self._segments = [[] for _ in self._offsets]
+            self._consumed = [0] * len(self._offsets)
+            self._complete = [False] * len(self._offsets)
+            self._head = 0
+    
+    def add(self, index, segments):
+        """Segmentos novos do bloco `index`, ainda em decodificação"""
+        with self._lock:
+            if not self._complete[index]:
+                self._segments[index].extend(segments)
+                self._flush_locked()
+    
+    def complete(self, index, result):
+        """Resultado final do bloco `index` (inclui segmentos que ainda não chegaram)"""
+        with self._lock:
+            self._segments[index] = list(result.get('segments', []))
+            self._complete[index] = True
+            self._flush_locked()
+    
+    def _flush_locked(self):
+        published = []
+        while self._head < len(self._offsets):
+            index = self._head
+            pending = self._segments[index][self._consumed[index]:]
+            self._consumed[index] = len(self._segments[index])
+            published.extend(self._merger.add(pending, self._offsets[index]))
+            if not self._complete[index]:
+                break
+            self._head += 1
+        if published:
+            append_job_segments(self.job_id, [
+                {
+                    'id': segment['id'],
+                    'start': round(map_vad_time(segment['start'], self.time_map), 2),
+                    'end': round(map_vad_time(segment['end'], self.time_map), 2),
+                    'text': segment['text'].strip()
+                }
+                for segment in published
+            ])
+
+def _transcribe_chunked(audio, progress, model_name=None, compute=None, publisher=None):
+    """Transcreve um áudio longo em blocos e une os segmentos"""
+    bounds = split_audio_at_silence(audio)
+    chunks = [audio[start:end] for start, end in bounds]
+    offsets = [start / SAMPLE_RATE for start, _ in bounds]
+    # A sobreposição entre blocos também é decodificada
+    progress.total_seconds = sum(len(chunk) for chunk in chunks) / SAMPLE_RATE
+    print(f"Áudio dividido em {len(chunks)} bloco(s) de até {CHUNK_MAX_SECONDS:.0f}s")
+    if publisher:
+        publisher.expect(offsets)
+    
+    if EXECUTION_MODE == 'process':
+        # Blocos decodificados em paralelo, um por processo worker
+        results = _map_in_process_pool(chunks, progress.advance, model_name, compute, publisher)
+    else:
+        # Um único modelo no processo: os blocos são decodificados em sequência
+        results = []
+        with model_registry.use(model_name or WHISPER_MODEL_NAME, compute) as model:
+            for index, chunk in enumerate(chunks):
+                on_segments = functools.partial(publisher.add, index) if publisher else None
+                results.append(_run_whisper(model, chunk, progress.advance, on_segments))
+                if publisher:
+                    publisher.complete(index, results[-1])
+    
+    return merge_chunk_results(results, offsets)
+
+def transcribe_audio_with_whisper(audio, job_id=None, model_name=None, compute=None, time_map=None):
+    """Transcreve áudio usando Whisper (offline)
+    
+    Aceita o caminho de um WAV ou o array float32 16 kHz de decode_audio_to_array.
+    Com time_map (de remove_silence), os tempos dos segmentos voltam ao áudio original
+    """
     
     try:
         print(f"Iniciando transcrição com Whisper (offline)...")
-        print(f"Arquivo: {wav_path}")
         
-        if not whisper_model:
-            raise Exception("Modelo Whisper não foi carregado com sucesso!")
-        
-        print("Validando arquivo de áudio...")
-        validate_audio_file(wav_path)
+        if isinstance(audio, np.ndarray):
+            duration = audio.size / SAMPLE_RATE
+            print(f"Áudio em memória: {duration:.1f}s")
+            if audio.size == 0:
+                raise Exception("Áudio vazio (0 amostras)")
+        else:
+            print(f"Arquivo: {audio}")
+            print("Validando arquivo de áudio...")
+            info = probe_audio_file(audio)
+            validate_audio_file(audio, info)
+            duration = info['duration']
         
-        with progress_tracker['lock']:
-            progress_tracker['status'] = 'processing'
-            progress_tracker['current_percent'] = 20
+        if job_id:
+            update_job(job_id, status='processing', percent=DECODE_PERCENT_START)
+        progress = DecodeProgress(job_id, duration)
         
         print("Iniciando processamento com Whisper...")
         
-        # O WAV já foi garantido correto pelo FFmpeg
-        # Whisper pode processar o arquivo diretamente agora
-        result = whisper_model.transcribe(
-            wav_path,
-            language='pt',
-            verbose=False,
-            fp16=False
+        # O array já está no formato do Whisper (float32, 16 kHz, mono),
+        # então não há uma segunda execução do FFmpeg dentro do Whisper
+        use_chunks = (
+            CHUNKED_TRANSCRIPTION
+            and isinstance(audio, np.ndarray)
+            and audio.size > CHUNK_MIN_AUDIO_SECONDS * SAMPLE_RATE
         )
+        model_name = model_name or WHISPER_MODEL_NAME
+        # Segmentos publicados no job durante a decodificação (/jobs/{job_id}/segments)
+        publisher = SegmentPublisher(job_id, time_map) if job_id else None
+        if use_chunks:
+            result = _transcribe_chunked(audio, progress, model_name, compute, publisher)
+        elif EXECUTION_MODE == 'process':
+            result = _transcribe_in_process_pool(audio, progress.advance, model_name, compute, publisher)
+        else:
+            with model_registry.use(model_name, compute) as model:
+                on_segments = functools.partial(publisher.add, 0) if publisher else None
+                result = _run_whisper(model, audio, progress.advance, on_segments)
+            if publisher:
+                publisher.complete(0, result)
+        if time_map:
+            remap_segments(result, time_map)
         
-        print("✓ Transcrição concluída!")
-        
-        # Atualizar progresso durante os passos finais
-        with progress_tracker['lock']:
-            progress_tracker['current_percent'] = 90
+        print(f"✓ Transcrição concluída! ({progress.decoded_seconds:.1f}s em {time.time() - progress.started:.1f}s)")
         
         transcription_text = result.get('text', '').strip()
         
@@ -407,48 +3983,393 @@ def transcribe_audio_with_whisper(wav_path):
         print(f"✗ Erro na transcrição: {str(e)}")
         import traceback
         traceback.print_exc()
-        with progress_tracker['lock']:
-            progress_tracker['status'] = 'error'
-            progress_tracker['current_percent'] = 0
+        if job_id:
+            update_job(job_id, status='error', percent=0)
         raise Exception(f"Erro ao transcrever áudio: {str(e)}")
 
+def _job_status_response(job):
+    """Resposta pública com o estado de um job (sem o resultado)"""
+    return {
+        "job_id": job['id'],
+        "filename": job['filename'],
+        "model": job['model'],
+        "compute": job['compute'],
+        "duration_seconds": job['duration_seconds'],
+        "percent": job['percent'],
+        "decoded_seconds": job['decoded_seconds'],
+        "real_time_factor": job['real_time_factor'],
+        "eta_seconds": job['eta_seconds'],
+        "status": job['status'],
+        "queue_position": get_queue_position(job['id']) if job['status'] == 'queued' else None,
+        "error": job['error'],
+        "profile": job['profile'],
+        "vad_skipped_fraction": job['vad_skipped_fraction'],
+        "segments_available": len(job['segments'])
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    """Obter o estado e o progresso de um job"""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job não encontrado (inexistente ou expirado)"}
+        )
+    return _job_status_response(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str):
+    """Obter o resultado de um job concluído"""
+    job = get_job(job_id)
+    if job is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job não encontrado (inexistente ou expirado)"}
+        )
+    if job['status'] == 'error':
+        return JSONResponse(
+            status_code=500,
+            content={"error": job['error'] or "Erro desconhecido no processamento"}
+        )
+    if job['status'] != 'completed' or not job['result']:
+        return JSONResponse(status_code=202, content=_job_status_response(job))
+    return job['result']
+
+@app.get("/jobs/{job_id}/segments")
+async def get_job_segments_since(job_id: str, since: int = 0):
+    """Segmentos já decodificados a partir do índice `since` (leitura incremental)
+    
+    O cliente guarda `next` e o envia como `since` na próxima chamada, recebendo
+    só os segmentos novos; `complete` indica que não haverá mais segmentos.
+    """
+    found = get_job_segments(job_id, max(since, 0))
+    if found is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job não encontrado (inexistente ou expirado)"}
+        )
+    segments, total, status = found
+    return {
+        "job_id": job_id,
+        "status": status,
+        "since": max(since, 0),
+        "next": total,
+        "segments": segments,
+        "complete": status in FINISHED_STATUSES
+    }
+
+def _sse_event(event, data, event_id=None):
+    """Formata um evento Server-Sent Events"""
+    header = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{header}event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Stream (SSE) com as mudanças de estado do job e os segmentos novos; o resultado é enviado uma única vez
+    
+    O id dos eventos "segments" é o número de segmentos já enviados: ao reconectar, o
+    EventSource o devolve em Last-Event-ID e o stream continua dali, sem repetir segmentos
+    """
+    last_event_id = request.headers.get('last-event-id', '')
+    segments_sent = int(last_event_id) if last_event_id.isdigit() else 0
+    if get_job(job_id) is None:
+        return JSONResponse(
+            status_code=404,
+            content={"error": "Job não encontrado (inexistente ou expirado)"}
+        )
+    
+    async def event_stream():
+        nonlocal segments_sent
+        last_state = None
+        last_sent = time.time()
+        while True:
+            # Verificação local e barata: o job só é copiado quando muda
+            # (ou quando avança na fila)
+            version = get_job_version(job_id)
+            if version is None:
+                yield _sse_event("failed", {"error": "Job não encontrado (inexistente ou expirado)"})
+                return
+            
+            state = (version, get_queue_position(job_id))
+            if state != last_state:
+                last_state = state
+                job = get_job(job_id)
+                if job is None:
+                    continue
+                yield _sse_event("progress", _job_status_response(job))
+                found = get_job_segments(job_id, segments_sent)
+                if found and found[0]:
+                    yield _sse_event("segments", {"since": segments_sent, "segments": found[0]}, found[1])
+                    segments_sent = found[1]
+                if job['status'] == 'completed':
+                    yield _sse_event("result", job['result'])
+                    return
+                if job['status'] == 'error':
+                    yield _sse_event("failed", {"error": job['error']})
+                    return
+                last_sent = time.time()
+            elif time.time() - last_sent > SSE_KEEPALIVE_SECONDS:
+                yield ": keepalive\n\n"
+                last_sent = time.time()
+            
+            await asyncio.sleep(SSE_CHECK_INTERVAL_SECONDS)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+class StreamingTranscriber:
+    """Estado de uma transcrição em tempo real (uma conexão de /ws/stream)
+    
+    O áudio recebido se acumula em uma janela que é decodificada de novo a cada
+    STREAM_STEP_SECONDS. Os segmentos anteriores ao último são finalizados e saem
+    da janela; o último continua parcial até ser confirmado por mais áudio.
+    A janela nunca passa de STREAM_WINDOW_SECONDS + STREAM_STEP_SECONDS.
+    """
+    
+    def __init__(self, model_name=None, compute=None):
+        self.model_name = model_name or WHISPER_MODEL_NAME
+        self.compute = compute or WHISPER_COMPUTE
+        self.window = np.zeros(0, dtype=np.float32)
+        self.window_start = 0.0     # início da janela, em segundos desde o início do stream
+        self.received_seconds = 0.0
+        self._pending_byte = b''
+        self._new_samples = 0
+    
+    def feed(self, data):
+        """Acrescenta PCM s16le; retorna as mensagens geradas (pode ser uma lista vazia)"""
+        data = self._pending_byte + data
+        usable = len(data) - len(data) % 2
+        self._pending_byte = data[usable:]
+        samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        self.window = np.concatenate((self.window, samples))
+        self.received_seconds += samples.size / SAMPLE_RATE
+        self._new_samples += samples.size
+        if self._new_samples < STREAM_STEP_SECONDS * SAMPLE_RATE:
+            return []
+        return self._decode(final=False)
+    
+    def finish(self):
+        """Decodifica o que restou na janela e finaliza todos os segmentos"""
+        if self.window.size == 0:
+            return []
+        return self._decode(final=True)
+    
+    def _transcribe(self, audio):
+        # Cópia própria do modelo no processo da API (em todos os modos de execução):
+        # as janelas do stream esperam apenas umas pelas outras, nunca por um arquivo
+        with model_registry.use(self.model_name, self.compute, instance='stream') as model:
+            return _run_whisper(model, audio)
+    
+    def _advance(self, samples):
+        """Descarta o início da janela (áudio já finalizado)"""
+        samples = min(samples, self.window.size)
+        self.window = self.window[samples:]
+        self.window_start += samples / SAMPLE_RATE
+    
+    def _decode(self, final):
+        self._new_samples = 0
+        window_seconds = self.window.size / SAMPLE_RATE
+        window_full = window_seconds >= STREAM_WINDOW_SECONDS
+        
+        # Janela sem fala: não gastar uma decodificação; mantém só a margem final
+        if not detect_speech_spans(self.window):
+            if final:
+                self._advance(self.window.size)
+                return []
+            self._advance(self.window.size - int(VAD_PADDING_SECONDS * SAMPLE_RATE))
+            return [{"type": "partial", "text": "", "start": self.window_start, "end": self.received_seconds}]
+        
+        with observe_stage('stream'):
+            result = self._transcribe(self.window)
+        audio_seconds_processed.inc(window_seconds)
+        
+        segments = []
+        for segment in result.get('segments', []):
+            text = segment['text'].strip()
+            if text:
+                segments.append({
+                    "start": round(self.window_start + segment['start'], 2),
+                    "end": round(self.window_start + min(segment['end'], window_seconds), 2),
+                    "text": text
+                })
+        
+        # O último segmento pode mudar com mais áudio; os anteriores ficam finais.
+        # Com a janela cheia e um único segmento (ou resto longo demais), finaliza tudo
+        finalized = len(segments) if final else max(len(segments) - 1, 0)
+        if window_full and segments:
+            rest_start = segments[finalized]['start'] if finalized < len(segments) else self.received_seconds
+            if finalized == 0 or self.received_seconds - rest_start >= STREAM_WINDOW_SECONDS / 2:
+                finalized = len(segments)
+        
+        messages = []
+        if finalized:
+            messages.append({"type": "final", "segments": segments[:finalized]})
+        if final or (finalized and finalized == len(segments)):
+            self._advance(self.window.size)
+        elif finalized:
+            self._advance(int((segments[finalized]['start'] - self.window_start) * SAMPLE_RATE))
+        elif window_full:
+            # Whisper não reconheceu nada em uma janela cheia: descartar o início
+            self._advance(self.window.size - int(STREAM_STEP_SECONDS * SAMPLE_RATE))
+        
+        if not final:
+            rest = segments[finalized:]
+            messages.append({
+                "type": "partial",
+                "text": " ".join(segment['text'] for segment in rest),
+                "start": rest[0]['start'] if rest else self.window_start,
+                "end": self.received_seconds
+            })
+        return messages
+
+_active_streams = set()
+
+CallbackMetric("transcriber_streams_active", "Conexões de transcrição em tempo real abertas", "gauge",
+               lambda: len(_active_streams))
+
+@app.websocket("/ws/stream")
+async def stream_transcription(websocket: WebSocket):
+    """
+    Transcrição em tempo real via WebSocket
+    
+    O cliente envia mensagens binárias com PCM s16le mono 16 kHz (em qualquer
+    tamanho) e "stop" em texto para encerrar. O servidor responde com
+    {"type": "partial", "text", "start", "end"} enquanto o trecho ainda pode
+    mudar e {"type": "final", "segments": [...]} quando os segmentos são
+    confirmados; após "stop", envia os finais restantes e {"type": "done"}.
+    Parâmetros opcionais na URL: ?model= e ?compute=
+    """
+    await websocket.accept()
+    model_name = websocket.query_params.get('model') or WHISPER_MODEL_NAME
+    compute = websocket.query_params.get('compute') or WHISPER_COMPUTE
+    if model_name not in AVAILABLE_MODELS or compute not in COMPUTE_TYPES:
+        await websocket.send_json({"type": "error", "error": "Modelo ou precisão não suportados"})
+        await websocket.close(code=1008)
+        return
+    if len(_active_streams) >= STREAM_MAX_SESSIONS:
+        await websocket.send_json({"type": "error", "error": "Limite de transcrições em tempo real atingido"})
+        await websocket.close(code=1013)
+        return
+    
+    session = StreamingTranscriber(model_name, compute)
+    _active_streams.add(session)
+    print(f"✓ Stream iniciado ({len(_active_streams)} ativo(s), modelo {model_name})")
+    try:
+        await websocket.send_json({"type": "ready", "sample_rate": SAMPLE_RATE, "format": "s16le"})
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            if message.get('bytes'):
+                for event in await run_in_threadpool(session.feed, message['bytes']):
+                    await websocket.send_json(event)
+            elif (message.get('text') or '').strip().lower() == 'stop':
+                for event in await run_in_threadpool(session.finish):
+                    await websocket.send_json(event)
+                await websocket.send_json({"type": "done", "duration": round(session.received_seconds, 2)})
+                await websocket.close()
+                break
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        print(f"✗ Erro no stream: {str(e)}")
+        try:
+            await websocket.send_json({"type": "error", "error": f"Erro ao transcrever áudio: {str(e)}"})
+            await websocket.close(code=1011)
+        except Exception:
+            pass
+    finally:
+        _active_streams.discard(session)
+        print(f"✓ Stream encerrado ({session.received_seconds:.1f}s de áudio)")
+
 @app.post("/reset-progress")
 async def reset_progress():
-    """Resetar o rastreador de progresso para uma nova transcrição"""
-    with progress_tracker['lock']:
-        progress_tracker['current_percent'] = 0
-        progress_tracker['status'] = 'waiting'
-        progress_tracker['result'] = None
-        progress_tracker['error'] = None
+    """Desassociar o endpoint legado /progress do último job (não afeta jobs em andamento)"""
+    job_store.reset_latest()
     print("✓ Rastreador de progresso resetado")
     return {"status": "reset"}
 
 @app.get("/progress")
-async def get_progress():
-    """Obter o progresso atual do processamento"""
-    with progress_tracker['lock']:
-        response = {
-            "percent": progress_tracker['current_percent'],
-            "status": progress_tracker['status'],
-            "error": progress_tracker['error'],
-            "result": None
-        }
-        
-        # Se o resultado está pronto, incluí-lo na resposta
-        if progress_tracker['status'] == 'completed' and progress_tracker['result']:
-            response['result'] = progress_tracker['result']
-            print(f"DEBUG: Retornando resultado - status: {progress_tracker['status']}, tem resultado: {progress_tracker['result'] is not None}")
+async def get_progress(job_id: str = None):
+    """Obter o progresso de um job (legado: sem job_id, usa o último job criado)"""
+    target_job_id = job_id or job_store.latest()
+    job = get_job(target_job_id) if target_job_id else None
+    if job is None:
+        return {"percent": 0, "status": "waiting", "error": None, "result": None}
+    
+    response = {
+        "percent": job['percent'],
+        "status": job['status'],
+        "error": job['error'],
+        "result": None
+    }
+    
+    # Se o resultado está pronto, incluí-lo na resposta
+    if job['status'] == 'completed' and job['result']:
+        response['result'] = job['result']
     
     return response
 
 @app.get("/download/{filename}")
 async def download_transcription(filename: str):
-    """Download do arquivo de transcrição"""
+    """Download do arquivo de transcrição (gerado a partir do banco de transcrições)"""
+    try:
+        document = await run_in_threadpool(transcript_store.get_document, filename)
+        if document is None:
+            return JSONResponse(
+                status_code=404,
+                content={"error": "Arquivo não encontrado"}
+            )
+        
+        return PlainTextResponse(
+            document,
+            media_type='text/plain; charset=utf-8',
+            headers={"Content-Disposition": f"attachment; filename*=UTF-8''{quote(filename)}"}
+        )
+    except Exception as e:
+        print(f"Erro ao fazer download: {e}")
+        return JSONResponse(
+            status_code=500,
+            content={"error": f"Erro ao fazer download: {str(e)}"}
+        )
+
+@app.get("/search")
+async def search_transcriptions(q: str = "", page: int = 1, page_size: int = SEARCH_PAGE_SIZE):
+    """
+    Busca textual nas transcrições armazenadas (nome do arquivo, título, artista e texto)
+    
+    Resultados ordenados por relevância (bm25), com trecho destacado entre [colchetes]
+    e os segmentos (com tempos) onde os termos aparecem. Paginação por ?page= e ?page_size=
+    """
+    if not q.strip():
+        return JSONResponse(status_code=400, content={"error": "Informe o termo de busca em ?q="})
+    page = max(page, 1)
+    page_size = min(max(page_size, 1), SEARCH_MAX_PAGE_SIZE)
     try:
-        file_path = os.path.join(UPLOAD_DIR, filename)
+        total, hits = await run_in_threadpool(transcript_store.search, q, page_size, (page - 1) * page_size)
+    except sqlite3.OperationalError as e:
+        return JSONResponse(status_code=400, content={"error": f"Busca inválida: {str(e)}"})
+    return {
+        "query": q,
+        "total": total,
+        "page": page,
+        "page_size": page_size,
+        "pages": math.ceil(total / page_size),
+        "hits": hits
+    }
+
+@app.get("/profiles/{filename}")
+async def download_profile(filename: str):
+    """Download do perfil de um job (.prof do cProfile ou relatório .txt)"""
+    try:
+        file_path = os.path.join(PROFILE_DIR, filename)
         
-        # Validar que o arquivo está no diretório de uploads (segurança)
-        if not os.path.abspath(file_path).startswith(os.path.abspath(UPLOAD_DIR)):
+        # Validar que o arquivo está no diretório de perfis (segurança)
+        if os.path.dirname(os.path.abspath(file_path)) != os.path.abspath(PROFILE_DIR):
             return JSONResponse(
                 status_code=403,
                 content={"error": "Acesso negado"}
@@ -457,32 +4378,56 @@ async def download_transcription(filename: str):
         if not os.path.exists(file_path):
             return JSONResponse(
                 status_code=404,
-                content={"error": "Arquivo não encontrado"}
+                content={"error": "Perfil não encontrado"}
             )
         
         from fastapi.responses import FileResponse
-        return FileResponse(
-            path=file_path,
-            filename=filename,
-            media_type='text/plain; charset=utf-8'
-        )
+        media_type = 'text/plain; charset=utf-8' if filename.endswith('.txt') else 'application/octet-stream'
+        return FileResponse(path=file_path, filename=filename, media_type=media_type)
     except Exception as e:
-        print(f"Erro ao fazer download: {e}")
+        print(f"Erro ao fazer download do perfil: {e}")
         return JSONResponse(
             status_code=500,
             content={"error": f"Erro ao fazer download: {str(e)}"}
         )
 
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato de texto do Prometheus"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/health")
 async def health_check():
     """Verificar saúde da API"""
+    if EXECUTION_MODE == 'queue':
+        # A API só enfileira: os modelos ficam nos processos worker.py
+        ready, model_state = True, 'workers'
+    else:
+        ready = _process_pool is not None if EXECUTION_MODE == 'process' else model_registry.state(WHISPER_MODEL_NAME) == 'ready'
+        model_state = 'ready' if EXECUTION_MODE == 'process' and _process_pool is not None else model_registry.state(WHISPER_MODEL_NAME)
+    queue = queue_stats()
     return {
         "status": "healthy",
         "model": "Whisper (Offline)",
-        "ready": whisper_model is not None
+        "ready": ready,
+        "model_state": model_state,
+        "default_model": WHISPER_MODEL_NAME,
+        "default_compute": WHISPER_COMPUTE,
+        "models": model_registry.stats(),
+        "execution_mode": EXECUTION_MODE,
+        "queue": queue,
+        "cpu": cpu_budget.stats(),
+        "cache": transcription_cache.stats()
     }
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    api_workers = int(os.getenv("API_WORKERS", "1"))
+    if api_workers > 1:
+        if JOB_STORE != 'sqlite':
+            print("⚠ API_WORKERS > 1 sem JOB_STORE=sqlite: cada processo só enxerga os próprios jobs")
+        # Vários processos exigem o app como string de importação
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=api_workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
 
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Worker de transcrição (EXECUTION_MODE=queue)
+
+Consome os jobs enfileirados pela API no banco de jobs compartilhado
+(JOB_DB, SQLite em modo WAL no volume de uploads) e executa o mesmo
+pipeline do /transcribe. Pode ser replicado: cada job é assumido por um
+único worker, e jobs de um worker que caiu voltam para a fila quando o
+lease vence (JOB_LEASE_SECONDS).
+
+As métricas do processo (histogramas de etapas, fator de tempo real etc.)
+ficam em http://<worker>:WORKER_METRICS_PORT/metrics, no formato do Prometheus.
+
+Uso:
+    EXECUTION_MODE=queue python worker.py
+"""
+
+import os
+import sys
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+os.environ.setdefault("EXECUTION_MODE", "queue")
+
+try:
+    import main  # No container: /app/main.py
+except ImportError:
+    from backend import main
+
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9100"))  # 0 = sem endpoint de métricas
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    """GET /metrics: as mesmas métricas do /metrics da API, deste processo"""
+    
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = main.render_metrics().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    """Serve /metrics em uma thread; retorna o servidor"""
+    server = ThreadingHTTPServer(('', port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="worker-metrics", daemon=True).start()
+    print(f"✓ Métricas do worker em :{server.server_address[1]}/metrics")
+    return server
+
+def run():
+    if main.EXECUTION_MODE != 'queue':
+        print(f"✗ worker.py requer EXECUTION_MODE=queue (atual: {main.EXECUTION_MODE})")
+        return 1
+    
+    stop_event = threading.Event()
+    
+    def stop(signum, frame):
+        print("Encerrando worker: aguardando os jobs em andamento...")
+        stop_event.set()
+    
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    
+    if WORKER_METRICS_PORT:
+        start_metrics_server(WORKER_METRICS_PORT)
+    if main.MODEL_PRELOAD:
+        main.model_registry.preload(main.WHISPER_MODEL_NAME)
+    main.run_queue_worker(stop_event=stop_event)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(run())
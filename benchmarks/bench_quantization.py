@@ -0,0 +1,177 @@
+"""
+Benchmark fp32 x int8 (quantização dinâmica) do Whisper na CPU
+
+Para cada precisão, um processo novo carrega o modelo, transcreve todos os
+áudios do corpus e informa:
+- fator de tempo real (tempo de decodificação / duração do áudio)
+- memória residente (RSS) após carregar o modelo e pico durante a decodificação
+- WER contra as transcrições de referência (<nome>.txt ao lado de cada áudio)
+- WER do int8 em relação à saída fp32 (concordância, mesmo sem referências)
+
+Uso:
+    python benchmarks/bench_quantization.py --corpus ./corpus --model base
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import resource
+import unicodedata
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("TESTING", "1")  # uploads em /tmp/uploads, sem tocar em /app (herdado pelos processos spawn)
+
+AUDIO_EXTENSIONS = {'.mp3', '.wav', '.flac', '.m4a', '.ogg', '.wma', '.aac'}
+
+def current_rss_mb():
+    """Memória residente atual do processo, em MB"""
+    with open('/proc/self/statm') as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf('SC_PAGE_SIZE') / 1024 / 1024
+
+def peak_rss_mb():
+    """Pico de memória residente do processo, em MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def normalize_words(text):
+    """Palavras em minúsculas, sem acentos e sem pontuação"""
+    text = unicodedata.normalize('NFKD', text.lower())
+    text = ''.join(c for c in text if not unicodedata.combining(c))
+    text = ''.join(c if c.isalnum() else ' ' for c in text)
+    return text.split()
+
+def word_error_rate(reference, hypothesis):
+    """WER por distância de edição entre sequências de palavras"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word)
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+def find_corpus(corpus_dir):
+    """Áudios do corpus (ordenados) e suas referências, quando existirem"""
+    items = []
+    for path in sorted(Path(corpus_dir).iterdir()):
+        if path.suffix.lower() not in AUDIO_EXTENSIONS:
+            continue
+        reference = path.with_suffix('.txt')
+        items.append({
+            'audio': str(path),
+            'reference': reference.read_text(encoding='utf-8') if reference.exists() else None
+        })
+    return items
+
+def run_mode(model_name, compute, items, threads):
+    """Executado em um processo novo: mede uma precisão sobre todo o corpus"""
+    import torch
+    from backend import main
+
+    torch.set_num_threads(threads)
+    # --threads vale para toda a medição: o orçamento de CPU não altera as threads do torch
+    main.cpu_budget.manage_threads = False
+    rss_before = current_rss_mb()
+
+    started = time.time()
+    model = main.load_whisper_model(model_name)
+    if compute == 'int8':
+        model = main.quantize_model_int8(model)
+    load_seconds = time.time() - started
+    rss_model = current_rss_mb()
+
+    # Decodificação do áudio fora da medição (mesma para as duas precisões)
+    audios = [main.decode_audio_to_array(item['audio']) for item in items]
+
+    # Aquecimento: a primeira chamada inclui alocações e inicialização de kernels
+    main._run_whisper(model, audios[0][:main.SAMPLE_RATE * 5])
+
+    files = []
+    for item, audio in zip(items, audios):
+        started = time.time()
+        text = main._run_whisper(model, audio).get('text', '').strip()
+        elapsed = time.time() - started
+        duration = audio.size / main.SAMPLE_RATE
+        files.append({
+            'audio': os.path.basename(item['audio']),
+            'duration_seconds': round(duration, 2),
+            'decode_seconds': round(elapsed, 2),
+            'real_time_factor': round(elapsed / duration, 4) if duration else None,
+            'wer': round(word_error_rate(item['reference'], text), 4) if item['reference'] is not None else None,
+            'text': text
+        })
+
+    total_audio = sum(f['duration_seconds'] for f in files)
+    total_decode = sum(f['decode_seconds'] for f in files)
+    with_reference = [f for f in files if f['wer'] is not None]
+    return {
+        'compute': compute,
+        'load_seconds': round(load_seconds, 2),
+        'model_rss_mb': round(rss_model - rss_before, 1),
+        'peak_rss_mb': round(peak_rss_mb(), 1),
+        'real_time_factor': round(total_decode / total_audio, 4) if total_audio else None,
+        'wer': round(sum(f['wer'] for f in with_reference) / len(with_reference), 4) if with_reference else None,
+        'files': files
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara inferência fp32 e int8 do Whisper")
+    parser.add_argument('--corpus', required=True, help="Diretório com áudios e referências <nome>.txt")
+    parser.add_argument('--model', default=os.getenv('WHISPER_MODEL', 'base'), help="Modelo Whisper (padrão: base)")
+    parser.add_argument('--threads', type=int, default=os.cpu_count() or 1, help="Threads do torch")
+    parser.add_argument('--json', help="Salvar resultados completos neste arquivo")
+    args = parser.parse_args()
+
+    items = find_corpus(args.corpus)
+    if not items:
+        print(f"✗ Nenhum áudio encontrado em {args.corpus}")
+        return 1
+    print(f"Corpus: {len(items)} arquivo(s), modelo {args.model}, {args.threads} thread(s)")
+
+    # Um processo por precisão, para que o RSS de uma não contamine a outra
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for compute in ('fp32', 'int8'):
+        print(f"Medindo {compute}...")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(run_mode, args.model, compute, items, args.threads).result())
+
+    fp32, int8 = results
+    agreement = [
+        word_error_rate(a['text'], b['text'])
+        for a, b in zip(fp32['files'], int8['files'])
+    ]
+    int8['wer_vs_fp32'] = round(sum(agreement) / len(agreement), 4)
+
+    print()
+    print(f"{'precisão':<10}{'RTF':>10}{'carga (s)':>12}{'RSS modelo':>14}{'pico RSS':>12}{'WER':>10}")
+    for result in results:
+        wer = f"{result['wer']:.3f}" if result['wer'] is not None else "-"
+        print(
+            f"{result['compute']:<10}{result['real_time_factor']:>10.3f}{result['load_seconds']:>12.1f}"
+            f"{result['model_rss_mb']:>11.0f} MB{result['peak_rss_mb']:>9.0f} MB{wer:>10}"
+        )
+    print()
+    print(f"Aceleração int8: {fp32['real_time_factor'] / int8['real_time_factor']:.2f}x")
+    print(f"WER int8 x fp32: {int8['wer_vs_fp32']:.3f}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'model': args.model, 'threads': args.threads, 'results': results}, f, ensure_ascii=False, indent=2)
+        print(f"✓ Resultados salvos em {args.json}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
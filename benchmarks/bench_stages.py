@@ -0,0 +1,273 @@
+"""
+Benchmark por etapa do pipeline de transcrição
+
+Gera (uma vez) um corpus sintético com o FFmpeg em vários formatos e durações
+e mede, para cada arquivo, cada etapa do pipeline do backend:
+- validate:   probe_audio_file + validate_audio_file
+- metadata:   extract_audio_metadata
+- convert:    convert_audio_to_wav (conversão legada para WAV em disco)
+- decode:     decode_audio_to_array (decodificação em memória usada pelo pipeline)
+- transcribe: transcribe_audio_with_whisper (modelo carregado antes da medição)
+- save:       save_transcription_file (em um banco de transcrições temporário)
+
+Para cada etapa: tempo de parede, pico de RSS da etapa e fator de tempo real
+(tempo / duração do áudio). Com --baseline, etapas mais lentas que o baseline
+além de --threshold são reportadas como regressão (código de saída 1).
+
+Uso:
+    python benchmarks/bench_stages.py --durations 10,60 --formats mp3,flac
+    python benchmarks/bench_stages.py --json atual.json --baseline baseline.json --threshold 0.15
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import contextlib
+import subprocess
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault("TESTING", "1")  # uploads em /tmp/uploads, sem tocar em /app
+
+STAGES = ['validate', 'metadata', 'convert', 'decode', 'transcribe', 'save']
+FORMATS = ['mp3', 'flac', 'ogg', 'm4a']
+DURATIONS = [10, 60, 600, 3600]
+# Etapas mais rápidas que isso no baseline são ruído de medição: não comparar
+MIN_COMPARABLE_SECONDS = 0.05
+
+# Codecs usados para gerar cada formato (44.1 kHz estéreo, como um upload típico)
+ENCODERS = {
+    'mp3': ['-c:a', 'libmp3lame', '-b:a', '128k'],
+    'flac': ['-c:a', 'flac'],
+    'ogg': ['-c:a', 'libvorbis', '-q:a', '4'],
+    'm4a': ['-c:a', 'aac', '-b:a', '128k'],
+    'wav': ['-c:a', 'pcm_s16le']
+}
+
+def generate_audio(path, fmt, seconds):
+    """Gera um áudio sintético: tom modulado (sílabas) + ruído rosa, com pausas"""
+    source = (
+        f"sine=frequency=180:sample_rate=44100:duration={seconds},"
+        "volume='if(lt(mod(t,4),3),0.6*(0.5+0.5*sin(2*PI*4*t)),0)':eval=frame[tone];"
+        f"anoisesrc=color=pink:sample_rate=44100:amplitude=0.02:duration={seconds}[noise];"
+        "[tone][noise]amix=inputs=2:duration=shortest,aformat=channel_layouts=stereo"
+    )
+    cmd = ['ffmpeg', '-nostdin', '-loglevel', 'error', '-y', '-filter_complex', source] + ENCODERS[fmt] + [str(path)]
+    subprocess.run(cmd, check=True, timeout=max(600, seconds))
+
+def ensure_corpus(corpus_dir, formats, durations):
+    """Gera os arquivos que ainda não existem no diretório do corpus"""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    files = []
+    for seconds in durations:
+        for fmt in formats:
+            path = corpus_dir / f"synthetic_{seconds}s.{fmt}"
+            if not path.exists():
+                print(f"Gerando {path.name}...")
+                generate_audio(path, fmt, seconds)
+            files.append((path, seconds))
+    return files
+
+def reset_peak_rss():
+    """Zera o pico de RSS do processo (Linux: /proc/self/clear_refs); False se não suportado"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def peak_rss_mb(resettable):
+    """Pico de RSS desde o último reset (VmHWM) ou, sem reset, de todo o processo"""
+    if resettable:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def measure(func, verbose):
+    """Executa uma etapa medindo tempo de parede e pico de RSS"""
+    resettable = reset_peak_rss()
+    with open(os.devnull, 'w') as sink, contextlib.ExitStack() as stack:
+        if not verbose:
+            stack.enter_context(contextlib.redirect_stdout(sink))
+            stack.enter_context(contextlib.redirect_stderr(sink))
+        started = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - started
+    return value, elapsed, peak_rss_mb(resettable)
+
+def bench_file(main, path, seconds, stages, args):
+    """Mede as etapas selecionadas para um arquivo do corpus"""
+    work_path = os.path.join(main.UPLOAD_DIR, f"bench_{path.name}")
+    shutil.copyfile(path, work_path)
+    results = {}
+    state = {}
+
+    def record(stage, func):
+        if stage not in stages:
+            return None
+        value, elapsed, rss = measure(func, args.verbose)
+        results[stage] = {
+            'wall_seconds': round(elapsed, 4),
+            'peak_rss_mb': round(rss, 1),
+            'real_time_factor': round(elapsed / seconds, 5)
+        }
+        return value
+
+    def validate():
+        info = main.probe_audio_file(work_path)
+        main.validate_audio_file(work_path, info)
+        return info
+
+    try:
+        state['info'] = record('validate', validate) or main.probe_audio_file(work_path)
+        record('metadata', lambda: main.extract_audio_metadata(work_path, state['info']))
+        if 'convert' in stages:
+            # A conversão legada remove o arquivo de entrada: usar uma cópia
+            convert_input = os.path.join(main.UPLOAD_DIR, f"bench_convert_{path.name}")
+            shutil.copyfile(path, convert_input)
+            wav_path = record('convert', lambda: main.convert_audio_to_wav(convert_input))
+            for leftover in (convert_input, wav_path):
+                if leftover and os.path.exists(leftover):
+                    os.remove(leftover)
+        audio = record('decode', lambda: main.decode_audio_to_array(work_path))
+        text = "[benchmark]"
+        if 'transcribe' in stages and seconds <= args.max_transcribe_seconds:
+            if audio is None:
+                audio = main.decode_audio_to_array(work_path)
+            text = record('transcribe', lambda: main.transcribe_audio_with_whisper(
+                audio, model_name=args.model, compute=args.compute
+            ))
+        record('save', lambda: main.save_transcription_file(text, f"bench_{path.name}"))
+    finally:
+        if os.path.exists(work_path):
+            os.remove(work_path)
+    return results
+
+def compare_with_baseline(results, baseline, threshold):
+    """Lista as etapas mais lentas que o baseline além do limite relativo"""
+    previous = {
+        (entry['file'], stage): values['wall_seconds']
+        for entry in baseline['results']
+        for stage, values in entry['stages'].items()
+    }
+    regressions = []
+    for entry in results:
+        for stage, values in entry['stages'].items():
+            before = previous.get((entry['file'], stage))
+            if before is None or before < MIN_COMPARABLE_SECONDS:
+                continue
+            change = values['wall_seconds'] / before - 1
+            if change > threshold:
+                regressions.append({
+                    'file': entry['file'], 'stage': stage,
+                    'baseline_seconds': before, 'wall_seconds': values['wall_seconds'],
+                    'change': round(change, 4)
+                })
+    return regressions
+
+def print_table(results):
+    print()
+    print(f"{'arquivo':<26}{'etapa':<12}{'tempo (s)':>12}{'pico RSS':>12}{'RTF':>10}")
+    for entry in results:
+        for stage in STAGES:
+            values = entry['stages'].get(stage)
+            if values is None:
+                continue
+            print(
+                f"{entry['file']:<26}{stage:<12}{values['wall_seconds']:>12.3f}"
+                f"{values['peak_rss_mb']:>9.0f} MB{values['real_time_factor']:>10.4f}"
+            )
+
+def parse_list(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapa do pipeline de transcrição")
+    parser.add_argument('--corpus-dir', default=str(Path(__file__).resolve().parent / 'corpus'),
+                        help="Diretório do corpus sintético (gerado se necessário)")
+    parser.add_argument('--formats', default=','.join(FORMATS), help="Formatos (padrão: mp3,flac,ogg,m4a)")
+    parser.add_argument('--durations', default=','.join(str(d) for d in DURATIONS),
+                        help="Durações em segundos (padrão: 10,60,600,3600)")
+    parser.add_argument('--stages', default=','.join(STAGES), help=f"Etapas (padrão: {','.join(STAGES)})")
+    parser.add_argument('--model', default=os.getenv('WHISPER_MODEL', 'base'), help="Modelo Whisper")
+    parser.add_argument('--compute', default=os.getenv('WHISPER_COMPUTE', 'fp32'), help="fp32 ou int8")
+    parser.add_argument('--max-transcribe-seconds', type=float, default=600,
+                        help="Não transcrever áudios mais longos que isso (padrão: 600)")
+    parser.add_argument('--json', help="Salvar resultados neste arquivo")
+    parser.add_argument('--baseline', help="JSON de uma execução anterior para comparação")
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help="Aumento relativo de tempo considerado regressão (padrão: 0.10)")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar a saída do backend")
+    args = parser.parse_args()
+
+    from backend import main as backend_main
+
+    stages = parse_list(args.stages)
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"✗ Etapas desconhecidas: {', '.join(sorted(unknown))}")
+        return 2
+
+    files = ensure_corpus(
+        Path(args.corpus_dir), parse_list(args.formats), [int(d) for d in parse_list(args.durations)]
+    )
+
+    if 'transcribe' in stages:
+        # Carregar o modelo fora da medição
+        print(f"Carregando modelo {args.model} ({args.compute})...")
+        backend_main.model_registry.preload(args.model, args.compute)
+
+    results = []
+    # Banco de transcrições descartável: a etapa save não deixa linhas no banco real
+    with tempfile.TemporaryDirectory(prefix='bench_transcripts_') as scratch:
+        backend_main.transcript_store = backend_main.TranscriptStore(os.path.join(scratch, 'transcricoes.db'))
+        for path, seconds in files:
+            print(f"Medindo {path.name}...")
+            results.append({
+                'file': path.name,
+                'format': path.suffix[1:],
+                'duration_seconds': seconds,
+                'stages': bench_file(backend_main, path, seconds, stages, args)
+            })
+
+    print_table(results)
+    report = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'model': args.model,
+        'compute': args.compute,
+        'cpu_count': os.cpu_count(),
+        'results': results
+    }
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare_with_baseline(results, json.load(f), args.threshold)
+        report['regressions'] = regressions
+        print()
+        if regressions:
+            status = 1
+            print(f"✗ {len(regressions)} regressão(ões) acima de {args.threshold:.0%}:")
+            for item in regressions:
+                print(
+                    f"  {item['file']} / {item['stage']}: {item['baseline_seconds']:.3f}s -> "
+                    f"{item['wall_seconds']:.3f}s (+{item['change']:.0%})"
+                )
+        else:
+            print(f"✓ Nenhuma regressão acima de {args.threshold:.0%}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"✓ Resultados salvos em {args.json}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -30,6 +30,15 @@ def sample_mp3_file(temp_upload_dir):
     return mp3_path
 
 
+@pytest.fixture
+def sample_mp3_path(temp_upload_dir):
+    """Caminho de um arquivo .mp3 qualquer (para testes com FFmpeg simulado)"""
+    mp3_path = os.path.join(temp_upload_dir, "test_audio.mp3")
+    with open(mp3_path, 'wb') as f:
+        f.write(b'ID3' + b'\x00' * 1024)
+    return mp3_path
+
+
 @pytest.fixture
 def sample_wav_file(temp_upload_dir):
     """Cria um arquivo WAV de teste com 5 segundos"""
@@ -81,3 +90,29 @@ def app_client():
     from backend.main import app
     
     return TestClient(app)
+
+
+@pytest.fixture
+def mock_registry():
+    """Instala um registro de modelos que devolve o modelo simulado informado"""
+    from unittest.mock import patch
+    from backend.main import ModelRegistry, AVAILABLE_MODELS
+    
+    def install(model):
+        registry = ModelRegistry(AVAILABLE_MODELS, 0, loader=lambda name: model)
+        return patch('backend.main.model_registry', registry)
+    return install
+
+
+@pytest.fixture
+def tiny_whisper_model():
+    """Modelo Whisper minúsculo com pesos aleatórios (sem download de pesos)"""
+    import torch
+    from whisper.model import Whisper, ModelDimensions
+    
+    torch.manual_seed(0)
+    dims = ModelDimensions(
+        n_mels=80, n_audio_ctx=8, n_audio_state=32, n_audio_head=2, n_audio_layer=1,
+        n_vocab=100, n_text_ctx=8, n_text_state=32, n_text_head=2, n_text_layer=1
+    )
+    return Whisper(dims).eval()
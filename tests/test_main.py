@@ -4,6 +4,7 @@ Testes para o sistema de transcrição de áudio
 import pytest
 import os
 import wave
+import time
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 from fastapi.testclient import TestClient
@@ -79,6 +80,426 @@ class TestAudioConversion:
         assert os.path.exists(wav_path)
 
 
+class TestInMemoryDecode:
+    """Testes para a decodificação direta para memória"""
+    
+    def _fake_ffmpeg(self, payload, returncode=0, stderr=b''):
+        import io
+        process = MagicMock()
+        process.stdout = io.BytesIO(payload)
+        process.stderr = io.BytesIO(stderr)
+        process.wait.return_value = returncode
+        return process
+    
+    def test_decode_returns_float32_array(self, sample_mp3_path):
+        """Testa que o stdout do FFmpeg vira um array float32 sem arquivo intermediário"""
+        import numpy as np
+        from backend.main import decode_audio_to_array
+        
+        samples = np.linspace(-1, 1, 16000, dtype=np.float32)
+        with patch('subprocess.Popen', return_value=self._fake_ffmpeg(samples.tobytes())) as popen:
+            audio = decode_audio_to_array(sample_mp3_path)
+        
+        assert audio.dtype == np.float32
+        assert np.array_equal(audio, samples)
+        assert popen.call_args[0][0][-1] == '-'
+        assert not os.path.exists(sample_mp3_path.replace('.mp3', '.wav'))
+    
+    def test_decode_failure_raises(self, sample_mp3_path):
+        """Testa erro do FFmpeg"""
+        from backend.main import decode_audio_to_array
+        
+        with patch('subprocess.Popen', return_value=self._fake_ffmpeg(b'', 1, b'Invalid data')):
+            with pytest.raises(Exception) as exc_info:
+                decode_audio_to_array(sample_mp3_path)
+        
+        assert "FFmpeg falhou" in str(exc_info.value)
+    
+    def test_pipeline_passes_array_to_whisper(self, sample_mp3_path, mock_registry):
+        """Testa o pipeline completo com o array em memória"""
+        import numpy as np
+        from backend.main import create_job, get_job, process_audio_background
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": "Olá mundo"}
+        audio = np.zeros(16000, dtype=np.float32)
+        info = {"duration": 1.0, "codec": "mp3", "sample_rate": 16000, "channels": 1, "tags": {}}
+        
+        job_id = create_job("test_audio.mp3")
+        with mock_registry(mock_model), \
+             patch('backend.main.decode_audio_to_array', return_value=audio):
+            process_audio_background(job_id, sample_mp3_path, "test_audio.mp3", info)
+        
+        job = get_job(job_id)
+        assert job['status'] == 'completed'
+        assert job['result']['transcription'] == "Olá mundo"
+        assert mock_model.transcribe.call_args[0][0] is audio
+    
+    def test_job_discarded_during_decode(self, sample_mp3_path, mock_registry):
+        """Testa que um job removido durante a decodificação não quebra o salvamento"""
+        import numpy as np
+        from backend.main import create_job, discard_job, process_audio_background
+        
+        job_id = create_job("removido.mp3")
+        mock_model = MagicMock()
+        mock_model.transcribe.side_effect = lambda audio, **kwargs: discard_job(job_id) or {"text": "Olá"}
+        info = {"duration": 1.0, "codec": "mp3", "tags": {}}
+        
+        with mock_registry(mock_model), \
+             patch('backend.main.decode_audio_to_array', return_value=np.zeros(16000, dtype=np.float32)), \
+             patch('backend.main.save_transcription_file', return_value="removido_1_transcricao.txt") as save:
+            process_audio_background(job_id, sample_mp3_path, "removido.mp3", info)
+        
+        assert save.call_args[0][0] == "Olá"
+        assert save.call_args[0][3] == []
+
+
+class TestChunkedTranscription:
+    """Testes para a transcrição de áudios longos em blocos"""
+    
+    def _noise(self, seconds, seed=0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        return (rng.standard_normal(int(seconds * 16000)) * 0.1).astype(np.float32)
+    
+    def test_split_cuts_at_silence(self):
+        """Testa que o corte acontece no trecho silencioso, sem sobreposição"""
+        import numpy as np
+        from backend.main import split_audio_at_silence
+        
+        audio = np.concatenate([self._noise(40), np.zeros(2 * 16000, dtype=np.float32), self._noise(58, 1)])
+        chunks = split_audio_at_silence(audio, max_seconds=60)
+        
+        assert len(chunks) == 2
+        cut = chunks[0][1]
+        assert 40 * 16000 <= cut <= 42 * 16000
+        assert chunks[1][0] == cut
+        assert chunks[1][1] == len(audio)
+    
+    def test_split_without_silence_overlaps(self):
+        """Testa corte seco com sobreposição quando não há silêncio"""
+        from backend.main import split_audio_at_silence
+        
+        audio = self._noise(130)
+        chunks = split_audio_at_silence(audio, max_seconds=60, overlap_seconds=1)
+        
+        assert len(chunks) == 3
+        assert all(end - start <= 60 * 16000 for start, end in chunks)
+        assert chunks[1][0] == chunks[0][1] - 16000
+    
+    def test_merge_shifts_timestamps_and_removes_overlap(self):
+        """Testa timestamps absolutos e remoção de texto duplicado na sobreposição"""
+        from backend.main import merge_chunk_results
+        
+        first = {"segments": [
+            {"start": 0.0, "end": 30.0, "text": " Bom dia a todos."},
+            {"start": 30.0, "end": 59.8, "text": " Vamos começar."}
+        ]}
+        second = {"segments": [
+            {"start": 0.0, "end": 0.9, "text": " começar."},
+            {"start": 1.0, "end": 20.0, "text": " Primeiro item."}
+        ]}
+        
+        merged = merge_chunk_results([first, second], [0.0, 59.0])
+        
+        assert [segment["text"] for segment in merged["segments"]] == [
+            " Bom dia a todos.", " Vamos começar.", " Primeiro item."
+        ]
+        assert merged["segments"][2]["start"] == 60.0
+        assert merged["text"] == " Bom dia a todos. Vamos começar. Primeiro item."
+    
+    def test_long_audio_is_transcribed_in_chunks(self, mock_registry):
+        """Testa que áudios acima do limite passam pelo caminho em blocos"""
+        from backend.main import transcribe_audio_with_whisper
+        
+        import itertools
+        counter = itertools.count(1)
+        mock_model = MagicMock()
+        mock_model.transcribe.side_effect = lambda audio, **kwargs: {
+            "text": " parte", "segments": [{"start": 0.0, "end": 1.0, "text": f" parte {next(counter)}"}]
+        }
+        
+        with mock_registry(mock_model), \
+             patch('backend.main.CHUNKED_TRANSCRIPTION', True), \
+             patch('backend.main.CHUNK_MIN_AUDIO_SECONDS', 10), \
+             patch('backend.main.CHUNK_MAX_SECONDS', 60):
+            text = transcribe_audio_with_whisper(self._noise(130))
+        
+        assert mock_model.transcribe.call_count == 3
+        assert text.count("parte") == 3
+    
+    def test_chunking_off_by_default_outside_process_mode(self, mock_registry):
+        """Testa que no modo thread (sem paralelismo entre blocos) o áudio longo é decodificado inteiro"""
+        from backend.main import CHUNKED_TRANSCRIPTION, EXECUTION_MODE, transcribe_audio_with_whisper
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": " inteiro", "segments": []}
+        with mock_registry(mock_model), patch('backend.main.CHUNK_MIN_AUDIO_SECONDS', 10):
+            transcribe_audio_with_whisper(self._noise(130))
+        
+        assert EXECUTION_MODE == 'thread' and CHUNKED_TRANSCRIPTION is False
+        assert mock_model.transcribe.call_count == 1
+
+
+class TestVoiceActivity:
+    """Testes para a remoção de silêncios antes do Whisper (VAD)"""
+    
+    def _speech_with_pauses(self):
+        """2s de fala, 5s de silêncio, 1s de fala, pausa curta, 1s de fala, 10s de silêncio, 3s de fala"""
+        import numpy as np
+        rng = np.random.default_rng(0)
+        
+        def speech(seconds):
+            return (rng.standard_normal(int(seconds * 16000)) * 0.1).astype(np.float32)
+        
+        def silence(seconds):
+            return (rng.standard_normal(int(seconds * 16000)) * 0.001).astype(np.float32)
+        
+        return np.concatenate([speech(2), silence(5), speech(1), silence(0.5), speech(1), silence(10), speech(3)])
+    
+    def test_long_silences_removed(self):
+        """Testa que silêncios longos saem, pausas curtas ficam e a fração removida é informada"""
+        from backend.main import remove_silence
+        
+        audio = self._speech_with_pauses()
+        speech_audio, time_map, skipped_fraction = remove_silence(audio)
+        
+        assert len(time_map) == 3
+        # Fala (7.5s com a pausa curta) + margens em volta de cada trecho
+        assert 7.5 <= speech_audio.size / 16000 <= 9.5
+        assert skipped_fraction == 1 - speech_audio.size / audio.size
+        assert time_map[-1][1] + time_map[-1][2] == audio.size / 16000
+    
+    def test_silent_audio_has_no_speech(self):
+        """Testa que um áudio só com silêncio é removido por inteiro"""
+        import numpy as np
+        from backend.main import remove_silence
+        
+        speech_audio, time_map, skipped_fraction = remove_silence(np.zeros(3 * 16000, dtype=np.float32))
+        
+        assert speech_audio.size == 0
+        assert time_map == []
+        assert skipped_fraction == 1.0
+    
+    def test_segments_mapped_to_original_timeline(self):
+        """Testa que os tempos do áudio filtrado voltam para o áudio original"""
+        from backend.main import remap_segments
+        
+        time_map = [(0.0, 0.0, 2.0), (2.0, 7.0, 3.0), (5.0, 20.0, 3.0)]
+        result = {"segments": [
+            {"start": 0.5, "end": 1.5, "text": " um"},
+            {"start": 2.5, "end": 4.0, "text": " dois"},
+            {"start": 5.0, "end": 8.0, "text": " três"}
+        ]}
+        
+        remap_segments(result, time_map)
+        
+        assert [(s["start"], s["end"]) for s in result["segments"]] == [(0.5, 1.5), (7.5, 9.0), (20.0, 23.0)]
+    
+    def test_pipeline_decodes_only_speech(self, sample_mp3_path, mock_registry):
+        """Testa que o Whisper recebe só a fala e o resultado informa a fração removida"""
+        from backend.main import create_job, get_job, process_audio_background
+        
+        audio = self._speech_with_pauses()
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": "Olá", "segments": [{"start": 2.5, "end": 3.0, "text": " Olá"}]}
+        
+        job_id = create_job("ligacao.mp3")
+        with mock_registry(mock_model), \
+             patch('backend.main.decode_audio_to_array', return_value=audio):
+            process_audio_background(
+                job_id, sample_mp3_path, "ligacao.mp3", {"duration": 22.5, "codec": "mp3", "tags": {}},
+                vad=True
+            )
+        
+        job = get_job(job_id)
+        decoded = mock_model.transcribe.call_args[0][0]
+        assert decoded.size < audio.size / 2
+        assert job['status'] == 'completed'
+        assert job['vad_skipped_fraction'] == job['result']['vad']['skipped_fraction'] > 0.5
+    
+    def test_vad_option_reaches_worker(self, app_client, sample_wav_file):
+        """Testa que ?vad=true vai para o worker e para a chave do cache"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.make_cache_key', return_value="chave") as make_key, \
+             patch('backend.main.scheduler.submit', return_value=0) as submit:
+            response = app_client.post("/transcribe?vad=true", files={"file": ("audio.wav", content, "audio/wav")})
+        
+        assert response.status_code == 202
+        assert make_key.call_args[0][3] is True
+        assert submit.call_args[0][9] is True
+        os.remove(submit.call_args[0][2])
+
+
+class TestDecodeProgress:
+    """Testes para o progresso real da decodificação"""
+    
+    def test_progress_from_decoded_seconds(self):
+        """Testa percentual, fator de tempo real e ETA"""
+        from backend.main import DecodeProgress, create_job, get_job
+        
+        job_id = create_job("longo.mp3")
+        progress = DecodeProgress(job_id, total_seconds=120)
+        progress.started -= 30  # 30s de processamento
+        progress.advance(60)
+        
+        job = get_job(job_id)
+        assert job['decoded_seconds'] == 60
+        assert job['percent'] == pytest.approx(52.5, abs=0.1)
+        assert job['real_time_factor'] == pytest.approx(0.5, abs=0.01)
+        assert job['eta_seconds'] == pytest.approx(30, abs=1)
+    
+    def test_whisper_window_loop_reports_progress(self):
+        """Testa que o avanço da barra interna do Whisper chega ao callback"""
+        import importlib
+        from backend.main import _run_whisper
+        
+        def fake_transcribe(audio, **kwargs):
+            with importlib.import_module('whisper.transcribe').tqdm.tqdm(total=6000, disable=True) as pbar:
+                pbar.update(3000)
+                pbar.update(3000)
+            return {"text": "ok"}
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.side_effect = fake_transcribe
+        reported = []
+        
+        _run_whisper(mock_model, "audio.wav", reported.append)
+        
+        assert reported == [30.0, 30.0]
+
+
+class TestIncrementalSegments:
+    """Testes para a publicação dos segmentos durante a decodificação"""
+    
+    def test_segments_published_while_decoding(self, mock_registry):
+        """Testa que os segmentos de uma janela aparecem no job antes do fim da transcrição"""
+        import importlib
+        import numpy as np
+        from whisper.utils import format_timestamp
+        from backend.main import create_job, get_job_segments, transcribe_audio_with_whisper
+        
+        job_id = create_job("longo.mp3")
+        seen_during_decode = []
+        
+        def fake_transcribe(audio, **kwargs):
+            # Como o laço do Whisper com verbose=True: uma linha por segmento ao fim de cada janela
+            module = importlib.import_module('whisper.transcribe')
+            all_segments = []
+            with module.tqdm.tqdm(total=6000, disable=True) as pbar:
+                for window in range(2):
+                    segment = {"start": window * 30.0, "end": window * 30.0 + 5, "text": f" janela {window}"}
+                    module.print(f"[{format_timestamp(segment['start'])} --> {format_timestamp(segment['end'])}] {segment['text']}")
+                    all_segments.append(segment)
+                    pbar.update(3000)
+                    seen_during_decode.append(get_job_segments(job_id)[1])
+            assert kwargs["verbose"] is True
+            return {"text": " janela 0 janela 1", "segments": all_segments}
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.side_effect = fake_transcribe
+        with mock_registry(mock_model):
+            transcribe_audio_with_whisper(np.zeros(60 * 16000, dtype=np.float32), job_id)
+        
+        segments, total, _ = get_job_segments(job_id)
+        assert seen_during_decode == [1, 2]
+        assert [s["text"] for s in segments] == ["janela 0", "janela 1"]
+        assert segments[1]["start"] == 30.0
+    
+    def test_real_whisper_loop_publishes_segments(self):
+        """Testa a publicação com o laço real do whisper.transcribe (só o decoder do modelo é simulado)"""
+        import torch
+        import whisper
+        import numpy as np
+        from whisper.decoding import DecodingResult
+        from whisper.tokenizer import get_tokenizer
+        from backend.main import _run_whisper
+        
+        tokenizer = get_tokenizer(True, num_languages=99, language="pt", task="transcribe")
+        windows = []
+        published = []
+        
+        def fake_decode(mel, options):
+            windows.append(len(windows))
+            tokens = [tokenizer.timestamp_begin, *tokenizer.encode(f" janela {len(windows)}"), tokenizer.timestamp_begin + 250]
+            return DecodingResult(
+                audio_features=None, language="pt", tokens=tokens, text=f" janela {len(windows)}",
+                avg_logprob=-0.1, no_speech_prob=0.0, temperature=0.0, compression_ratio=1.0
+            )
+        
+        model = MagicMock()
+        model.device = torch.device("cpu")
+        model.dims.n_mels = 80
+        model.dims.n_audio_ctx = 1500
+        model.dims.n_text_ctx = 448
+        model.is_multilingual = True
+        model.num_languages = 99
+        model.decode.side_effect = fake_decode
+        model.transcribe.side_effect = lambda audio, **kwargs: whisper.transcribe(model, audio, **kwargs)
+        
+        result = _run_whisper(model, np.zeros(60 * 16000, dtype=np.float32), on_segments=published.append)
+        
+        assert len(windows) == 2
+        assert [[s["text"] for s in batch] for batch in published] == [[" janela 1"], [" janela 2"]]
+        assert [s["start"] for batch in published for s in batch] == [0.0, 30.0]
+        assert len(result["segments"]) == 2
+    
+    def test_chunks_published_in_order(self):
+        """Testa que um bloco só é publicado depois dos anteriores, com tempos absolutos"""
+        from backend.main import SegmentPublisher, create_job, get_job_segments
+        
+        job_id = create_job("longo.mp3")
+        publisher = SegmentPublisher(job_id)
+        publisher.expect([0.0, 300.0])
+        
+        publisher.add(1, [{"start": 1.0, "end": 4.0, "text": " segundo bloco"}])
+        assert get_job_segments(job_id)[1] == 0
+        
+        publisher.add(0, [{"start": 0.0, "end": 3.0, "text": " primeiro"}])
+        assert get_job_segments(job_id)[1] == 1
+        
+        publisher.complete(0, {"segments": [
+            {"start": 0.0, "end": 3.0, "text": " primeiro"},
+            {"start": 3.0, "end": 6.0, "text": " bloco"}
+        ]})
+        publisher.complete(1, {"segments": [{"start": 1.0, "end": 4.0, "text": " segundo bloco"}]})
+        
+        segments, _, _ = get_job_segments(job_id)
+        assert [(s["id"], s["start"], s["text"]) for s in segments] == [
+            (0, 0.0, "primeiro"), (1, 3.0, "bloco"), (2, 301.0, "segundo bloco")
+        ]
+    
+    def test_vad_time_map_applied(self):
+        """Testa que os segmentos publicados usam a linha do tempo original"""
+        from backend.main import SegmentPublisher, create_job, get_job_segments
+        
+        job_id = create_job("ligacao.mp3")
+        publisher = SegmentPublisher(job_id, time_map=[(0.0, 0.0, 2.0), (2.0, 10.0, 5.0)])
+        publisher.complete(0, {"segments": [{"start": 2.5, "end": 4.0, "text": " depois da espera"}]})
+        
+        segment = get_job_segments(job_id)[0][0]
+        assert (segment["start"], segment["end"]) == (10.5, 12.0)
+    
+    def test_segments_endpoint_returns_only_new(self, app_client):
+        """Testa ?since=N: apenas os segmentos novos e o índice para a próxima chamada"""
+        from backend.main import create_job, append_job_segments
+        
+        job_id = create_job("a.mp3")
+        append_job_segments(job_id, [
+            {"id": i, "start": float(i), "end": i + 1.0, "text": f"s{i}"} for i in range(3)
+        ])
+        
+        data = app_client.get(f"/jobs/{job_id}/segments?since=1").json()
+        
+        assert [s["text"] for s in data["segments"]] == ["s1", "s2"]
+        assert data["next"] == 3
+        assert data["complete"] is False
+        assert app_client.get(f"/jobs/{job_id}/segments?since=3").json()["segments"] == []
+        assert app_client.get("/jobs/inexistente/segments").status_code == 404
+
+
 class TestAudioMetadata:
     """Testes para extração de metadados"""
     
@@ -116,6 +537,58 @@ class TestAudioMetadata:
         assert metadata["artist"] == "N/A"
 
 
+class TestMediaInspection:
+    """Testes para a inspeção de cabeçalhos com ffprobe"""
+    
+    FFPROBE_FLAC = json.dumps({
+        "streams": [{"codec_name": "flac", "sample_rate": "44100", "channels": 2, "duration": "7200.5"}],
+        "format": {"format_name": "flac", "duration": "7200.5", "tags": {"TITLE": "Reunião", "ARTIST": "Equipe"}}
+    })
+    
+    def test_probe_wav_reads_header_only(self, sample_wav_file):
+        """Testa inspeção de WAV PCM sem subprocesso"""
+        from backend.main import probe_audio_file
+        
+        with patch('subprocess.run') as mock_run:
+            info = probe_audio_file(sample_wav_file)
+        
+        mock_run.assert_not_called()
+        assert info["duration"] == 5.0
+        assert info["sample_rate"] == 16000
+        assert info["channels"] == 1
+    
+    @patch('subprocess.run')
+    def test_probe_feeds_validation_and_metadata(self, mock_run, temp_upload_dir):
+        """Testa que uma única chamada ao ffprobe alimenta validação e metadados"""
+        from backend.main import probe_audio_file, validate_audio_file, extract_audio_metadata
+        
+        mock_run.return_value = MagicMock(returncode=0, stdout=self.FFPROBE_FLAC, stderr="")
+        flac_path = os.path.join(temp_upload_dir, "reuniao.flac")
+        
+        info = probe_audio_file(flac_path)
+        assert validate_audio_file(flac_path, info) is True
+        metadata = extract_audio_metadata(flac_path, info)
+        
+        assert mock_run.call_count == 1
+        assert mock_run.call_args[0][0][0] == 'ffprobe'
+        assert metadata["title"] == "Reunião"
+        assert metadata["artist"] == "Equipe"
+        assert metadata["duration"] == "7200 segundos"
+        assert metadata["codec"] == "flac"
+        assert metadata["channels"] == 2
+    
+    def test_transcribe_rejects_invalid_audio(self, app_client, empty_wav_file):
+        """Testa que arquivos inválidos são recusados antes de entrar na fila"""
+        with open(empty_wav_file, 'rb') as f:
+            response = app_client.post(
+                "/transcribe",
+                files={"file": ("empty.wav", f, "audio/wav")}
+            )
+        
+        assert response.status_code == 400
+        assert "error" in response.json()
+
+
 class TestAPIHealth:
     """Testes para endpoint de saúde da API"""
     
@@ -161,6 +634,450 @@ class TestProgressTracker:
         assert isinstance(data["percent"], (int, float))
 
 
+class TestJobRegistry:
+    """Testes para o registro de jobs por upload"""
+    
+    def test_jobs_are_independent(self):
+        """Testa que atualizar um job não afeta outro"""
+        from backend.main import create_job, update_job, get_job
+        
+        first = create_job("a.mp3")
+        second = create_job("b.mp3")
+        update_job(first, status='completed', percent=100, result={"transcription": "a"})
+        
+        assert get_job(first)['status'] == 'completed'
+        assert get_job(second)['status'] == 'queued'
+        assert get_job(second)['result'] is None
+    
+    def test_finished_jobs_expire(self):
+        """Testa que jobs finalizados são removidos após o TTL"""
+        from backend.main import create_job, update_job, get_job
+        
+        job_id = create_job("a.mp3")
+        update_job(job_id, status='completed', percent=100)
+        
+        with patch('backend.main.JOB_TTL_SECONDS', -1):
+            assert get_job(job_id) is None
+    
+    def test_job_endpoints(self, app_client):
+        """Testa /jobs/{id} e /jobs/{id}/result"""
+        from backend.main import create_job, update_job
+        
+        job_id = create_job("a.mp3")
+        
+        response = app_client.get(f"/jobs/{job_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "queued"
+        
+        assert app_client.get(f"/jobs/{job_id}/result").status_code == 202
+        
+        update_job(job_id, status='completed', percent=100, result={"transcription": "Olá"})
+        response = app_client.get(f"/jobs/{job_id}/result")
+        assert response.status_code == 200
+        assert response.json()["transcription"] == "Olá"
+    
+    def test_unknown_job_returns_404(self, app_client):
+        """Testa consulta de job inexistente"""
+        assert app_client.get("/jobs/inexistente").status_code == 404
+        assert app_client.get("/jobs/inexistente/result").status_code == 404
+
+
+class TestJobEvents:
+    """Testes para o stream de eventos (SSE) dos jobs"""
+    
+    def test_completed_job_streams_result_once(self, app_client):
+        """Testa que o stream envia o estado e o resultado e então encerra"""
+        from backend.main import create_job, update_job
+        
+        job_id = create_job("a.mp3")
+        update_job(job_id, status='completed', percent=100, result={"transcription": "Olá"})
+        
+        response = app_client.get(f"/jobs/{job_id}/events")
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert response.text.count("event: result") == 1
+        assert '"transcription": "Olá"' in response.text
+    
+    def test_failed_job_streams_error(self, app_client):
+        """Testa o evento de falha"""
+        from backend.main import create_job, update_job
+        
+        job_id = create_job("a.mp3")
+        update_job(job_id, status='error', error="FFmpeg falhou")
+        
+        response = app_client.get(f"/jobs/{job_id}/events")
+        
+        assert "event: failed" in response.text
+        assert "FFmpeg falhou" in response.text
+    
+    def test_unknown_job_events_returns_404(self, app_client):
+        """Testa stream de job inexistente"""
+        assert app_client.get("/jobs/inexistente/events").status_code == 404
+    
+    def test_reconnect_resumes_segments_from_last_event_id(self, app_client):
+        """Testa que os eventos de segmentos têm id e que Last-Event-ID evita reenviá-los"""
+        from backend.main import create_job, update_job, append_job_segments
+        
+        job_id = create_job("a.mp3")
+        append_job_segments(job_id, [{"id": i, "start": float(i), "end": i + 1.0, "text": f"s{i}"} for i in range(3)])
+        update_job(job_id, status='completed', percent=100, result={"transcription": "s0 s1 s2"})
+        
+        first = app_client.get(f"/jobs/{job_id}/events").text
+        resumed = app_client.get(f"/jobs/{job_id}/events", headers={"Last-Event-ID": "2"}).text
+        
+        assert "id: 3\nevent: segments" in first
+        assert '"since": 2' in resumed
+        assert '"s0"' not in resumed and '"s2"' in resumed
+
+
+class TestStreamingTranscription:
+    """Testes para a transcrição em tempo real (/ws/stream)"""
+    
+    def _pcm(self, seconds, seed=0):
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        return (rng.standard_normal(int(seconds * 16000)) * 3000).astype('<i2').tobytes()
+    
+    def _segment_model(self, seconds_per_segment=4.0):
+        """Modelo simulado: um segmento a cada `seconds_per_segment` da janela recebida"""
+        mock_model = MagicMock()
+        
+        def transcribe(audio, **kwargs):
+            duration = audio.size / 16000
+            starts = [t * seconds_per_segment for t in range(int(duration // seconds_per_segment) + 1)]
+            return {"text": "", "segments": [
+                {"start": start, "end": min(start + seconds_per_segment, duration), "text": f" trecho {i}"}
+                for i, start in enumerate(starts) if start < duration
+            ]}
+        
+        mock_model.transcribe.side_effect = transcribe
+        return mock_model
+    
+    def test_stream_emits_partial_and_final_segments(self, app_client, mock_registry):
+        """Testa parciais durante o stream e segmentos finais com tempos absolutos"""
+        with mock_registry(self._segment_model()), patch('backend.main.STREAM_STEP_SECONDS', 1.0):
+            with app_client.websocket_connect("/ws/stream") as ws:
+                assert ws.receive_json()["type"] == "ready"
+                audio = self._pcm(12)
+                for start in range(0, len(audio), 6401):
+                    ws.send_bytes(audio[start:start + 6401])
+                ws.send_text("stop")
+                
+                messages = []
+                while not messages or messages[-1]["type"] != "done":
+                    messages.append(ws.receive_json())
+        
+        assert any(m["type"] == "partial" and m["text"] for m in messages)
+        segments = [s for m in messages if m["type"] == "final" for s in m["segments"]]
+        starts = [s["start"] for s in segments]
+        assert starts == sorted(starts)
+        assert segments[-1]["end"] == 12.0
+        assert messages[-1]["duration"] == 12.0
+    
+    def test_window_stays_bounded(self, mock_registry):
+        """Testa que a janela decodificada não cresce além do limite, mesmo com um único segmento"""
+        from backend.main import StreamingTranscriber, STREAM_WINDOW_SECONDS, STREAM_STEP_SECONDS
+        
+        session = StreamingTranscriber()
+        mock_model = self._segment_model(seconds_per_segment=1000)
+        with mock_registry(mock_model):
+            audio = self._pcm(100)
+            for start in range(0, len(audio), 32000):
+                session.feed(audio[start:start + 32000])
+        
+        decoded = [call[0][0].size / 16000 for call in mock_model.transcribe.call_args_list]
+        assert max(decoded) <= STREAM_WINDOW_SECONDS + STREAM_STEP_SECONDS
+        assert session.window.size / 16000 <= STREAM_WINDOW_SECONDS + STREAM_STEP_SECONDS
+    
+    def test_silence_is_not_decoded(self, mock_registry):
+        """Testa que janelas sem fala não chegam ao Whisper"""
+        from backend.main import StreamingTranscriber
+        
+        mock_model = MagicMock()
+        session = StreamingTranscriber()
+        with mock_registry(mock_model):
+            messages = session.feed(b'\x00\x00' * 16000 * 10)
+        
+        mock_model.transcribe.assert_not_called()
+        assert messages[0]["text"] == ""
+        assert session.window.size < 16000
+    
+    def test_stream_not_blocked_by_file_decode(self):
+        """Testa que o stream usa sua própria cópia do modelo enquanto um arquivo ocupa a principal"""
+        import threading
+        from backend.main import ModelRegistry, AVAILABLE_MODELS, StreamingTranscriber
+        
+        loaded = []
+        
+        def loader(name):
+            model = self._segment_model()
+            loaded.append(model)
+            return model
+        
+        registry = ModelRegistry(AVAILABLE_MODELS, 0, loader=loader)
+        decoding = threading.Event()
+        release = threading.Event()
+        
+        def long_file():
+            with registry.use("base"):
+                decoding.set()
+                release.wait(5)
+        
+        worker = threading.Thread(target=long_file)
+        worker.start()
+        decoding.wait(5)
+        try:
+            with patch('backend.main.model_registry', registry):
+                done = threading.Event()
+                thread = threading.Thread(target=lambda: (StreamingTranscriber("base").feed(self._pcm(4)), done.set()))
+                thread.start()
+                assert done.wait(5)
+        finally:
+            release.set()
+            worker.join()
+        
+        assert len(loaded) == 2
+        assert loaded[1].transcribe.called
+    
+    def test_session_limit(self, app_client):
+        """Testa que conexões acima de STREAM_MAX_SESSIONS são recusadas"""
+        from starlette.websockets import WebSocketDisconnect
+        
+        with patch('backend.main.STREAM_MAX_SESSIONS', 0):
+            with app_client.websocket_connect("/ws/stream") as ws:
+                assert ws.receive_json()["type"] == "error"
+                with pytest.raises(WebSocketDisconnect) as exc:
+                    ws.receive_json()
+        
+        assert exc.value.code == 1013
+
+
+class TestJobScheduler:
+    """Testes para a fila limitada de processamento"""
+    
+    def test_queue_positions_and_limit(self):
+        """Testa posição FIFO na fila e recusa quando a fila está cheia"""
+        import threading
+        from backend.main import JobScheduler, QueueFullError
+        
+        release = threading.Event()
+        started = threading.Event()
+        
+        def blocking_job(job_id):
+            started.set()
+            release.wait(5)
+        
+        scheduler = JobScheduler(num_workers=1, max_queue=2)
+        scheduler.submit("running", blocking_job)
+        assert started.wait(5)
+        
+        assert scheduler.submit("first", blocking_job) == 1
+        assert scheduler.submit("second", blocking_job) == 2
+        assert scheduler.position("second") == 2
+        
+        with pytest.raises(QueueFullError):
+            scheduler.submit("third", blocking_job)
+        
+        release.set()
+    
+    def test_transcribe_returns_429_when_queue_full(self, app_client, sample_wav_file):
+        """Testa 429 com Retry-After quando a fila está cheia"""
+        from backend.main import QueueFullError
+        
+        with patch('backend.main.scheduler.submit', side_effect=QueueFullError("Fila cheia")):
+            with open(sample_wav_file, 'rb') as f:
+                response = app_client.post(
+                    "/transcribe",
+                    files={"file": ("fila.wav", f, "audio/wav")}
+                )
+        
+        assert response.status_code == 429
+        assert int(response.headers["Retry-After"]) > 0
+
+
+class TestProcessPoolMode:
+    """Testes para o modo de execução com pool de processos"""
+    
+    def test_process_mode_uses_pool(self, sample_wav_file):
+        """Testa que no modo process a decodificação vai para o pool"""
+        from backend.main import transcribe_audio_with_whisper
+        
+        with patch('backend.main.EXECUTION_MODE', 'process'), \
+             patch('backend.main._transcribe_in_process_pool', return_value={"text": " Olá pool "}) as pool:
+            text = transcribe_audio_with_whisper(sample_wav_file)
+        
+        assert text == "Olá pool"
+        pool.assert_called_once()
+    
+    def test_worker_uses_process_local_model(self, mock_registry):
+        """Testa a função executada dentro do processo worker"""
+        from backend.main import _transcribe_in_worker, ModelRegistry
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": "worker"}
+        
+        with mock_registry(mock_model):
+            assert _transcribe_in_worker("audio.wav") == {"text": "worker"}
+        
+        def failing_loader(name):
+            raise RuntimeError("sem pesos")
+        with patch('backend.main.model_registry', ModelRegistry(["base"], 0, loader=failing_loader)):
+            with pytest.raises(Exception):
+                _transcribe_in_worker("audio.wav")
+
+
+class TestModelRegistry:
+    """Testes para o registro de modelos carregados sob demanda"""
+    
+    def test_model_loaded_once_on_first_use(self):
+        """Testa que o modelo só é carregado no primeiro uso, uma única vez"""
+        import threading
+        from backend.main import ModelRegistry
+        
+        loads = []
+        def loader(name):
+            loads.append(name)
+            return MagicMock(name=name)
+        registry = ModelRegistry(["tiny", "base"], 10**9, loader=loader)
+        assert registry.state("base") == "unloaded"
+        
+        threads = [threading.Thread(target=registry.preload, args=("base",)) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert loads == ["base"]
+        assert registry.state("base") == "ready"
+        assert registry.state("tiny") == "unloaded"
+    
+    def test_lru_eviction_by_memory_budget(self):
+        """Testa que o modelo ocioso menos usado é descarregado ao exceder o orçamento"""
+        import torch
+        from backend.main import ModelRegistry
+        
+        # Cada modelo simulado ocupa 1000 floats (4000 bytes)
+        registry = ModelRegistry(["tiny", "base", "small"], 9000, loader=lambda name: torch.nn.Linear(999, 1))
+        registry.preload("tiny")
+        registry.preload("base")
+        with registry.use("tiny"):
+            pass  # "tiny" passa a ser o mais recente
+        registry.preload("small")
+        
+        assert registry.state("base") == "unloaded"
+        assert registry.state("tiny") == "ready"
+        assert registry.state("small") == "ready"
+        assert [m["name"] for m in registry.stats()["loaded"]] == ["tiny", "small"]
+    
+    def test_unknown_model_rejected(self, app_client, sample_wav_file):
+        """Testa que um modelo fora da lista retorna 400 sem enfileirar"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.scheduler.submit') as submit:
+            response = app_client.post(
+                "/transcribe",
+                data={"model": "large-v3"},
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+        
+        assert response.status_code == 400
+        submit.assert_not_called()
+    
+    def test_requested_model_used_for_job_and_cache(self, app_client, sample_wav_file):
+        """Testa que o modelo escolhido vai para o job, o worker e a chave do cache"""
+        from backend.main import get_job
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.make_cache_key', return_value="chave") as make_key, \
+             patch('backend.main.scheduler.submit', return_value=0) as submit:
+            response = app_client.post(
+                "/transcribe?model=tiny",
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+        
+        assert response.status_code == 202
+        assert make_key.call_args[0][1] == "tiny"
+        assert submit.call_args[0][6] == "tiny"
+        assert get_job(response.json()["job_id"])["model"] == "tiny"
+        os.remove(submit.call_args[0][2])
+    
+    def test_health_reports_model_state(self, app_client):
+        """Testa que /health informa o estado do modelo padrão"""
+        data = app_client.get("/health").json()
+        
+        assert data["model_state"] in ["unloaded", "loading", "ready", "error"]
+        assert "base" in data["models"]["available"]
+
+
+class TestInt8Quantization:
+    """Testes para o modo de inferência int8 (quantização dinâmica)"""
+    
+    def test_linear_layers_quantized(self, tiny_whisper_model):
+        """Testa que todas as camadas lineares viram int8 e a saída se mantém próxima"""
+        import copy
+        import torch
+        from backend.main import quantize_model_int8
+        
+        mel = torch.randn(1, 80, 16)
+        with torch.no_grad():
+            expected = tiny_whisper_model.encoder(mel)
+            quantized = quantize_model_int8(copy.deepcopy(tiny_whisper_model))
+            actual = quantized.encoder(mel)
+        
+        linears = [m for m in quantized.modules() if isinstance(m, torch.nn.Linear)]
+        assert linears == []
+        assert any(isinstance(m, torch.ao.nn.quantized.dynamic.Linear) for m in quantized.modules())
+        assert torch.allclose(actual, expected, atol=0.1)
+    
+    def test_int8_model_cached_separately(self, tiny_whisper_model):
+        """Testa que a versão int8 é quantizada uma vez e convive com a fp32"""
+        import copy
+        import torch
+        from backend.main import ModelRegistry
+        
+        loads = []
+        def loader(name):
+            loads.append(name)
+            return copy.deepcopy(tiny_whisper_model)
+        registry = ModelRegistry(["base"], 10**9, loader=loader)
+        
+        for _ in range(2):
+            with registry.use("base", "int8") as model:
+                assert isinstance(model.encoder.blocks[0].mlp[0], torch.ao.nn.quantized.dynamic.Linear)
+        with registry.use("base", "fp32") as model:
+            assert type(model.encoder.blocks[0].mlp[0]) is not torch.ao.nn.quantized.dynamic.Linear
+        
+        assert loads == ["base", "base"]
+        assert registry.state("base", "int8") == "ready"
+        assert [m["name"] for m in registry.stats()["loaded"]] == ["base:int8", "base"]
+    
+    def test_compute_parameter(self, app_client, sample_wav_file):
+        """Testa a escolha da precisão por requisição"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.scheduler.submit', return_value=0) as submit:
+            invalid = app_client.post(
+                "/transcribe?compute=fp8",
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+            response = app_client.post(
+                "/transcribe",
+                data={"compute": "int8"},
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+        
+        assert invalid.status_code == 400
+        assert response.status_code == 202
+        assert submit.call_count == 1
+        assert submit.call_args[0][7] == "int8"
+        os.remove(submit.call_args[0][2])
+
+
 class TestTranscriptionEndpoint:
     """Testes para endpoint de transcrição"""
     
@@ -184,14 +1101,14 @@ class TestTranscriptionEndpoint:
         # Deve retornar erro de arquivo obrigatório
         assert response.status_code in [400, 422]
     
-    @patch('backend.main.whisper_model')
-    def test_transcribe_with_json_response(self, mock_whisper, app_client, sample_mp3_file):
+    @patch('backend.main.model_registry')
+    def test_transcribe_with_json_response(self, mock_registry, app_client, sample_mp3_file):
         """Testa que endpoint retorna JSON válido"""
         # Simular modelo Whisper
         mock_model = MagicMock()
         mock_model.transcribe.return_value = {"text": "Olá mundo"}
         
-        with open(sample_mp3_file, 'rb') as f:
+        with mock_registry(mock_model), open(sample_mp3_file, 'rb') as f:
             response = app_client.post(
                 "/transcribe",
                 files={"file": (os.path.basename(sample_mp3_file), f, "audio/mpeg")}
@@ -208,12 +1125,423 @@ class TestTranscriptionEndpoint:
             pytest.fail("Response is not valid JSON")
 
 
-class TestDownloadEndpoint:
-    """Testes para endpoint de download"""
+class TestStreamingUpload:
+    """Testes para o recebimento de uploads em streaming"""
     
-    def test_download_nonexistent_file(self, app_client):
-        """Testa download de arquivo inexistente"""
-        response = app_client.get("/download/nonexistent_file.txt")
+    def test_upload_too_large_rejected(self, app_client):
+        """Testa que uploads acima do limite retornam 413 sem deixar arquivos"""
+        from backend.main import UPLOAD_DIR
+        before = set(os.listdir(UPLOAD_DIR))
+        
+        with patch('backend.main.MAX_UPLOAD_BYTES', 1024), \
+             patch('backend.main.scheduler.submit') as submit:
+            response = app_client.post(
+                "/transcribe",
+                files={"file": ("grande.wav", b"\0" * 4096, "audio/wav")}
+            )
+        
+        assert response.status_code == 413
+        assert "error" in response.json()
+        submit.assert_not_called()
+        assert set(os.listdir(UPLOAD_DIR)) == before
+    
+    def test_hash_and_size_computed_while_receiving(self, app_client, sample_wav_file):
+        """Testa que SHA-256 e tamanho são calculados durante o recebimento"""
+        import hashlib
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.make_cache_key', return_value="chave") as make_key, \
+             patch('backend.main.scheduler.submit', return_value=0) as submit:
+            response = app_client.post(
+                "/transcribe",
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+        
+        assert response.status_code == 202
+        make_key.assert_called_once_with(hashlib.sha256(content).hexdigest(), "base", "fp32", False)
+        file_path = submit.call_args[0][2]
+        with open(file_path, 'rb') as f:
+            assert f.read() == content
+        os.remove(file_path)
+    
+    def test_same_filename_gets_unique_paths(self, app_client, sample_wav_file):
+        """Testa que uploads com o mesmo nome não sobrescrevem um ao outro"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.scheduler.submit', return_value=0) as submit:
+            for _ in range(2):
+                app_client.post("/transcribe", files={"file": ("audio.wav", content, "audio/wav")})
+        
+        paths = [call[0][2] for call in submit.call_args_list]
+        filenames = [call[0][3] for call in submit.call_args_list]
+        assert len(set(paths)) == 2
+        assert filenames == ["audio.wav", "audio.wav"]
+        for path in paths:
+            assert os.path.basename(path) != "audio.wav"
+            os.remove(path)
+    
+    def test_non_multipart_body_rejected(self, app_client):
+        """Testa que um corpo que não é multipart retorna 400"""
+        response = app_client.post("/transcribe", content=b"abc", headers={"Content-Type": "audio/wav"})
+        
+        assert response.status_code == 400
+
+class TestTranscriptionCache:
+    """Testes para o cache de transcrições endereçado por conteúdo"""
+    
+    def test_lru_eviction_by_bytes(self, temp_upload_dir):
+        """Testa despejo do item menos usado quando o limite de bytes é excedido"""
+        from backend.main import TranscriptionCache
+        
+        cache = TranscriptionCache(temp_upload_dir, max_bytes=150)
+        cache.put("a", {"transcription": "x" * 40})
+        cache.put("b", {"transcription": "y" * 40})
+        assert cache.get("a") is not None  # "a" passa a ser o mais recente
+        cache.put("c", {"transcription": "z" * 40})
+        
+        assert cache.get("b") is None
+        assert cache.get("a")["transcription"] == "x" * 40
+        assert cache.get("c") is not None
+        stats = cache.stats()
+        assert stats["hits"] == 3
+        assert stats["misses"] == 1
+        assert stats["bytes"] <= 150
+    
+    def test_cache_survives_restart(self, temp_upload_dir):
+        """Testa que as entradas em disco são recarregadas"""
+        from backend.main import TranscriptionCache
+        
+        TranscriptionCache(temp_upload_dir, max_bytes=1000).put("k", {"transcription": "Olá"})
+        
+        assert TranscriptionCache(temp_upload_dir, max_bytes=1000).get("k") == {"transcription": "Olá"}
+    
+    def test_entries_shared_between_processes(self, temp_upload_dir):
+        """Testa que entradas gravadas por outro processo (worker) são encontradas e contam no limite"""
+        from backend.main import TranscriptionCache
+        
+        api = TranscriptionCache(temp_upload_dir, max_bytes=150)
+        worker = TranscriptionCache(temp_upload_dir, max_bytes=150)
+        worker.put("a", {"transcription": "x" * 40})
+        assert api.get("a") == {"transcription": "x" * 40}
+        
+        api.put("b", {"transcription": "y" * 40})
+        worker.put("c", {"transcription": "z" * 40})  # "a" é o menos usado no diretório
+        
+        assert api.get("a") is None
+        assert api.get("b") is not None
+        assert worker.stats()["bytes"] == api.stats()["bytes"] <= 150
+    
+    def test_key_depends_on_decode_options(self):
+        """Testa que modelo/opções diferentes geram chaves diferentes"""
+        from backend.main import make_cache_key
+        
+        key = make_cache_key("abc")
+        with patch('backend.main.WHISPER_MODEL_NAME', 'small'):
+            assert make_cache_key("abc") != key
+        assert make_cache_key("abc") == key
+    
+    def test_transcribe_cache_hit(self, app_client, sample_wav_file, temp_upload_dir):
+        """Testa que um upload repetido é respondido do cache sem enfileirar"""
+        import hashlib
+        from backend.main import make_cache_key, TranscriptionCache
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        cache = TranscriptionCache(temp_upload_dir, max_bytes=10000)
+        cache.put(make_cache_key(hashlib.sha256(content).hexdigest()), {
+            "status": "success",
+            "transcription": "Do cache",
+            "metadata": {"filename": "original.wav", "format": "WAV"}
+        })
+        
+        with patch('backend.main.transcription_cache', cache), \
+             patch('backend.main.scheduler.submit') as submit:
+            response = app_client.post(
+                "/transcribe",
+                files={"file": ("repetido.wav", content, "audio/wav")}
+            )
+        
+        submit.assert_not_called()
+        assert response.status_code == 200
+        data = response.json()
+        assert data["status"] == "completed"
+        assert data["result"]["transcription"] == "Do cache"
+        assert data["result"]["cached"] is True
+        assert data["result"]["metadata"]["filename"] == "repetido.wav"
+        assert data["result"]["download_file"].endswith("_transcricao.txt")
+
+
+class TestMetrics:
+    """Testes para o endpoint /metrics (formato Prometheus)"""
+    
+    def test_histogram_buckets_are_cumulative(self):
+        """Testa a renderização de um histograma com labels"""
+        from backend.main import Histogram, _metrics
+        
+        histogram = Histogram("teste_segundos", "Teste", (1, 5), labels=('stage',))
+        _metrics.remove(histogram)
+        for value in (0.5, 2, 10):
+            histogram.observe(value, stage='decode')
+        
+        lines = histogram.render()
+        assert '# TYPE teste_segundos histogram' in lines
+        assert 'teste_segundos_bucket{stage="decode",le="1"} 1' in lines
+        assert 'teste_segundos_bucket{stage="decode",le="5"} 2' in lines
+        assert 'teste_segundos_bucket{stage="decode",le="+Inf"} 3' in lines
+        assert 'teste_segundos_sum{stage="decode"} 12.5' in lines
+        assert 'teste_segundos_count{stage="decode"} 3' in lines
+    
+    def test_pipeline_records_stage_durations(self, sample_mp3_path, app_client, mock_registry):
+        """Testa que o pipeline registra as etapas, o áudio processado e o RTF"""
+        import numpy as np
+        from backend.main import create_job, process_audio_background
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": "Olá"}
+        audio = np.zeros(32000, dtype=np.float32)
+        
+        job_id = create_job("metricas.mp3")
+        with mock_registry(mock_model), \
+             patch('backend.main.decode_audio_to_array', return_value=audio), \
+             patch('backend.main.probe_audio_file', return_value={"duration": 2.0, "codec": "mp3", "tags": {}}):
+            process_audio_background(job_id, sample_mp3_path, "metricas.mp3")
+        
+        response = app_client.get("/metrics")
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/plain")
+        body = response.text
+        for stage in ('validation', 'metadata', 'conversion', 'decode', 'save'):
+            assert f'transcriber_stage_duration_seconds_count{{stage="{stage}"}}' in body
+        assert 'transcriber_jobs_total{status="completed"}' in body
+        assert 'transcriber_real_time_factor_count' in body
+        assert 'transcriber_audio_seconds_total' in body
+    
+    def test_queue_and_cache_gauges(self, app_client):
+        """Testa as métricas lidas no momento da coleta"""
+        with patch('backend.main.scheduler.stats', return_value={"workers": 2, "running": 1, "queued": 3, "max_queue": 20}):
+            body = app_client.get("/metrics").text
+        
+        assert 'transcriber_jobs_in_flight 1' in body
+        assert 'transcriber_jobs_queued 3' in body
+        assert 'transcriber_cache_hits_total' in body
+
+
+class TestJobProfiling:
+    """Testes para o perfil opcional de jobs (cProfile + tracemalloc)"""
+    
+    def _run_pipeline(self, sample_mp3_path, mock_registry, profile_timings):
+        import numpy as np
+        from backend.main import create_job, get_job, process_audio_background, TranscriptionCache
+        
+        mock_model = MagicMock()
+        mock_model.transcribe.return_value = {"text": "Olá perfil"}
+        cache = MagicMock(spec=TranscriptionCache)
+        
+        job_id = create_job("perfil.mp3")
+        with mock_registry(mock_model), \
+             patch('backend.main.transcription_cache', cache), \
+             patch('backend.main.decode_audio_to_array', return_value=np.zeros(16000, dtype=np.float32)):
+            process_audio_background(
+                job_id, sample_mp3_path, "perfil.mp3", {"duration": 1.0, "codec": "mp3", "tags": {}},
+                "chave", profile_timings=profile_timings
+            )
+        return get_job(job_id), cache
+    
+    def test_profiled_job_attaches_report(self, sample_mp3_path, mock_registry, app_client):
+        """Testa que o job com perfil traz etapas, funções e arquivos para download"""
+        import tracemalloc
+        
+        job, cache = self._run_pipeline(sample_mp3_path, mock_registry, {"upload": 0.01})
+        
+        profile = job['result']['profile']
+        assert set(profile['stages']) == {'upload', 'metadata', 'conversion', 'decode', 'save'}
+        assert profile['top_functions']
+        assert not tracemalloc.is_tracing()
+        # O resultado em cache não carrega o perfil
+        assert 'profile' not in cache.put.call_args[0][1]
+        
+        report = app_client.get(f"/profiles/{profile['report']}")
+        assert report.status_code == 200
+        assert "Etapas:" in report.text
+        assert app_client.get(f"/profiles/{profile['cpu_profile']}").status_code == 200
+    
+    def test_job_without_profile(self, sample_mp3_path, mock_registry):
+        """Testa que sem a opção o resultado não tem perfil"""
+        job, _ = self._run_pipeline(sample_mp3_path, mock_registry, None)
+        
+        assert job['status'] == 'completed'
+        assert 'profile' not in job['result']
+        assert job['profile'] is None
+    
+    def test_profile_header_enables_profiling(self, app_client, sample_wav_file):
+        """Testa que o cabeçalho X-Profile liga o perfil e ignora o cache"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.transcription_cache.get') as cache_get, \
+             patch('backend.main.scheduler.submit', return_value=0) as submit:
+            response = app_client.post(
+                "/transcribe",
+                headers={"X-Profile": "1"},
+                files={"file": ("audio.wav", content, "audio/wav")}
+            )
+        
+        assert response.status_code == 202
+        cache_get.assert_not_called()
+        timings = submit.call_args[0][8]
+        assert set(timings) == {'upload', 'validation'}
+        os.remove(submit.call_args[0][2])
+    
+    def test_overlapping_jobs_keep_their_peaks(self, temp_upload_dir):
+        """Testa que o início de um segundo job com perfil não apaga o pico do primeiro"""
+        from backend.main import JobProfiler
+        
+        first = JobProfiler("primeiro")
+        first.start()
+        block = bytearray(8 * 1024 * 1024)
+        del block
+        second = JobProfiler("segundo")
+        second.start()
+        second_report = second.stop({})
+        first_report = first.stop({})
+        
+        assert first_report["memory_peak_mb"] >= 8
+        assert second_report["memory_peak_mb"] < 8
+    
+    def test_profiler_start_failure_fails_job(self, sample_mp3_path, mock_registry):
+        """Testa que uma falha ao iniciar o perfil finaliza o job com erro em vez de deixá-lo na fila"""
+        import tracemalloc
+        
+        with patch('backend.main.JobProfiler.start', side_effect=ValueError("outro profiler ativo")):
+            job, _ = self._run_pipeline(sample_mp3_path, mock_registry, {"upload": 0.01})
+        
+        assert job['status'] == 'error'
+        assert "outro profiler ativo" in job['error']
+        assert not tracemalloc.is_tracing()
+    
+    def test_profile_download_outside_dir_denied(self, app_client):
+        """Testa que não é possível baixar arquivos fora do diretório de perfis"""
+        response = app_client.get("/profiles/..%2Fcache")
+        
+        assert response.status_code in [403, 404]
+
+
+class TestBatchTranscription:
+    """Testes para a transcrição em lote (/transcribe/batch)"""
+    
+    def _wav_bytes(self, sample_wav_file):
+        with open(sample_wav_file, 'rb') as f:
+            return f.read()
+    
+    def test_clips_decoded_in_one_batch_with_fallback(self):
+        """Testa que os clipes vão juntos ao decode e que clipes ruins são refeitos"""
+        import numpy as np
+        from types import SimpleNamespace
+        from backend.main import decode_clip_batch
+        
+        model = MagicMock()
+        model.dims.n_mels = 80
+        model.device = "cpu"
+        model.transcribe.return_value = {"text": " refeito "}
+        results = [
+            SimpleNamespace(text=" bom dia", no_speech_prob=0.01, avg_logprob=-0.2, compression_ratio=1.2),
+            SimpleNamespace(text=" a a a a a a", no_speech_prob=0.01, avg_logprob=-0.3, compression_ratio=3.5),
+            SimpleNamespace(text=" obrigado", no_speech_prob=0.9, avg_logprob=-1.5, compression_ratio=1.0)
+        ]
+        audios = [np.zeros(16000 * n, dtype=np.float32) for n in (2, 5, 8)]
+        
+        with patch('whisper.decode', return_value=results) as decode:
+            texts = decode_clip_batch(model, audios)
+        
+        assert decode.call_count == 1
+        assert decode.call_args[0][1].shape == (3, 80, 3000)
+        assert texts == ["bom dia", "refeito", ""]
+        assert model.transcribe.call_count == 1
+    
+    def test_batch_upload_creates_job_per_file(self, app_client, sample_wav_file):
+        """Testa o envio de vários arquivos e a consulta do lote"""
+        content = self._wav_bytes(sample_wav_file)
+        
+        with patch('backend.main.scheduler.submit', return_value=1) as submit:
+            response = app_client.post(
+                "/transcribe/batch",
+                files=[("file", (f"clipe{i}.wav", content, "audio/wav")) for i in range(3)]
+            )
+        
+        assert response.status_code == 202
+        data = response.json()
+        assert len(data["jobs"]) == 3
+        items = submit.call_args[0][2]
+        assert [item['filename'] for item in items] == ["clipe0.wav", "clipe1.wav", "clipe2.wav"]
+        
+        batch = app_client.get(f"/batches/{data['batch_id']}").json()
+        assert batch["total"] == 3
+        assert batch["status"] == "processing"
+        for item in items:
+            os.remove(item['path'])
+    
+    def test_zip_upload_extracts_audio_files(self, app_client, sample_wav_file):
+        """Testa o envio de um .zip (ignorando arquivos que não são áudio)"""
+        import io
+        import zipfile
+        
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as archive:
+            archive.writestr("pasta/a.wav", self._wav_bytes(sample_wav_file))
+            archive.writestr("b.wav", self._wav_bytes(sample_wav_file))
+            archive.writestr("leia-me.txt", "não é áudio")
+        
+        with patch('backend.main.scheduler.submit', return_value=1) as submit:
+            response = app_client.post(
+                "/transcribe/batch",
+                files={"file": ("lote.zip", buffer.getvalue(), "application/zip")}
+            )
+        
+        assert response.status_code == 202
+        items = submit.call_args[0][2]
+        assert sorted(item['filename'] for item in items) == ["a.wav", "b.wav"]
+        for item in items:
+            assert os.path.exists(item['path'])
+            os.remove(item['path'])
+    
+    def test_batch_pipeline_completes_jobs(self, mock_registry, sample_wav_file):
+        """Testa o processamento do lote: clipes em batch e arquivos longos pelo caminho normal"""
+        import shutil
+        import numpy as np
+        from backend.main import create_job, get_job, process_batch_background, UPLOAD_DIR
+        
+        items = []
+        for name, duration in (("curto1.wav", 5.0), ("curto2.wav", 12.0), ("longo.wav", 90.0)):
+            path = os.path.join(UPLOAD_DIR, f"lote_{name}")
+            shutil.copyfile(sample_wav_file, path)
+            items.append({
+                'job_id': create_job(name), 'path': path, 'filename': name,
+                'info': {"duration": duration, "codec": "pcm_s16le", "tags": {}}, 'cache_key': None
+            })
+        
+        with mock_registry(MagicMock()), \
+             patch('backend.main.decode_audio_to_array', return_value=np.zeros(16000, dtype=np.float32)), \
+             patch('backend.main.decode_clip_batch', return_value=["um", ""]) as batch_decode, \
+             patch('backend.main.process_audio_background') as single:
+            process_batch_background("lote", items)
+        
+        batch_decode.assert_called_once()
+        assert get_job(items[0]['job_id'])['result']['transcription'] == "um"
+        assert get_job(items[1]['job_id'])['result']['transcription'] == "[Áudio não contém fala reconhecível]"
+        assert single.call_args[0][0] == items[2]['job_id']
+        assert not os.path.exists(items[0]['path'])
+        os.remove(items[2]['path'])
+
+
+class TestDownloadEndpoint:
+    """Testes para endpoint de download"""
+    
+    def test_download_nonexistent_file(self, app_client):
+        """Testa download de arquivo inexistente"""
+        response = app_client.get("/download/nonexistent_file.txt")
         
         assert response.status_code in [404, 400]
     
@@ -232,6 +1560,686 @@ class TestDownloadEndpoint:
         assert response.status_code in [404, 400]
 
 
+class TestTranscriptStore:
+    """Testes para o banco de transcrições com busca textual (/search e /download)"""
+    
+    @pytest.fixture
+    def store(self, temp_upload_dir):
+        from backend.main import TranscriptStore
+        store = TranscriptStore(os.path.join(temp_upload_dir, "transcricoes.db"))
+        with patch('backend.main.transcript_store', store):
+            yield store
+    
+    def test_search_ranks_and_highlights(self, store):
+        """Testa relevância, trecho destacado e segmentos com tempos, ignorando acentos"""
+        store.save("Orçamento, orçamento e mais orçamento na sessão.", "reuniao.mp3", segments=[
+            {"start": 0.0, "end": 2.0, "text": "Bom dia."},
+            {"start": 2.0, "end": 6.0, "text": "Orçamento, orçamento e mais orçamento na sessão."}
+        ])
+        store.save("A sessão falou de outras coisas, inclusive orçamento.", "outra.mp3")
+        store.save("Nada a ver com o assunto.", "terceira.mp3")
+        
+        total, hits = store.search("orcamento sessao")
+        
+        assert total == 2
+        assert hits[0]["filename"] == "reuniao.mp3"
+        assert "[Orçamento]" in hits[0]["snippet"]
+        assert hits[0]["segments"][0]["start"] == 2.0
+        assert hits[0]["score"] > hits[1]["score"]
+    
+    def test_user_query_is_sanitized(self, store):
+        """Testa que operadores e aspas soltas não quebram a consulta FTS5"""
+        from backend.main import TranscriptStore
+        
+        store.save("Relatório anual da diretoria.", "relatorio.mp3")
+        
+        assert TranscriptStore.build_query('relat* AND "anual da" (') == '"relat"* "AND" "anual da"'
+        assert store.search('relat*')[0] == 1
+        assert store.search('"diretoria anual"')[0] == 0
+        assert store.search('NOT OR (')[0] == 0
+    
+    def test_search_endpoint_paginates(self, app_client, store):
+        """Testa a paginação de /search e a validação do termo"""
+        for i in range(5):
+            store.save(f"Contrato número {i} assinado.", f"contrato_{i}.mp3")
+        
+        data = app_client.get("/search?q=contrato&page=2&page_size=2").json()
+        
+        assert data["total"] == 5
+        assert data["pages"] == 3
+        assert len(data["hits"]) == 2
+        assert app_client.get("/search?q=").status_code == 400
+    
+    def test_download_served_from_store(self, app_client, store):
+        """Testa que /download gera o arquivo a partir do banco"""
+        from backend.main import save_transcription_file
+        
+        download_file = save_transcription_file("Texto salvo no banco.", "gravacao.mp3")
+        response = app_client.get(f"/download/{download_file}")
+        
+        assert download_file.endswith("_transcricao.txt")
+        assert response.status_code == 200
+        assert "Arquivo: gravacao.mp3" in response.text
+        assert "Texto salvo no banco." in response.text
+    
+    def test_legacy_files_imported(self, temp_upload_dir):
+        """Testa que arquivos .txt antigos são importados para o banco e removidos"""
+        from backend.main import TranscriptStore, format_transcription_document
+        
+        legacy_path = os.path.join(temp_upload_dir, "antiga_transcricao.txt")
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            f.write(format_transcription_document("Conteúdo da transcrição antiga.", "antiga.mp3"))
+        
+        store = TranscriptStore(os.path.join(temp_upload_dir, "transcricoes.db"))
+        assert os.path.exists(legacy_path)  # criar o banco não migra nada
+        
+        assert store.import_legacy_files(temp_upload_dir) == 1
+        
+        assert not os.path.exists(legacy_path)
+        assert "Conteúdo da transcrição antiga." in store.get_document("antiga_transcricao.txt")
+        assert store.search("antiga")[1][0]["filename"] == "antiga.mp3"
+    
+    def test_legacy_import_runs_at_startup(self, temp_upload_dir):
+        """Testa que a migração roda no startup da API (lifespan), não na importação do módulo"""
+        from backend.main import app, TranscriptStore
+        
+        store = TranscriptStore(os.path.join(temp_upload_dir, "transcricoes.db"))
+        with patch('backend.main.transcript_store', store), \
+             patch.object(store, 'import_legacy_files', return_value=0) as migrate, \
+             patch('backend.main.MODEL_PRELOAD', False):
+            with TestClient(app):
+                pass
+        
+        migrate.assert_called_once()
+
+
+class TestSQLiteJobStore:
+    """Testes para o registro de jobs compartilhado em SQLite (JOB_STORE=sqlite)"""
+    
+    @pytest.fixture
+    def job_store(self, temp_upload_dir):
+        from backend.main import SQLiteJobStore
+        store = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "api-1", lease_seconds=60)
+        with patch('backend.main.job_store', store):
+            yield store
+    
+    def test_job_round_trip(self, job_store, temp_upload_dir):
+        """Testa criação, atualização, segmentos e versão de um job pelo banco"""
+        from backend.main import (
+            SQLiteJobStore, create_job, update_job, get_job, append_job_segments,
+            get_job_segments, get_job_version
+        )
+        
+        job_id = create_job("a.mp3", "base", "fp32")
+        update_job(job_id, status='processing', percent=40)
+        append_job_segments(job_id, [{"id": 0, "start": 0.0, "end": 2.0, "text": "Olá."}])
+        
+        # Outro processo da API enxerga o mesmo estado
+        other = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "api-2", lease_seconds=60)
+        job = other.get(job_id)
+        
+        assert job["status"] == "processing"
+        assert job["percent"] == 40
+        assert job["segments"][0]["text"] == "Olá."
+        assert get_job_version(job_id) == 2
+        assert get_job_segments(job_id, since=1) == ([], 1, "processing")
+        
+        update_job(job_id, status='completed', percent=100, result={"transcription": "Olá."})
+        assert get_job(job_id)["finished_at"] is not None
+        assert other.latest() == job_id
+    
+    def test_expired_lease_is_claimed(self, job_store, temp_upload_dir):
+        """Testa que jobs não finalizados só são reassumidos após o lease vencer"""
+        from backend.main import SQLiteJobStore, create_job, update_job
+        
+        running = create_job("a.mp3")
+        finished = create_job("b.mp3")
+        update_job(finished, status='completed', percent=100)
+        other = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "api-2", lease_seconds=60)
+        
+        assert other.claim_interrupted() == []
+        
+        with patch('backend.main.time.time', return_value=time.time() + 120):
+            claimed = other.claim_interrupted()
+        
+        assert [job["id"] for job in claimed] == [running]
+    
+    def test_interrupted_job_is_resubmitted(self, job_store, temp_upload_dir):
+        """Testa que um job interrompido volta para a fila com os mesmos argumentos"""
+        from backend.main import create_job, update_job, get_job, recover_interrupted_jobs, _job_task
+        
+        file_path = os.path.join(temp_upload_dir, "enviado.mp3")
+        with open(file_path, 'wb') as f:
+            f.write(b"audio")
+        job_id = create_job("enviado.mp3", "base", "fp32")
+        update_job(job_id, status='processing', percent=50, task=_job_task(
+            file_path, "enviado.mp3", {"duration": 12.0}, "chave", "base", "fp32", True
+        ))
+        
+        with patch('backend.main.time.time', return_value=time.time() + 120), \
+             patch('backend.main.scheduler.submit', return_value=1) as submit:
+            assert recover_interrupted_jobs() == 1
+        
+        args, kwargs = submit.call_args
+        assert args[0] == job_id
+        assert args[2] == file_path
+        assert args[9] is True
+        assert kwargs["audio_seconds"] == 12.0
+        assert get_job(job_id)["status"] == "queued"
+    
+    def test_interrupted_job_without_file_fails(self, job_store):
+        """Testa que um job interrompido cujo arquivo sumiu é finalizado com erro"""
+        from backend.main import create_job, get_job, recover_interrupted_jobs
+        
+        job_id = create_job("perdido.mp3")
+        
+        with patch('backend.main.time.time', return_value=time.time() + 120), \
+             patch('backend.main.scheduler.submit') as submit:
+            assert recover_interrupted_jobs() == 0
+        
+        submit.assert_not_called()
+        assert get_job(job_id)["status"] == "error"
+
+
+class TestJobQueue:
+    """Testes para a fila de jobs do modo queue (API enfileira, worker.py transcreve)"""
+    
+    @pytest.fixture
+    def job_store(self, temp_upload_dir):
+        from backend.main import SQLiteJobStore
+        store = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "api-1", lease_seconds=60)
+        with patch('backend.main.job_store', store), patch('backend.main.EXECUTION_MODE', 'queue'):
+            yield store
+    
+    def test_workers_claim_enqueued_jobs_in_order(self, job_store, temp_upload_dir):
+        """Testa que workers só assumem jobs liberados, em ordem, cada um uma única vez"""
+        from backend.main import SQLiteJobStore, create_job
+        
+        first = create_job("a.mp3")
+        second = create_job("b.mp3")
+        pending = create_job("c.mp3")  # ainda na admissão da API
+        
+        assert job_store.enqueue([first, second], max_queued=10) == 1
+        assert job_store.queue_position(second) == 2
+        assert job_store.queue_position(pending) is None
+        
+        worker_1 = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-1", lease_seconds=60)
+        worker_2 = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-2", lease_seconds=60)
+        
+        assert worker_1.claim_next()["id"] == first
+        assert worker_2.claim_next()["id"] == second
+        assert worker_1.claim_next() is None
+        assert job_store.queue_length() == 0
+    
+    def test_queue_limit(self, job_store):
+        """Testa que a fila recusa novos jobs ao atingir TRANSCRIBE_QUEUE_SIZE"""
+        from backend.main import create_job, enqueue_for_workers, QueueFullError
+        
+        with patch('backend.main.TRANSCRIBE_QUEUE_SIZE', 2):
+            enqueue_for_workers([create_job("a.mp3")])
+            enqueue_for_workers([create_job("b.mp3")], held_ids=[create_job("c.mp3")])  # um lote é uma entrada
+            with pytest.raises(QueueFullError):
+                enqueue_for_workers([create_job("d.mp3")])
+    
+    def test_transcribe_only_enqueues(self, app_client, job_store, sample_wav_file):
+        """Testa que /transcribe no modo queue grava o job na fila sem transcrever"""
+        from backend.main import get_job
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        with patch('backend.main.scheduler.submit') as submit:
+            response = app_client.post("/transcribe", files={"file": ("audio.wav", content, "audio/wav")})
+        
+        job_id = response.json()["job_id"]
+        assert response.status_code == 202
+        assert response.json()["queue_position"] == 1
+        submit.assert_not_called()
+        assert app_client.get(f"/jobs/{job_id}").json()["queue_position"] == 1
+        os.remove(get_job(job_id)["task"]["file_path"])
+    
+    def test_worker_runs_claimed_job(self, job_store, temp_upload_dir):
+        """Testa que o worker executa o pipeline com os argumentos gravados no job"""
+        from backend.main import create_job, update_job, run_claimed_job, _job_task
+        
+        file_path = os.path.join(temp_upload_dir, "enviado.mp3")
+        with open(file_path, 'wb') as f:
+            f.write(b"audio")
+        job_id = create_job("enviado.mp3", "tiny", "int8")
+        update_job(job_id, task=_job_task(file_path, "enviado.mp3", {"duration": 5.0}, "chave", "tiny", "int8", False))
+        job_store.enqueue([job_id], max_queued=10)
+        
+        with patch('backend.main.process_audio_background') as process:
+            run_claimed_job(job_store.claim_next())
+        
+        process.assert_called_once_with(
+            job_id, file_path, "enviado.mp3", {"duration": 5.0}, "chave", "tiny", "int8", None, False
+        )
+        os.remove(file_path)
+    
+    def test_batch_is_one_task_for_one_worker(self, app_client, job_store, sample_wav_file, temp_upload_dir):
+        """Testa que um lote no modo queue é uma entrada na fila, assumida e executada inteira por um worker"""
+        from backend.main import SQLiteJobStore, get_job, run_claimed_job
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        response = app_client.post(
+            "/transcribe/batch", files=[("file", (f"clipe{i}.wav", content, "audio/wav")) for i in range(3)]
+        )
+        batch_id = response.json()["batch_id"]
+        job_ids = [job["job_id"] for job in response.json()["jobs"]]
+        
+        assert response.status_code == 202
+        assert job_store.queue_length() == 1
+        assert app_client.get(f"/batches/{batch_id}").json()["queue_position"] == 1
+        
+        worker_1 = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-1", lease_seconds=60)
+        worker_2 = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-2", lease_seconds=60)
+        claimed = worker_1.claim_next()
+        assert claimed["id"] == job_ids[0]
+        assert worker_2.claim_next() is None
+        
+        with patch('backend.main.process_batch_background') as process:
+            run_claimed_job(claimed)
+        
+        args = process.call_args[0]
+        assert args[0] == batch_id
+        assert [item['job_id'] for item in args[1]] == job_ids
+        assert 'batch' not in get_job(job_ids[0])["task"]
+        
+        # Worker caiu no meio do lote: os jobs abertos voltam como jobs individuais
+        with patch('backend.main.time.time', return_value=time.time() + 120):
+            assert worker_2.claim_next()["id"] in job_ids
+        for item in args[1]:
+            os.remove(item['path'])
+    
+    def test_queue_gauges_read_from_job_store(self, app_client, job_store, temp_upload_dir):
+        """Testa que workers, jobs em execução e na fila vêm do banco de jobs no modo queue"""
+        from backend.main import SQLiteJobStore, create_job, render_metrics
+        
+        worker = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-1", lease_seconds=60)
+        worker.register_worker(2)
+        job_store.enqueue([create_job("a.mp3")], max_queued=10)
+        job_store.enqueue([create_job("b.mp3")], max_queued=10)
+        worker.claim_next()
+        
+        metrics = render_metrics()
+        assert "transcriber_workers 2" in metrics
+        assert "transcriber_jobs_in_flight 1" in metrics
+        assert "transcriber_jobs_queued 1" in metrics
+        assert app_client.get("/health").json()["queue"]["workers"] == 2
+        
+        worker.unregister_worker()
+        assert job_store.queue_stats()["workers"] == 0
+    
+    def test_retry_after_from_queued_audio(self, app_client, job_store, temp_upload_dir, sample_wav_file):
+        """Testa o Retry-After do modo queue: áudio na fila × fator de tempo real ÷ workers"""
+        from backend.main import SQLiteJobStore, create_job, update_job, DEFAULT_RETRY_AFTER_SECONDS
+        
+        worker = SQLiteJobStore(os.path.join(temp_upload_dir, "jobs.db"), "worker-1", lease_seconds=60)
+        worker.register_worker(2, real_time_factor=0.5)
+        for duration in (120.0, 200.0):
+            job_id = create_job("a.mp3")
+            update_job(job_id, duration_seconds=duration)
+            job_store.enqueue([job_id], max_queued=10)
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        with patch('backend.main.TRANSCRIBE_QUEUE_SIZE', 2):
+            response = app_client.post("/transcribe", files={"file": ("audio.wav", content, "audio/wav")})
+        
+        assert response.status_code == 429
+        assert response.headers["Retry-After"] == "80"  # 320s × 0,5 ÷ 2
+        
+        worker.register_worker(2)  # ainda sem medição
+        with patch('backend.main.TRANSCRIBE_QUEUE_SIZE', 2):
+            response = app_client.post("/transcribe", files={"file": ("audio.wav", content, "audio/wav")})
+        assert response.headers["Retry-After"] == str(DEFAULT_RETRY_AFTER_SECONDS)
+    
+    def test_worker_serves_metrics(self):
+        """Testa o endpoint /metrics do worker.py"""
+        import urllib.request
+        with patch.dict(os.environ):
+            from backend.worker import start_metrics_server
+        
+        server = start_metrics_server(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url) as response:
+                body = response.read().decode()
+        finally:
+            server.shutdown()
+            server.server_close()
+        
+        assert "transcriber_real_time_factor" in body
+    
+    def test_profile_request_reaches_worker(self, app_client, job_store, sample_wav_file):
+        """Testa que ?profile=true no modo queue é gravado no job e executado com perfil pelo worker"""
+        from backend.main import get_job, run_claimed_job
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        response = app_client.post("/transcribe?profile=true", files={"file": ("audio.wav", content, "audio/wav")})
+        job_id = response.json()["job_id"]
+        
+        with patch('backend.main.process_audio_background') as process:
+            run_claimed_job(job_store.claim_next())
+        
+        profile_timings = process.call_args[0][7]
+        assert "upload" in profile_timings and "validation" in profile_timings
+        os.remove(get_job(job_id)["task"]["file_path"])
+
+
+class TestResumableUploads:
+    """Testes para o upload retomável em blocos (/uploads)"""
+    
+    @pytest.fixture
+    def sessions(self, temp_upload_dir):
+        from backend.main import UploadSessionStore
+        store = UploadSessionStore(os.path.join(temp_upload_dir, "sessions"), chunk_size=1024)
+        with patch('backend.main.upload_sessions', store):
+            yield store
+    
+    def test_chunks_out_of_order_assembled(self, app_client, sessions, sample_wav_file):
+        """Testa blocos fora de ordem, intervalos recebidos e finalização em um job"""
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        
+        created = app_client.post("/uploads", json={"filename": "longo.wav", "size": len(content), "model": "tiny"})
+        upload_id = created.json()["upload_id"]
+        offsets = list(range(0, len(content), 1024))
+        for offset in reversed(offsets[1:]):
+            assert app_client.put(f"/uploads/{upload_id}?offset={offset}", content=content[offset:offset + 1024]).status_code == 200
+        
+        status = app_client.get(f"/uploads/{upload_id}").json()
+        assert status["received"] == [[1024, len(content)]]
+        assert not status["complete"]
+        assert app_client.post(f"/uploads/{upload_id}/finalize").status_code == 409
+        
+        app_client.put(f"/uploads/{upload_id}?offset=0", content=content[:1024])
+        with patch('backend.main.scheduler.submit', return_value=1) as submit:
+            response = app_client.post(f"/uploads/{upload_id}/finalize")
+        
+        assert created.status_code == 201
+        assert response.status_code == 202
+        file_path = submit.call_args[0][2]
+        with open(file_path, 'rb') as f:
+            assert f.read() == content
+        assert submit.call_args[0][6] == "tiny"
+        assert app_client.get(f"/uploads/{upload_id}").status_code == 404
+        os.remove(file_path)
+    
+    def test_invalid_chunks_rejected(self, app_client, sessions):
+        """Testa que offsets desalinhados e blocos de tamanho errado não são registrados"""
+        upload_id = app_client.post("/uploads", json={"filename": "a.mp3", "size": 2500}).json()["upload_id"]
+        
+        assert app_client.put(f"/uploads/{upload_id}?offset=100", content=b"x" * 1024).status_code == 400
+        assert app_client.put(f"/uploads/{upload_id}?offset=0", content=b"x" * 1000).status_code == 400
+        assert app_client.put(f"/uploads/{upload_id}?offset=2048", content=b"x" * 452).status_code == 200
+        assert app_client.get(f"/uploads/{upload_id}").json()["received"] == [[2048, 2500]]
+    
+    def test_session_validation(self, app_client, sessions):
+        """Testa a validação de formato, tamanho e modelo na criação da sessão"""
+        from backend.main import MAX_UPLOAD_BYTES
+        
+        assert app_client.post("/uploads", json={"filename": "a.txt", "size": 10}).status_code == 400
+        assert app_client.post("/uploads", json={"filename": "a.mp3", "size": 0}).status_code == 400
+        assert app_client.post("/uploads", json={"filename": "a.mp3", "size": MAX_UPLOAD_BYTES + 1}).status_code == 413
+        assert app_client.post("/uploads", json={"filename": "a.mp3", "size": 10, "model": "large-v3"}).status_code == 400
+    
+    def test_job_computes_content_key_and_hits_cache(self, sessions, temp_upload_dir):
+        """Testa que o job calcula o SHA-256 do arquivo (chave de /transcribe) e responde do cache"""
+        import hashlib
+        from backend.main import (
+            TranscriptionCache, CONTENT_KEY_PENDING, create_job, get_job, make_cache_key, process_audio_background
+        )
+        
+        content = os.urandom(3000)
+        session = sessions.create("a.mp3", len(content), {})
+        fd = os.open(sessions.data_path(session), os.O_WRONLY)
+        for index, offset in enumerate(range(0, len(content), 1024)):
+            digest = hashlib.sha256()
+            sessions.write_at(fd, digest, content[offset:offset + 1024], offset)
+            sessions.mark_chunk(session, index, digest.hexdigest())
+        os.close(fd)
+        received = sessions.finalize(session)
+        assert received["sha256"] is None  # sem reler o arquivo na finalização
+        
+        cache = TranscriptionCache(os.path.join(temp_upload_dir, "cache"), max_bytes=10000)
+        cache.put(make_cache_key(hashlib.sha256(content).hexdigest(), "tiny"), {
+            "transcription": "Do cache", "metadata": {}, "segments": []
+        })
+        job_id = create_job("a.mp3", "tiny")
+        with patch('backend.main.transcription_cache', cache), \
+             patch('backend.main.decode_audio_to_array') as decode:
+            process_audio_background(job_id, received["path"], "a.mp3", None, CONTENT_KEY_PENDING, "tiny")
+        
+        decode.assert_not_called()
+        assert get_job(job_id)["status"] == "completed"
+        assert get_job(job_id)["result"]["transcription"] == "Do cache"
+        assert not os.path.exists(received["path"])
+    
+    def test_session_kept_when_queue_full(self, app_client, sessions, sample_wav_file):
+        """Testa que um finalize recusado (429) mantém a sessão e pode ser repetido sem reenviar blocos"""
+        from backend.main import QueueFullError
+        
+        with open(sample_wav_file, 'rb') as f:
+            content = f.read()
+        upload_id = app_client.post("/uploads", json={"filename": "a.wav", "size": len(content)}).json()["upload_id"]
+        for offset in range(0, len(content), 1024):
+            app_client.put(f"/uploads/{upload_id}?offset={offset}", content=content[offset:offset + 1024])
+        
+        with patch('backend.main.scheduler.submit', side_effect=QueueFullError("Fila cheia")):
+            assert app_client.post(f"/uploads/{upload_id}/finalize").status_code == 429
+        assert app_client.get(f"/uploads/{upload_id}").json()["complete"]
+        
+        with patch('backend.main.scheduler.submit', return_value=1) as submit:
+            assert app_client.post(f"/uploads/{upload_id}/finalize").status_code == 202
+        with open(submit.call_args[0][2], 'rb') as f:
+            assert f.read() == content
+        assert app_client.get(f"/uploads/{upload_id}").status_code == 404
+        os.remove(submit.call_args[0][2])
+
+
+class TestWavFastPath:
+    """Testes para a leitura de WAV PCM sem FFmpeg (np.memmap + reamostragem em processo)"""
+    
+    def write_wav(self, path, samples, sample_rate, sample_width=2):
+        import numpy as np
+        frames = np.asarray(samples)
+        with wave.open(path, 'w') as wav_file:
+            wav_file.setnchannels(1 if frames.ndim == 1 else frames.shape[1])
+            wav_file.setsampwidth(sample_width)
+            wav_file.setframerate(sample_rate)
+            wav_file.writeframes(frames.tobytes())
+        return path
+    
+    def test_whisper_format_read_without_subprocess(self, temp_upload_dir):
+        """Testa que WAV 16 kHz mono 16-bit é lido direto, com a mesma escala do FFmpeg"""
+        import numpy as np
+        from backend.main import decode_audio_to_array
+        
+        samples = (np.sin(np.arange(16000) / 10) * 20000).astype(np.int16)
+        path = self.write_wav(os.path.join(temp_upload_dir, "telefonia.wav"), samples, 16000)
+        
+        with patch('backend.main.subprocess.Popen') as popen:
+            audio = decode_audio_to_array(path)
+        
+        popen.assert_not_called()
+        assert audio.dtype == np.float32
+        np.testing.assert_allclose(audio, samples / 32768.0, rtol=1e-6)
+    
+    def test_stereo_48k_downmixed_and_resampled(self, temp_upload_dir):
+        """Testa a mixagem para mono e a reamostragem para 16 kHz de um WAV 48 kHz estéreo"""
+        import numpy as np
+        from backend.main import decode_audio_to_array
+        
+        t = np.arange(48000) / 48000
+        tone = np.sin(2 * np.pi * 440 * t) * 16000
+        stereo = np.stack([tone, tone * 0.5], axis=1).astype(np.int16)
+        path = self.write_wav(os.path.join(temp_upload_dir, "estudio.wav"), stereo, 48000)
+        
+        with patch('backend.main.subprocess.Popen') as popen:
+            audio = decode_audio_to_array(path)
+        
+        popen.assert_not_called()
+        assert audio.dtype == np.float32
+        assert audio.size == 16000
+        expected = np.sin(2 * np.pi * 440 * np.arange(16000) / 16000) * 0.75 * 16000 / 32768
+        np.testing.assert_allclose(audio[200:-200], expected[200:-200], atol=2e-3)
+    
+    def test_unsupported_wav_falls_back_to_ffmpeg(self, temp_upload_dir):
+        """Testa que WAV 24-bit (sem fast path) continua indo para o FFmpeg"""
+        import numpy as np
+        from backend.main import read_pcm_wav, read_wav_header
+        
+        path = self.write_wav(os.path.join(temp_upload_dir, "24bits.wav"), np.zeros(1600 * 3, np.uint8), 16000, 3)
+        
+        assert read_wav_header(path)["bits"] == 24
+        assert read_pcm_wav(path) is None
+    
+    def test_convert_skips_only_whisper_format(self, temp_upload_dir, sample_wav_file):
+        """Testa que convert_audio_to_wav só mantém o arquivo quando já está em 16 kHz mono 16-bit"""
+        import numpy as np
+        from backend.main import convert_audio_to_wav
+        
+        path_48k = self.write_wav(os.path.join(temp_upload_dir, "48k.wav"), np.zeros(48000, np.int16), 48000)
+        
+        with patch('backend.main.subprocess.run') as run:
+            assert convert_audio_to_wav(sample_wav_file) == sample_wav_file
+            run.assert_not_called()
+            run.return_value = MagicMock(returncode=1, stderr="falhou")
+            with pytest.raises(Exception):
+                convert_audio_to_wav(path_48k)
+        
+        assert run.call_args[0][0][-1].endswith("48k_16k.wav")
+
+
+class TestCpuBudget:
+    """Testes para a divisão do orçamento de CPU entre tarefas concorrentes"""
+    
+    def test_rebalance_on_start_and_finish(self):
+        """Testa que as parcelas são refeitas quando tarefas começam e terminam"""
+        import threading
+        from concurrent.futures import ThreadPoolExecutor
+        from backend.main import CpuBudget
+        
+        budget = CpuBudget(range(8))
+        with budget.lease('ffmpeg', 'a') as first:
+            assert first['threads'] == 8
+            with ThreadPoolExecutor(max_workers=1) as pool:
+                started = threading.Event()
+                release = threading.Event()
+                
+                def second_task():
+                    with budget.lease('ffmpeg', 'b') as lease:
+                        started.set()
+                        release.wait(5)
+                        return lease['cpus']
+                
+                future = pool.submit(second_task)
+                started.wait(5)
+                assert [t['threads'] for t in budget.stats()['tasks']] == [4, 4]
+                assert first['cpus'] == [0, 1, 2, 3]
+                release.set()
+                assert future.result() == [4, 5, 6, 7]
+            assert first['threads'] == 8
+        assert budget.stats()['tasks'] == []
+    
+    def test_more_tasks_than_cores_get_one_thread(self):
+        """Testa que cada tarefa recebe ao menos uma thread e que o lease é reentrante"""
+        import threading
+        from backend.main import CpuBudget
+        
+        budget = CpuBudget([0, 1])
+        with budget.lease('whisper') as outer, budget.lease('ffmpeg') as inner:
+            assert inner is outer
+            assert len(budget.stats()['tasks']) == 1
+        
+        leases = [budget.lease('ffmpeg', str(i)) for i in range(3)]
+        allocations = []
+        
+        def hold(context):
+            with context as lease:
+                barrier.wait(5)
+                allocations.append(lease['threads'])
+                barrier.wait(5)
+        
+        barrier = threading.Barrier(3)
+        threads = [threading.Thread(target=hold, args=(context,)) for context in leases]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert allocations == [1, 1, 1]
+    
+    def test_whisper_lease_sets_and_restores_torch_threads(self):
+        """Testa que a parcela da tarefa vira o número de threads do torch e que o valor anterior volta no fim"""
+        import torch
+        from backend.main import CpuBudget
+        
+        budget = CpuBudget(range(4))
+        with patch.object(torch, 'get_num_threads', return_value=7), \
+             patch.object(torch, 'set_num_threads') as set_threads:
+            with budget.lease('whisper'):
+                set_threads.assert_called_once_with(4)
+                budget.refresh()  # sem mudança na parcela: não reaplica
+                set_threads.assert_called_once()
+        
+        assert set_threads.call_args[0][0] == 7
+    
+    def test_manage_threads_opt_out(self):
+        """Testa que com manage_threads=False (benchmarks) as threads do torch não são alteradas"""
+        import torch
+        from backend.main import CpuBudget
+        
+        budget = CpuBudget(range(4), manage_threads=False)
+        with patch.object(torch, 'set_num_threads') as set_threads:
+            with budget.lease('whisper') as lease:
+                assert lease['threads'] == 4
+        
+        set_threads.assert_not_called()
+    
+    def test_process_mode_splits_budget_between_api_and_workers(self):
+        """Testa que no modo process o FFmpeg da API e os processos worker ficam com núcleos separados"""
+        from backend import main
+        
+        with patch.object(main, 'API_CPU_RESERVE', 1):
+            assert main.split_process_budget([0, 1, 2, 3, 4]) == ([0], [1, 2, 3, 4])
+            assert main.split_process_budget([0]) == ([0], [0])  # sem núcleos para separar
+        
+        with patch.object(main, '_process_pool', None), \
+             patch.object(main, '_progress_queue', MagicMock()), \
+             patch.object(main, 'WORKER_CPUS', [1, 2, 3, 4]), \
+             patch.object(main, 'WORKER_PROCESSES', 2), \
+             patch.object(main, 'TORCH_THREADS_PER_WORKER', 0), \
+             patch.object(main, 'ProcessPoolExecutor') as pool:
+            main.get_process_pool()
+            initargs = pool.call_args[1]['initargs']
+            assert initargs[1] == 2
+            assert initargs[4] == [1, 2, 3, 4]
+            assert main._worker_cpu_slice(initargs[4], 1, 2) == [3, 4]
+    
+    def test_ffmpeg_receives_thread_share(self, sample_mp3_path, app_client):
+        """Testa o -threads do FFmpeg e a alocação exposta em /health"""
+        import io
+        from backend import main
+        
+        process = MagicMock()
+        process.stdout = io.BytesIO(b'\x00' * 16)
+        process.stderr = io.BytesIO(b'')
+        process.wait.return_value = 0
+        budget = main.CpuBudget(range(3))
+        with patch.object(main, 'cpu_budget', budget), \
+             patch('subprocess.Popen', return_value=process) as popen:
+            main.decode_audio_to_array(sample_mp3_path)
+            cpu = app_client.get("/health").json()["cpu"]
+        
+        cmd = popen.call_args[0][0]
+        assert cmd[cmd.index('-threads') + 1] == '3'
+        assert cpu == {"cpus": 3, "affinity": False, "tasks": []}
+
+
 class TestSaveTranscription:
     """Testes para salvar arquivo de transcrição"""
     